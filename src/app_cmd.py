@@ -16,6 +16,7 @@ from database import *
 from recipe_agent import *
 from nutritional_agent import *
 from meal_scheduler_agent import *
+from photo_cache import PhotoCache
 
 # schedulers
 from plugins.sched import sched_default
@@ -45,9 +46,10 @@ def cmd_default_plan(app_surface: AppSurface, recipe_agent: RecipeAgent, databas
         recipe_agent.show_progress_status = True
         recipe_agent.join()
 
+    # planning only reads, use the read only memory mapped connections
     meal_plan = sched_default.create_schedule(app_surface=app_surface,
                                               recipe_agent=recipe_agent,
-                                              database=database,
+                                              database=Database(app_surface=app_surface, read_only=True),
                                               start_day=user_start_day,
                                               end_day=user_end_day)
     app_surface.current_mealplan = meal_plan
@@ -110,6 +112,49 @@ def cmd_test_paprika(app_surface: AppSurface, recipe_agent: RecipeAgent, databas
         print("Test connection to Paprika SUCCESSFUL")
         return True
     
+def cmd_search(app_surface: AppSurface, recipe_agent: RecipeAgent, database: Database) -> bool:
+    query = prompt("Search for?")
+    results = database.search(query=query, limit=20)
+    if results is None:
+        return False
+
+    for header in results:
+        print("{} ({})".format(header.name, header.uid))
+    print_info("{} recipes found".format(len(results)))
+    return True
+
+def cmd_sync_photos(app_surface: AppSurface, recipe_agent: RecipeAgent, database: Database) -> bool:
+    # the photos are read from the recipes, wait for the recipes first
+    if app_surface.b_recipe_agent_running == True:
+        print("Wait for Paprika Sync to complete")
+        recipe_agent.show_progress_status = True
+        recipe_agent.join()
+
+    photo_cache = PhotoCache()
+    downloaded = photo_cache.sync(database=database)
+    if downloaded is None:
+        return False
+
+    print_info("{} photos downloaded, {} photos cached".format(downloaded, photo_cache.stats()["photos"]))
+    return True
+
+def cmd_compress_recipes(app_surface: AppSurface, recipe_agent: RecipeAgent, database: Database) -> bool:
+    # one time pass over the recipes stored before APP__CONFIG__DATABASE__COMPRESS_TEXT was on
+    if app_surface.b_recipe_agent_running == True:
+        print("Wait for Paprika Sync to complete")
+        recipe_agent.show_progress_status = True
+        recipe_agent.join()
+
+    if database.compress_recipes() != Database.Error.ERR_SUCCESS:
+        return False
+    if mpp_utils.APP__CONFIG__DATABASE__COMPRESS_TEXT != True:
+        print_info("APP__CONFIG__DATABASE__COMPRESS_TEXT is off, recipes written from now on are not compressed")
+    return True
+
+def cmd_rebuild_search(app_surface: AppSurface, recipe_agent: RecipeAgent, database: Database) -> bool:
+    # also puts back search triggers dropped for manual edits (see datastore/setup.sql)
+    return database.rebuild_search_index() == Database.Error.ERR_SUCCESS
+
 def cmd_quit(app_surface: AppSurface, recipe_agent: RecipeAgent, database: Database) -> bool:
     app_surface.surface_lock.acquire()
     app_surface.b_app_running = False
@@ -123,6 +168,10 @@ COMMAND_LIST = [
     cmd_sync_paprika,
     cmd_wait_for_paprika,
     cmd_test_paprika,
+    cmd_search,
+    cmd_sync_photos,
+    cmd_compress_recipes,
+    cmd_rebuild_search,
     cmd_quit
 ]
 
@@ -139,6 +188,7 @@ Main Functions
 if __name__ == "__main__":
     # set configurations
     mpp_utils.APP__CONFIG__DEBUG_PRINT = False
+    mpp_utils.configure_logging()
 
     # show the title screen
     title = "Meal Prep Pal"
@@ -160,7 +210,7 @@ if __name__ == "__main__":
         app_surface.b_app_running = True # okay not to lock before other objects are set up
 
         user_auth = AuthenticationObject(uname=username, pword=password)
-        databse = Database()
+        databse = Database(app_surface=app_surface)
         recipe_agent = RecipeAgent(cmd=RecipeAgent.Command.CMD_PULL_RECIPES, 
                                     app_surface=app_surface,
                                     auth=user_auth,
@@ -219,5 +269,8 @@ if __name__ == "__main__":
         app_surface.b_app_running = False
         app_surface.surface_lock.release()
 
+        # release the long-lived database connections
+        Database.close_all()
+
         print_info("closing mpp")
         exit()
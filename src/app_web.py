@@ -3,9 +3,19 @@
 ## - Command to run: python3 -m flask --app app_web.py run --debug
 ## 
 
-from flask import Flask, url_for, render_template
+import os
+
+from flask import Flask, url_for, render_template, request, jsonify, send_file, abort
+
+# App packages
+from database import Database
+from photo_cache import PhotoCache
 
 app = Flask(__name__)
+# the web app only reads, plan off the snapshot so a running sync never gets in the way
+database = Database(snapshot=True)
+# photos are served from local disk, filled in by PhotoCache.sync
+photo_cache = PhotoCache()
 
 @app.route("/test")
 def hello_world():
@@ -13,4 +23,27 @@ def hello_world():
 
 @app.route("/")
 def application():
-    return render_template('index.html')
\ No newline at end of file
+    return render_template('index.html')
+
+@app.route("/search")
+def search():
+    query = request.args.get("q", "")
+    limit = request.args.get("limit", 20, type=int)
+    results = database.search(query=query, limit=limit)
+    if results is None:
+        return jsonify({"error": "search unavailable"}), 500
+
+    return jsonify([{"uid": header.uid, "name": header.name} for header in results])
+
+@app.route("/photo/<photo_hash>")
+@app.route("/photo/<photo_hash>/<variant>")
+def photo(photo_hash, variant=None):
+    path = photo_cache.get(photo_hash=photo_hash, variant=variant)
+    if path is None:
+        abort(404)
+
+    # the file behind a photo hash never changes
+    response = send_file(os.path.abspath(path), mimetype="image/jpeg", max_age=PhotoCache.MAX_AGE_SECONDS)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
@@ -0,0 +1,160 @@
+
+import json
+import time
+import tracemalloc
+
+# User packages
+from data.recipe import RecipeObject, LazyRecipeObject, CompressedText
+
+
+"""
+Recipe Object Benchmark
+
+Compares the slotted RecipeObject against the dict-based
+class it replaced: memory per recipe and construction rate,
+from a Paprika API json object and from a database row.
+
+Run from src/: python -m benchmarks.bench_recipe_object
+"""
+
+RECIPE_COUNT = 20000
+
+# a typical recipe from the Paprika API, text sizes are made up
+SAMPLE_JSONOBJ = {
+    "uid": "647A8FCA-615C-4849-A692-94407600AB7A", "rating": 5, "photo_hash": "", "on_favorites": False,
+    "photo": "", "scale": "", "ingredients": "1 cup flour\n2 eggs\n1 cup milk\n" * 4, "is_pinned": False,
+    "source": "www.fakewebsite.com", "total_time": "", "hash": "0" * 64, "description": "",
+    "source_url": "", "difficulty": "Easy", "on_grocery_list": False, "in_trash": False,
+    "directions": "Mix everything together and bake for 30 minutes.\n" * 6, "categories": ["Dinner"],
+    "photo_url": None, "cook_time": "30 minutes", "name": "Fake Recipe", "created": "2018-03-26 09:00:02",
+    "notes": "", "photo_large": None, "image_url": "", "prep_time": "10 minutes", "servings": "4",
+    "nutritional_info": "100 BILLION Calories"
+}
+
+"""
+Legacy Recipe Object
+
+The dict-based RecipeObject as it was before the slots rewrite,
+only the parts that are measured here.
+"""
+class LegacyRecipeObject (object):
+
+    def __init__(self) -> None:
+        self.__recipe_data = {
+            "uid": str(), "rating": int(), "photo_hash": str(), "on_favorites": bool(),
+            "photo": str(), "scale": str(), "ingredients": str(), "is_pinned": bool(),
+            "source": str(), "total_time": str(), "hash": str(), "description": str(),
+            "source_url": str(), "difficulty": str(), "on_grocery_list": bool(),
+            "in_trash": bool(), "directions": str(), "categories": [], "photo_url": None,
+            "cook_time": str(), "name": str(), "created": str(), "notes": str(),
+            "photo_large": None, "image_url": str(), "prep_time": str(), "servings": str(),
+            "nutritional_info": str()
+        }
+        self.metadata_has_nutritional_info = False
+        self.metadata_is_modified = False
+
+    def init_from_jsonobj(self, jsonobj: dict):
+        for key in RecipeObject.FIELDS:
+            self.__recipe_data[key] = jsonobj[key]
+        self.metadata_is_modified = False
+        if len(self.__recipe_data['nutritional_info']) > 0:
+            self.metadata_has_nutritional_info = True
+
+    def load(self, key):
+        if key in self.__recipe_data:
+            result = self.__recipe_data[key]
+            if type(result) is CompressedText:
+                result = result.decompress()
+                self.__recipe_data[key] = result
+            return result
+        raise KeyError
+
+def legacy_from_jsonobj(jsonobj: dict):
+    recipe = LegacyRecipeObject()
+    recipe.init_from_jsonobj(jsonobj=jsonobj)
+    return recipe
+
+def legacy_from_row(row: tuple):
+    # the old Database.__recipe_from_row went through init(), same cost
+    return legacy_from_jsonobj(jsonobj=dict(zip(RecipeObject.FIELDS, row)))
+
+def slots_from_jsonobj(jsonobj: dict):
+    return RecipeObject.from_jsonobj(jsonobj=jsonobj)
+
+def slots_from_row(row: tuple):
+    return RecipeObject.from_fields(values=row)
+
+def lazy_from_row(row: tuple):
+    # a lazy recipe over a database row, only the name is read
+    recipe = LazyRecipeObject.from_fields(values=row)
+    recipe.load("name")
+    return recipe
+
+def database_row() -> tuple:
+    """
+    @retval tuple: SAMPLE_JSONOBJ as a database row, flags as int and categories as json
+    """
+    row = []
+    for key in RecipeObject.FIELDS:
+        value = SAMPLE_JSONOBJ[key]
+        if type(value) is bool:
+            value = int(value)
+        elif key == "categories":
+            value = json.dumps(value)
+        row.append(value)
+    return tuple(row)
+
+def measure_memory(factory, argument) -> float:
+    """
+    @retval float: bytes allocated per recipe, the field values are shared
+    """
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    recipes = [factory(argument) for _ in range(RECIPE_COUNT)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del recipes
+    return (after - before) / RECIPE_COUNT
+
+def measure_rate(factory, argument) -> float:
+    """
+    @retval float: recipes built per second, best of 3
+    """
+    best = None
+    for _ in range(3):
+        start = time.perf_counter()
+        for _ in range(RECIPE_COUNT):
+            factory(argument)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return RECIPE_COUNT / best
+
+def measure_loads(recipe) -> float:
+    """
+    @retval float: field loads per second
+    """
+    start = time.perf_counter()
+    for _ in range(RECIPE_COUNT // 10):
+        for key in RecipeObject.FIELDS:
+            recipe.load(key)
+    return (RECIPE_COUNT // 10) * len(RecipeObject.FIELDS) / (time.perf_counter() - start)
+
+def main() -> None:
+    row = tuple(SAMPLE_JSONOBJ[key] for key in RecipeObject.FIELDS)
+    cases = [
+        ("legacy (json)", legacy_from_jsonobj, SAMPLE_JSONOBJ),
+        ("slots  (json)", slots_from_jsonobj, SAMPLE_JSONOBJ),
+        ("legacy (row) ", legacy_from_row, row),
+        ("slots  (row) ", slots_from_row, row),
+        ("lazy   (row) ", lazy_from_row, database_row()),
+    ]
+    print("{} recipes per run".format(RECIPE_COUNT))
+    print("{:<16}{:>16}{:>18}".format("class", "bytes/recipe", "recipes/second"))
+    for name, factory, argument in cases:
+        print("{:<16}{:>16.0f}{:>18.0f}".format(name, measure_memory(factory, argument),
+                                                measure_rate(factory, argument)))
+    print("{:<16}{:>34.0f}".format("legacy load/s", measure_loads(legacy_from_jsonobj(SAMPLE_JSONOBJ))))
+    print("{:<16}{:>34.0f}".format("slots  load/s", measure_loads(slots_from_jsonobj(SAMPLE_JSONOBJ))))
+
+if __name__ == "__main__":
+    main()
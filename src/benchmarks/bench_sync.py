@@ -0,0 +1,139 @@
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+# User packages
+import mpp_utils
+from benchmarks.fake_paprika import FakePaprikaServer
+from data.surface import AppSurface
+from database import Database
+from recipe_agent import AuthenticationObject, FetchEngine, Paprika3Service, RecipeAgent
+
+
+"""
+Sync Benchmark
+
+Runs RecipeAgent syncs against a local FakePaprikaServer on a scratch
+database, and reports per sync: recipes/second, requests, bytes moved
+and the request latency (p50/p99, as seen by the client, retries included).
+
+    full         pull of every recipe into an empty database
+    incremental  pull after --changed recipes were edited on the server
+    push         push of --changed recipes modified locally
+
+Run from src/: python -m benchmarks.bench_sync --recipes 2000 --latency 0.02
+"""
+
+"""
+Timed Fetch Engine
+
+FetchEngine that records how long each request took
+"""
+class TimedFetchEngine (FetchEngine):
+
+    def __init__(self, auth_info, concurrency=None) -> None:
+        super().__init__(auth_info=auth_info, concurrency=concurrency)
+        self.latency_lock = threading.Lock()
+        self.latencies = []
+
+    def request(self, method: str, request_url, files=None):
+        start = time.perf_counter()
+        try:
+            return super().request(method, request_url, files=files)
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.latency_lock:
+                self.latencies.append(elapsed)
+
+def percentile(values: list, fraction: float) -> float:
+    """
+    @retval float: the value below which the fraction of values fall (nearest rank)
+    """
+    if len(values) == 0:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+def run_sync(server: FakePaprikaServer, command, concurrency, label: str, recipe_count: int) -> dict:
+    """
+    @param recipe_count: recipes the sync is expected to move, for recipes/second
+    @retval dict: the measurements of the sync
+    """
+    app_surface = AppSurface()
+    app_surface.b_app_running = True
+    recipe_agent = RecipeAgent(cmd=command, app_surface=app_surface,
+                               auth=AuthenticationObject(uname="bench", pword="bench"))
+    recipe_agent.fetch_engine = TimedFetchEngine(auth_info=recipe_agent.authentication.auth_info,
+                                                 concurrency=concurrency)
+    server.reset_stats()
+
+    start = time.perf_counter()
+    recipe_agent.start()
+    recipe_agent.join()
+    elapsed = time.perf_counter() - start
+    recipe_agent.fetch_engine.close()
+
+    latencies = recipe_agent.fetch_engine.latencies
+    result = {"sync": label, "status": recipe_agent.status.name, "seconds": elapsed,
+              "recipes_per_second": recipe_count / elapsed if elapsed > 0 else 0.0,
+              "p50_ms": percentile(latencies, 0.50) * 1000, "p99_ms": percentile(latencies, 0.99) * 1000}
+    result.update(server.stats())
+    return result
+
+def mark_modified(count: int) -> None:
+    """
+    Flags count local recipes as modified, so the push has work to do
+    """
+    database = Database()
+    uids = [row[0] for row in database.pull_recipe_list()][:count]
+    def operation(cursor):
+        cursor.executemany("UPDATE RECIPE_TABLE SET b_recipe_modified = 1 WHERE uid = ?", [(uid,) for uid in uids])
+    Database.database_writer().submit_operation(operation=operation, invalidate_uids=uids).result()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="RecipeAgent sync benchmark against a local fake Paprika server")
+    parser.add_argument("--recipes", type=int, default=1000)
+    parser.add_argument("--changed", type=int, default=50, help="recipes changed for the incremental pull & push")
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds added to every response")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests failing with 503")
+    parser.add_argument("--concurrency", type=int, default=mpp_utils.APP__CONFIG__RECIPE_AGENT__FETCH_CONCURRENCY)
+    args = parser.parse_args()
+    mpp_utils.APP__CONFIG__DEBUG_PRINT = False
+    mpp_utils.configure_logging()
+
+    server = FakePaprikaServer(recipe_count=args.recipes, latency_seconds=args.latency, error_rate=args.error_rate)
+    server.start()
+    Paprika3Service.use_base_url(server.base_url)
+
+    # a new database, the migrations create the tables
+    scratch_directory = tempfile.mkdtemp(prefix="mpp_bench_")
+    Database.DATABASE_PATH = os.path.join(scratch_directory, "bench.db")
+
+    results = []
+    try:
+        results.append(run_sync(server=server, command=RecipeAgent.Command.CMD_PULL_RECIPES,
+                                concurrency=args.concurrency, label="full", recipe_count=args.recipes))
+        server.corpus.touch(count=args.changed)
+        results.append(run_sync(server=server, command=RecipeAgent.Command.CMD_PULL_RECIPES,
+                                concurrency=args.concurrency, label="incremental", recipe_count=args.changed))
+        mark_modified(count=args.changed)
+        results.append(run_sync(server=server, command=RecipeAgent.Command.CMD_PUSH_RECIPES,
+                                concurrency=args.concurrency, label="push", recipe_count=args.changed))
+    finally:
+        server.stop()
+        Database.close_all()
+
+    print("{} recipes, {} changed, {:.0f}ms latency, {:.1%} errors, {} workers".format(
+        args.recipes, args.changed, args.latency * 1000, args.error_rate, args.concurrency))
+    print("{:<12}{:>16}{:>10}{:>12}{:>10}{:>14}{:>14}{:>10}{:>10}".format(
+        "sync", "status", "seconds", "recipes/s", "requests", "bytes down", "bytes up", "p50 ms", "p99 ms"))
+    # the server's bytes sent are the bytes the client downloaded
+    for result in results:
+        print("{:<12}{:>16}{:>10.2f}{:>12.1f}{:>10}{:>14}{:>14}{:>10.1f}{:>10.1f}".format(
+            result["sync"], result["status"], result["seconds"], result["recipes_per_second"], result["requests"],
+            result["bytes_sent"], result["bytes_received"], result["p50_ms"], result["p99_ms"]))
+
+if __name__ == "__main__":
+    main()
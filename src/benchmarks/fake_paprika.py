@@ -0,0 +1,297 @@
+import argparse
+import gzip
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# User packages
+from data.recipe import RecipeObject
+
+
+"""
+Fake Paprika Server
+
+Local stand-in for the Paprika v1 sync API (see Paprika3Service), so
+syncs can be measured without credentials or www.paprikaapp.com:
+
+    GET  /api/v1/sync/recipes/            uid & hash of every recipe
+    GET  /api/v1/sync/recipe/<uid>/       one recipe
+    POST /api/v1/sync/recipe/<uid>/       store a recipe (multipart, gzip "data" field)
+    GET  /api/v1/sync/categories/, meals/, groceries/, bookmarks/
+    GET  /api/v1/sync/status/             change counter of each collection
+
+The corpus is generated from a seed. Every response waits latency_seconds,
+and a request fails with 503 at error_rate, to exercise the client retries.
+Any credentials are accepted.
+
+Run from src/: python -m benchmarks.fake_paprika --port 8000 --recipes 1000
+"""
+
+# matches the recipe uid in /sync/recipe/<uid>/
+RECIPE_PATH_EXPRESSION = re.compile(r"^/api/v1/sync/recipe/(?P<uid>[^/]+)/?$")
+# the gzip recipe json in a multipart POST body
+MULTIPART_DATA_EXPRESSION = re.compile(rb"\r\n\r\n(?P<data>.*)\r\n--", re.DOTALL)
+
+CATEGORY_NAMES = ["Breakfast", "Lunch", "Dinner", "Dessert", "Snack", "Vegetarian", "Soup", "Salad"]
+MEAL_TYPES = [0, 1, 2, 3]
+
+def recipe_hash(jsonobj: dict) -> str:
+    """
+    @retval str: SHA256 of the recipe without its hash, as Paprika computes it
+    """
+    scratch_recipe = dict(jsonobj)
+    scratch_recipe.pop("hash", None)
+    return hashlib.sha256(json.dumps(scratch_recipe, sort_keys=True).encode(encoding="utf-8")).hexdigest()
+
+def make_uid(generator: random.Random) -> str:
+    return "{:08X}-{:04X}-{:04X}-{:04X}-{:012X}".format(
+        generator.getrandbits(32), generator.getrandbits(16), generator.getrandbits(16),
+        generator.getrandbits(16), generator.getrandbits(48))
+
+"""
+Fake Paprika Corpus
+
+The collections served by the fake server, kept in memory
+"""
+class FakePaprikaCorpus (object):
+
+    def __init__(self, recipe_count: int, seed=0) -> None:
+        self.generator = random.Random(seed)
+        self.lock = threading.Lock()
+        self.categories = [{"uid": make_uid(self.generator), "name": name, "order_flag": order, "parent_uid": None}
+                           for (order, name) in enumerate(CATEGORY_NAMES)]
+        # uid -> recipe json object
+        self.recipes = {}
+        for idx in range(recipe_count):
+            recipe = self.make_recipe(idx=idx)
+            self.recipes[recipe["uid"]] = recipe
+        uids = list(self.recipes.keys())
+        self.meals = [{"uid": make_uid(self.generator), "recipe_uid": self.generator.choice(uids),
+                       "date": "2023-{:02d}-{:02d} 00:00:00".format(1 + idx // 28 % 12, 1 + idx % 28),
+                       "type": self.generator.choice(MEAL_TYPES), "name": "", "order_flag": 0}
+                      for idx in range(min(recipe_count, 200))] if len(uids) > 0 else []
+        self.groceries = [{"uid": make_uid(self.generator), "recipe_uid": None, "name": "item {}".format(idx),
+                           "order_flag": idx, "purchased": False, "aisle": "", "ingredient": "item {}".format(idx)}
+                          for idx in range(50)]
+        self.bookmarks = [{"uid": make_uid(self.generator), "recipe_uid": self.generator.choice(uids),
+                           "title": "bookmark {}".format(idx), "url": "", "order_flag": idx}
+                          for idx in range(min(recipe_count, 20))] if len(uids) > 0 else []
+        # collection -> change counter, bumped on every change
+        self.status = {"recipes": 1, "categories": 1, "meals": 1, "groceries": 1, "bookmarks": 1}
+
+    def make_recipe(self, idx: int) -> dict:
+        """
+        @retval dict: a recipe as the Paprika API returns it
+        """
+        generator = self.generator
+        recipe = {key: (list(value) if type(value) is list else value) for (key, value) in RecipeObject.DEFAULTS.items()}
+        ingredients = ["{} cups ingredient {}".format(generator.randint(1, 4), generator.randint(1, 500))
+                       for _ in range(generator.randint(4, 16))]
+        recipe.update({
+            "uid": make_uid(generator),
+            "name": "Fake Recipe {}".format(idx),
+            "rating": generator.randint(0, 5),
+            "ingredients": "\n".join(ingredients),
+            "directions": "Mix everything together and cook for a while.\n" * generator.randint(2, 20),
+            "description": "",
+            "source": "www.fakewebsite.com",
+            "created": "2023-01-01 00:00:00",
+            "categories": [category["uid"] for category in generator.sample(self.categories, generator.randint(0, 3))],
+            "servings": str(generator.randint(1, 8)),
+        })
+        recipe["hash"] = recipe_hash(recipe)
+        return recipe
+
+    def touch(self, count: int) -> list:
+        """
+        Changes count recipes, as if edited on another device
+
+        @retval list: uids of the changed recipes
+        """
+        with self.lock:
+            uids = self.generator.sample(list(self.recipes.keys()), min(count, len(self.recipes)))
+            for uid in uids:
+                recipe = self.recipes[uid]
+                recipe["notes"] = "edited {}".format(time.time())
+                recipe["hash"] = recipe_hash(recipe)
+            self.status["recipes"] += 1
+        return uids
+
+    def recipe_list(self) -> list:
+        with self.lock:
+            return [{"uid": uid, "hash": recipe["hash"]} for (uid, recipe) in self.recipes.items()]
+
+    def recipe(self, uid: str):
+        with self.lock:
+            return self.recipes.get(uid)
+
+    def store_recipe(self, jsonobj: dict) -> None:
+        with self.lock:
+            self.recipes[jsonobj["uid"]] = jsonobj
+            self.status["recipes"] += 1
+
+    def sync_status(self) -> dict:
+        with self.lock:
+            return dict(self.status)
+
+"""
+Fake Paprika Server
+
+    server = FakePaprikaServer(recipe_count=1000, latency_seconds=0.02)
+    server.start()
+    Paprika3Service.use_base_url(server.base_url)
+    ...
+    server.stop()
+"""
+class FakePaprikaServer (object):
+
+    def __init__(self, recipe_count=500, latency_seconds=0.0, error_rate=0.0, seed=0, host="127.0.0.1", port=0) -> None:
+        self.corpus = FakePaprikaCorpus(recipe_count=recipe_count, seed=seed)
+        self.latency_seconds = latency_seconds
+        self.error_rate = error_rate
+        self.error_generator = random.Random(seed)
+        self.stats_lock = threading.Lock()
+        self.reset_stats()
+        self.httpd = ThreadingHTTPServer((host, port), FakePaprikaServer.handler(server=self))
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self) -> str:
+        (host, port) = self.httpd.server_address[:2]
+        return "http://{}:{}/api/v1".format(host, port)
+
+    def reset_stats(self) -> None:
+        with self.stats_lock:
+            self.requests = 0
+            self.errors = 0
+            self.bytes_sent = 0
+            self.bytes_received = 0
+
+    def stats(self) -> dict:
+        with self.stats_lock:
+            return {
+                "requests": self.requests,
+                "errors": self.errors,
+                "bytes_sent": self.bytes_sent,
+                "bytes_received": self.bytes_received,
+            }
+
+    def start(self) -> None:
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="fake-paprika", daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self.thread is not None:
+            self.thread.join()
+
+    def should_fail(self) -> bool:
+        with self.stats_lock:
+            return self.error_rate > 0 and self.error_generator.random() < self.error_rate
+
+    def respond(self, path: str, method: str, body: bytes) -> tuple:
+        """
+        @retval tuple: (status, json object to send)
+        """
+        collections = {
+            "/api/v1/sync/recipes": self.corpus.recipe_list,
+            "/api/v1/sync/categories": lambda: self.corpus.categories,
+            "/api/v1/sync/meals": lambda: self.corpus.meals,
+            "/api/v1/sync/groceries": lambda: self.corpus.groceries,
+            "/api/v1/sync/bookmarks": lambda: self.corpus.bookmarks,
+            "/api/v1/sync/status": self.corpus.sync_status,
+        }
+        path = path.split("?")[0]
+        if method == "GET" and path.rstrip("/") in collections:
+            return (200, {"result": collections[path.rstrip("/")]()})
+
+        match = RECIPE_PATH_EXPRESSION.match(path)
+        if match is None:
+            return (404, {"error": {"message": "not found"}})
+        if method == "GET":
+            recipe = self.corpus.recipe(match.group("uid"))
+            if recipe is None:
+                return (404, {"error": {"message": "no recipe"}})
+            return (200, {"result": recipe})
+
+        data = MULTIPART_DATA_EXPRESSION.search(body)
+        try:
+            self.corpus.store_recipe(jsonobj=json.loads(gzip.decompress(data.group("data"))))
+        except Exception:
+            return (400, {"error": {"message": "invalid recipe"}})
+        return (200, {"result": True})
+
+    @staticmethod
+    def handler(server):
+        """
+        @retval class: request handler bound to the server
+        """
+        class FakePaprikaHandler (BaseHTTPRequestHandler):
+            # keep-alive, same as the real API
+            protocol_version = "HTTP/1.1"
+            # the headers & body are separate writes, without TCP_NODELAY every
+            # response would wait on Nagle & the client's delayed ACK (~40ms)
+            disable_nagle_algorithm = True
+
+            def handle_request(self, method: str) -> None:
+                length = int(self.headers.get("Content-Length", 0))
+                body = self.rfile.read(length) if length > 0 else b""
+                if server.latency_seconds > 0:
+                    time.sleep(server.latency_seconds)
+
+                if server.should_fail():
+                    (status, jsonobj) = (503, {"error": {"message": "injected failure"}})
+                else:
+                    (status, jsonobj) = server.respond(path=self.path, method=method, body=body)
+                content = json.dumps(jsonobj).encode(encoding="utf-8")
+
+                with server.stats_lock:
+                    server.requests += 1
+                    server.errors += 1 if status >= 500 else 0
+                    server.bytes_sent += len(content)
+                    server.bytes_received += length
+
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def do_GET(self) -> None:
+                self.handle_request(method="GET")
+
+            def do_POST(self) -> None:
+                self.handle_request(method="POST")
+
+            def log_message(self, format, *args) -> None:
+                pass
+
+        return FakePaprikaHandler
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Local stand-in for the Paprika sync API")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--recipes", type=int, default=1000)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests failing with 503")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    server = FakePaprikaServer(recipe_count=args.recipes, latency_seconds=args.latency,
+                               error_rate=args.error_rate, seed=args.seed, port=args.port)
+    print("serving {} recipes at {}".format(args.recipes, server.base_url))
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+
+import re
+
+
+"""
+Ingredient
+
+One line of a recipe's ingredients, split into its parts:
+
+    2 tbsp [recipe:Persillade], divided
+    -> quantity=2.0, unit="tbsp", item="Persillade", recipe_ref="Persillade", note="divided"
+
+    1 1/2 cups/360 milliliters heavy cream (cold)
+    -> quantity=1.5, unit="cup", item="heavy cream", note="cold"
+
+Lines are parsed once when a recipe is written, and kept in the
+RECIPE_INGREDIENT table (see Database.read_recipe_ingredients).
+"""
+class Ingredient (object):
+
+    # the fields of an ingredient, also the RECIPE_INGREDIENT columns after uid
+    FIELDS = (
+        "position", "section", "text", "quantity", "quantity_max",
+        "unit", "item", "recipe_ref", "note"
+    )
+
+    __slots__ = FIELDS
+
+    # unicode vulgar fractions
+    FRACTIONS = {
+        "½": 1 / 2, "⅓": 1 / 3, "⅔": 2 / 3, "¼": 1 / 4, "¾": 3 / 4, "⅕": 1 / 5, "⅖": 2 / 5,
+        "⅗": 3 / 5, "⅘": 4 / 5, "⅙": 1 / 6, "⅚": 5 / 6, "⅛": 1 / 8, "⅜": 3 / 8, "⅝": 5 / 8,
+        "⅞": 7 / 8
+    }
+
+    # spelling -> unit, units are kept in their short form
+    UNITS = {
+        "teaspoon": "tsp", "teaspoons": "tsp", "tsp": "tsp", "tsps": "tsp",
+        "tablespoon": "tbsp", "tablespoons": "tbsp", "tbsp": "tbsp", "tbsps": "tbsp", "tbs": "tbsp",
+        "cup": "cup", "cups": "cup",
+        "ounce": "oz", "ounces": "oz", "oz": "oz",
+        "fluid ounce": "fl oz", "fluid ounces": "fl oz", "fl oz": "fl oz",
+        "pound": "lb", "pounds": "lb", "lb": "lb", "lbs": "lb",
+        "gram": "g", "grams": "g", "g": "g", "gr": "g",
+        "kilogram": "kg", "kilograms": "kg", "kg": "kg",
+        "milliliter": "ml", "milliliters": "ml", "millilitre": "ml", "millilitres": "ml", "ml": "ml",
+        "liter": "l", "liters": "l", "litre": "l", "litres": "l", "l": "l",
+        "pint": "pint", "pints": "pint", "pt": "pint",
+        "quart": "quart", "quarts": "quart", "qt": "quart",
+        "gallon": "gallon", "gallons": "gallon",
+        "pinch": "pinch", "pinches": "pinch", "dash": "dash", "dashes": "dash",
+        "clove": "clove", "cloves": "clove",
+        "can": "can", "cans": "can", "package": "package", "packages": "package",
+        "stick": "stick", "sticks": "stick", "slice": "slice", "slices": "slice",
+        "bunch": "bunch", "bunches": "bunch", "sprig": "sprig", "sprigs": "sprig",
+    }
+
+    # a number: 1 1/2, 1/2, 1½, 1.5, ½
+    NUMBER = r"(?:\d+\s+\d+/\d+|\d+/\d+|\d+(?:\.\d+)?\s*[{0}]?|[{0}])".format("".join(FRACTIONS.keys()))
+    QUANTITY_EXPRESSION = re.compile(
+        r"^(?P<quantity>{0})(?:\s*(?:-|–|to)\s*(?P<quantity_max>{0}))?\s*".format(NUMBER))
+    UNIT_EXPRESSION = re.compile(r"^(?P<unit>fl(?:uid)?\.?\s+ounces?|fl\.?\s*oz|[a-zA-Z]+)\.?(?=\s|/|,|\(|$)\s*")
+    # a second measure in other units, e.g. the "/170 grams" of "6 ounces/170 grams"
+    ALT_MEASURE_EXPRESSION = re.compile(r"^/\s*(?:{0})\s*[a-zA-Z]+\.?\s*".format(NUMBER))
+    # Ingredient is recipe: (can have spaces)
+    # 2 tbsp [recipe:Persillade and something]
+    RECIPE_EXPRESSION = re.compile(r"\[recipe:\s*(?P<name>[^\]]*)\]")
+    NOTE_EXPRESSION = re.compile(r"\(([^)]*)\)")
+
+    def __init__(self, position: int, section, text: str, quantity=None, quantity_max=None,
+        unit=None, item: str = "", recipe_ref=None, note=None
+    ) -> None:
+        self.position = position
+        self.section = section
+        self.text = text
+        self.quantity = quantity
+        self.quantity_max = quantity_max
+        self.unit = unit
+        self.item = item
+        self.recipe_ref = recipe_ref
+        self.note = note
+
+    @staticmethod
+    def parse_number(text: str) -> float:
+        """
+        @retval float: value of a number matched by Ingredient.NUMBER
+        """
+        text = text.strip()
+        result = 0.0
+        if text[-1] in Ingredient.FRACTIONS:
+            result += Ingredient.FRACTIONS[text[-1]]
+            text = text[:-1].strip()
+        for part in text.split():
+            if "/" in part:
+                (numerator, denominator) = part.split("/")
+                if int(denominator) != 0:
+                    result += int(numerator) / int(denominator)
+            else:
+                result += float(part)
+        return result
+
+    @staticmethod
+    def section_header(line: str):
+        """
+        @retval str: the section name if the line is a header, e.g. "FOR THE CRUST:"
+        @retval None: the line is not a header
+        """
+        if line.endswith(":") and Ingredient.QUANTITY_EXPRESSION.match(line) is None:
+            return line[:-1].strip()
+        return None
+
+    @staticmethod
+    def parse(line: str, position: int = 0, section=None):
+        """
+        @param position: line number of the ingredient in the recipe
+        @param section: name of the section the line is in, if any
+        @retval Ingredient: the parsed line
+        @retval None: the line is empty
+        """
+        text = line.strip()
+        if len(text) == 0:
+            return None
+        ingredient = Ingredient(position=position, section=section, text=text)
+        rest = text
+
+        match = Ingredient.QUANTITY_EXPRESSION.match(rest)
+        if match is not None:
+            ingredient.quantity = Ingredient.parse_number(match.group("quantity"))
+            if match.group("quantity_max") is not None:
+                ingredient.quantity_max = Ingredient.parse_number(match.group("quantity_max"))
+            rest = rest[match.end():]
+
+            match = Ingredient.UNIT_EXPRESSION.match(rest)
+            if match is not None:
+                unit = " ".join(match.group("unit").lower().replace(".", " ").split())
+                if unit in Ingredient.UNITS:
+                    ingredient.unit = Ingredient.UNITS[unit]
+                    rest = rest[match.end():]
+                    match = Ingredient.ALT_MEASURE_EXPRESSION.match(rest)
+                    if match is not None:
+                        rest = rest[match.end():]
+
+        match = Ingredient.RECIPE_EXPRESSION.search(rest)
+        if match is not None:
+            ingredient.recipe_ref = match.group("name").strip()
+            rest = rest[:match.start()] + ingredient.recipe_ref + rest[match.end():]
+
+        notes = [note.strip() for note in Ingredient.NOTE_EXPRESSION.findall(rest) if len(note.strip()) > 0]
+        rest = Ingredient.NOTE_EXPRESSION.sub(" ", rest)
+        if "," in rest:
+            (rest, note) = rest.split(",", 1)
+            if len(note.strip()) > 0:
+                notes.append(note.strip())
+        if len(notes) > 0:
+            ingredient.note = ", ".join(notes)
+
+        ingredient.item = " ".join(rest.split())
+        return ingredient
+
+    @staticmethod
+    def parse_all(ingredients: str) -> list:
+        """
+        @param ingredients: the newline separated ingredients of a recipe
+        @retval list: Ingredient per ingredient line, section headers & empty lines are left out
+        """
+        result = []
+        section = None
+        for (position, line) in enumerate(ingredients.split("\n")):
+            line = line.strip()
+            header = Ingredient.section_header(line)
+            if header is not None:
+                section = header
+                continue
+            ingredient = Ingredient.parse(line=line, position=position, section=section)
+            if ingredient is not None:
+                result.append(ingredient)
+        return result
+
+    def as_row(self, uid: str) -> tuple:
+        """
+        @retval tuple: (uid, *Ingredient.FIELDS), a RECIPE_INGREDIENT row
+        """
+        return (uid, self.position, self.section, self.text, self.quantity, self.quantity_max,
+                self.unit, self.item, self.recipe_ref, self.note)
+
+    @staticmethod
+    def from_row(row):
+        """
+        @param row: values in Ingredient.FIELDS order
+        """
+        return Ingredient(*row)
+
+    def __str__(self) -> str:
+        result = "Ingredient <{} {} {}>".format(self.quantity, self.unit, self.item)
+        return result
@@ -0,0 +1,43 @@
+
+"""
+Meal
+
+A meal planned in Paprika, one recipe on a day. Synced into
+MEAL_TABLE by RecipeAgent (see Database.read_meals).
+"""
+class Meal (object):
+
+    # the fields of a meal, also the MEAL_TABLE columns
+    FIELDS = ("uid", "recipe_uid", "date", "type", "name", "order_flag")
+
+    __slots__ = FIELDS
+
+    # paprika meal type -> MealPlan.DayPlan meal
+    TYPES = {0: "breakfast", 1: "lunch", 2: "dinner", 3: "snack"}
+
+    def __init__(self, uid: str, recipe_uid, date: str, type: int, name: str, order_flag: int) -> None:
+        self.uid = uid
+        self.recipe_uid = recipe_uid
+        self.date = date
+        self.type = type
+        self.name = name
+        self.order_flag = order_flag
+
+    @property
+    def meal(self):
+        """
+        @retval str: the meal of the day, e.g. "dinner"
+        @retval None: a meal type paprika added after this list
+        """
+        return Meal.TYPES.get(self.type)
+
+    @staticmethod
+    def from_row(row):
+        """
+        @param row: values in Meal.FIELDS order
+        """
+        return Meal(*row)
+
+    def __str__(self) -> str:
+        result = "Meal <{} {} {}>".format(self.date, self.meal, self.recipe_uid)
+        return result
@@ -2,10 +2,15 @@
 import json
 import gzip
 import hashlib
+import zlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 
 # User packages
 import mpp_utils
 
+log = mpp_utils.get_logger(__name__)
+
 
 """
 Example Recipe
@@ -19,46 +24,112 @@ Example Recipe
 'nutritional_info': '100 BILLION Calories'}
 """
 
+"""
+Compressed Text
+
+Value of a large text field as stored in the database, zlib compressed.
+Recipes keep it as is until the field is loaded, so fields that are
+never looked at are never decompressed.
+"""
+class CompressedText (object):
+
+    __slots__ = ("data",)
+
+    def __init__(self, data: bytes) -> None:
+        self.data = data
+
+    @staticmethod
+    def compress(text: str):
+        """
+        @retval CompressedText: the compressed text
+        """
+        return CompressedText(zlib.compress(text.encode(encoding="utf-8")))
+
+    def decompress(self) -> str:
+        return zlib.decompress(self.data).decode(encoding="utf-8")
+
 """
 Recipe Object
 
-Container for storing all information about the recipe
+Container for storing all information about the recipe.
+The fields are slots instead of a dict, which keeps a recipe
+small and cheap to build when thousands are held in memory.
 """
 class RecipeObject (object):
 
+    # the recipe fields, in the order of Database.RECIPE_COLUMNS
+    FIELDS = (
+        "uid", "rating", "photo_hash", "on_favorites", "photo", "scale",
+        "ingredients", "is_pinned", "source", "total_time", "hash", "description",
+        "source_url", "difficulty", "on_grocery_list", "in_trash", "directions",
+        "categories", "photo_url", "cook_time", "name", "created", "notes",
+        "photo_large", "image_url", "prep_time", "servings", "nutritional_info"
+    )
+    FIELD_SET = frozenset(FIELDS)
+    # the canonical json is the fields in sorted order, see canonical_json()
+    SORTED_FIELDS = tuple(sorted(FIELDS))
+
+    # hash_many & package_many only start a process pool for at least this many recipes
+    HASH_POOL_MIN_RECIPES = 256
+    # gzip level of pushed recipes, 9 costs several times the CPU for a few percent smaller bodies
+    PUSH_GZIP_LEVEL = 6
+
+    # value of each field in an empty recipe
+    # Note: categories is a list of strings, a new list is made per recipe
+    DEFAULTS = {
+        "uid": str(), "rating": int(), "photo_hash": str(), "on_favorites": bool(),
+        "photo": str(), "scale": str(), "ingredients": str(), "is_pinned": bool(),
+        "source": str(), "total_time": str(), "hash": str(), "description": str(),
+        "source_url": str(), "difficulty": str(), "on_grocery_list": bool(),
+        "in_trash": bool(), "directions": str(), "categories": None, "photo_url": None,
+        "cook_time": str(), "name": str(), "created": str(), "notes": str(),
+        "photo_large": None, "image_url": str(), "prep_time": str(), "servings": str(),
+        "nutritional_info": str()
+    }
+
+    # hash_fragments: field -> cached '"key": value' json, the hash field excluded
+    # hash_dirty: fields stored since their fragment was made, None if there are none
+    # hash_digest: sha256 of the canonical json, None until calculated or after a store
+    __slots__ = FIELDS + ("metadata_has_nutritional_info", "metadata_is_modified",
+                          "hash_fragments", "hash_dirty", "hash_digest")
+
     def __init__(self) -> None:
-        self.__recipe_data = {
-            "uid": str(),
-            "rating": int(),
-            "photo_hash": str(),
-            "on_favorites": bool(),
-            "photo": str(),
-            "scale": str(),
-            "ingredients": str(),
-            "is_pinned": bool(),
-            "source": str(),
-            "total_time": str(),
-            "hash": str(),
-            "description": str(),
-            "source_url": str(),
-            "difficulty": str(),
-            "on_grocery_list": bool(),
-            "in_trash": bool(),
-            "directions": str(),
-            "categories": [], # Note: List of strings
-            "photo_url": None,
-            "cook_time": str(),
-            "name": str(),
-            "created": str(),
-            "notes": str(),
-            "photo_large": None,
-            "image_url": str(),
-            "prep_time": str(),
-            "servings": str(),
-            "nutritional_info": str()
-        }
+        for key in RecipeObject.FIELDS:
+            setattr(self, key, RecipeObject.DEFAULTS[key])
+        self.categories = []
         self.metadata_has_nutritional_info = False
         self.metadata_is_modified = False
+        self.__reset_hash()
+
+    @classmethod
+    def from_fields(cls, values, has_nutritional_info=None, is_modified=False):
+        """
+        Build a recipe straight from a sequence of values, e.g. a database row,
+        without filling in the defaults first.
+
+        @param values: the field values in RecipeObject.FIELDS order
+        @param has_nutritional_info: None to derive it from nutritional_info
+        @retval RecipeObject: the new recipe
+        """
+        paprika_recipe = object.__new__(cls)
+        paprika_recipe.__assign(*values)
+        # METADATA
+        paprika_recipe.metadata_is_modified = is_modified
+        if has_nutritional_info is None:
+            # assuming that if nutritional info is a nonzero that
+            # there is nutritional info and it is valid
+            has_nutritional_info = len(paprika_recipe.nutritional_info) > 0
+        paprika_recipe.metadata_has_nutritional_info = has_nutritional_info
+        return paprika_recipe
+
+    @staticmethod
+    def from_jsonobj(jsonobj: dict):
+        """
+        Throws a KeyError exception if a field is missing from the object.
+
+        @retval RecipeObject: the recipe described by a Paprika API json object
+        """
+        return RecipeObject.from_fields(values=[jsonobj[key] for key in RecipeObject.FIELDS])
 
     def init(self,
         uid: str, rating: int, photo_hash: str, on_favorites: bool, photo: str, scale: str,
@@ -67,122 +138,200 @@ class RecipeObject (object):
         categories, photo_url, cook_time: str, name: str, created: str, notes: str, photo_large,
         image_url: str, prep_time: str, servings: str, nutritional_info: str
     ):
-        self.__recipe_data['uid'] = uid
-        self.__recipe_data['rating'] = rating
-        self.__recipe_data['photo_hash'] = photo_hash
-        self.__recipe_data['on_favorites'] = on_favorites
-        self.__recipe_data['photo'] = photo
-        self.__recipe_data['scale'] = scale
-        self.__recipe_data['ingredients'] = ingredients
-        self.__recipe_data['is_pinned'] = is_pinned
-        self.__recipe_data['source'] = source
-        self.__recipe_data['total_time'] = total_time
-        self.__recipe_data['hash'] = hash
-        self.__recipe_data['description'] = description
-        self.__recipe_data['source_url'] = source_url
-        self.__recipe_data['difficulty'] = difficulty
-        self.__recipe_data['on_grocery_list'] = on_grocery_list
-        self.__recipe_data['in_trash'] = in_trash
-        self.__recipe_data['directions'] = directions
-        self.__recipe_data['categories'] = categories
-        self.__recipe_data['photo_url'] = photo_url
-        self.__recipe_data['cook_time'] = cook_time
-        self.__recipe_data['name'] = name
-        self.__recipe_data['created'] = created
-        self.__recipe_data['notes'] = notes
-        self.__recipe_data['photo_large'] = photo_large
-        self.__recipe_data['image_url'] = image_url
-        self.__recipe_data['prep_time'] = prep_time
-        self.__recipe_data['servings'] = servings
-        self.__recipe_data['nutritional_info'] = nutritional_info
+        self.__assign(uid, rating, photo_hash, on_favorites, photo, scale, ingredients, is_pinned,
+                      source, total_time, hash, description, source_url, difficulty, on_grocery_list,
+                      in_trash, directions, categories, photo_url, cook_time, name, created, notes,
+                      photo_large, image_url, prep_time, servings, nutritional_info)
         # METADATA
         self.metadata_is_modified = False
         # assuming that if nutritional info is a nonzero that 
         # there is nutritional info and it is valid
-        if len(self.__recipe_data['nutritional_info']) > 0:
+        if len(self.nutritional_info) > 0:
             self.metadata_has_nutritional_info = True
 
+    def __assign(self,
+        uid, rating, photo_hash, on_favorites, photo, scale, ingredients, is_pinned, source,
+        total_time, hash, description, source_url, difficulty, on_grocery_list, in_trash,
+        directions, categories, photo_url, cook_time, name, created, notes, photo_large,
+        image_url, prep_time, servings, nutritional_info
+    ) -> None:
+        """
+        Set every field, positional in RecipeObject.FIELDS order
+        """
+        self.__reset_hash()
+        self.uid = uid
+        self.rating = rating
+        self.photo_hash = photo_hash
+        self.on_favorites = on_favorites
+        self.photo = photo
+        self.scale = scale
+        self.ingredients = ingredients
+        self.is_pinned = is_pinned
+        self.source = source
+        self.total_time = total_time
+        self.hash = hash
+        self.description = description
+        self.source_url = source_url
+        self.difficulty = difficulty
+        self.on_grocery_list = on_grocery_list
+        self.in_trash = in_trash
+        self.directions = directions
+        self.categories = categories
+        self.photo_url = photo_url
+        self.cook_time = cook_time
+        self.name = name
+        self.created = created
+        self.notes = notes
+        self.photo_large = photo_large
+        self.image_url = image_url
+        self.prep_time = prep_time
+        self.servings = servings
+        self.nutritional_info = nutritional_info
+
     def init_from_jsonobj(self, jsonobj: dict):
-        self.__recipe_data['uid'] = jsonobj['uid']
-        self.__recipe_data['rating'] = jsonobj['rating']
-        self.__recipe_data['photo_hash'] = jsonobj['photo_hash']
-        self.__recipe_data['on_favorites'] = jsonobj['on_favorites']
-        self.__recipe_data['photo'] = jsonobj['photo']
-        self.__recipe_data['scale'] = jsonobj['scale']
-        self.__recipe_data['ingredients'] = jsonobj['ingredients']
-        self.__recipe_data['is_pinned'] = jsonobj['is_pinned']
-        self.__recipe_data['source'] = jsonobj['source']
-        self.__recipe_data['total_time'] = jsonobj['total_time']
-        self.__recipe_data['hash'] = jsonobj['hash']
-        self.__recipe_data['description'] = jsonobj['description']
-        self.__recipe_data['source_url'] = jsonobj['source_url']
-        self.__recipe_data['difficulty'] = jsonobj['difficulty']
-        self.__recipe_data['on_grocery_list'] = jsonobj['on_grocery_list']
-        self.__recipe_data['in_trash'] = jsonobj['in_trash']
-        self.__recipe_data['directions'] = jsonobj['directions']
-        self.__recipe_data['categories'] = jsonobj['categories']
-        self.__recipe_data['photo_url'] = jsonobj['photo_url']
-        self.__recipe_data['cook_time'] = jsonobj['cook_time']
-        self.__recipe_data['name'] = jsonobj['name']
-        self.__recipe_data['created'] = jsonobj['created']
-        self.__recipe_data['notes'] = jsonobj['notes']
-        self.__recipe_data['photo_large'] = jsonobj['photo_large']
-        self.__recipe_data['image_url'] = jsonobj['image_url']
-        self.__recipe_data['prep_time'] = jsonobj['prep_time']
-        self.__recipe_data['servings'] = jsonobj['servings']
-        self.__recipe_data['nutritional_info'] = jsonobj['nutritional_info']
+        self.__assign(*[jsonobj[key] for key in RecipeObject.FIELDS])
         # METADATA
         self.metadata_is_modified = False
         # assuming that if nutritional info is a nonzero that 
         # there is nutritional info and it is valid
-        if len(self.__recipe_data['nutritional_info']) > 0:
+        if len(self.nutritional_info) > 0:
             self.metadata_has_nutritional_info = True
 
     def load(self, key):
         """
-        Throws a KeyError exception if the key does not exist
-        in the dictionary.
+        Throws a KeyError exception if the key is not a recipe field.
 
         @retval value: if key exists
         """
-        result = None
-        if key in self.__recipe_data:
-            result = self.__recipe_data[key]
-        else:
-            raise KeyError
-        
+        if key not in RecipeObject.FIELD_SET:
+            raise KeyError(key)
+        result = getattr(self, key)
+        # decompress on first access
+        if type(result) is CompressedText:
+            result = result.decompress()
+            setattr(self, key, result)
         return result
     
     def store(self, key, value):
         """
-        A more constrained setting of dictionary values. They are 
-        constrained to within the keys already established in the object.
+        A more constrained setting of the recipe fields. They are 
+        constrained to within the fields already established in the object.
         You cannot create any new keys! 
 
         Make sure the type of the value matches the current type stored.
         """
-        if key in self.__recipe_data:
-            if type(value) == type(self.__recipe_data[key]):
-                # update metadata
-                self.metadata_is_modified = True
-                # if modifying nutritional information
-                # mark if info exists or not based on string length
-                if key == "nutritional_info":
-                    if len(value) > 0:
-                        self.metadata_has_nutritional_info = True
-                    else:
-                        self.metadata_has_nutritional_info = False
-
-                # perform the actual operation
-                self.__recipe_data[key] = value
-            else:
-                mpp_utils.dbgPrint("unable to store value, types dont match!")
+        if key not in RecipeObject.FIELD_SET:
+            raise KeyError(key)
+
+        current_type = type(getattr(self, key))
+        # compressed fields hold text
+        if current_type is CompressedText:
+            current_type = str
+        if type(value) is current_type:
+            # update metadata
+            self.metadata_is_modified = True
+            # if modifying nutritional information
+            # mark if info exists or not based on string length
+            if key == "nutritional_info":
+                if len(value) > 0:
+                    self.metadata_has_nutritional_info = True
+                else:
+                    self.metadata_has_nutritional_info = False
+
+            # perform the actual operation
+            setattr(self, key, value)
+            self.__mark_dirty(key=key)
         else:
-            raise KeyError
+            log.warning("unable to store value, types dont match!")
 
-    def as_dict(self) -> dict:
-        return self.__recipe_data
+    def values(self, decompress=True) -> tuple:
+        """
+        @param decompress: False to leave the compressed fields as CompressedText,
+                           e.g. when writing them back to the database
+        @retval tuple: the field values in RecipeObject.FIELDS order
+        """
+        if decompress is True:
+            self.__decompress_all()
+        return tuple(getattr(self, key) for key in RecipeObject.FIELDS)
+
+    def as_dict(self, decompress=True) -> dict:
+        """
+        @param decompress: False to leave the compressed fields as CompressedText,
+                           e.g. when writing them back to the database
+        @retval dict: a new dict of the fields, changing it does not change the recipe
+        """
+        return dict(zip(RecipeObject.FIELDS, self.values(decompress=decompress)))
+
+    def __decompress_all(self) -> None:
+        for key in RecipeObject.FIELDS:
+            value = getattr(self, key)
+            if type(value) is CompressedText:
+                setattr(self, key, value.decompress())
+
+    def copy(self):
+        """
+        @retval RecipeObject: an independent copy of the recipe, metadata included
+        """
+        # fields are copied as held, a lazy recipe copies to a lazy recipe
+        result = type(self).from_fields(values=[getattr(self, key) for key in RecipeObject.FIELDS],
+                                        has_nutritional_info=self.metadata_has_nutritional_info,
+                                        is_modified=self.metadata_is_modified)
+        if type(self.categories) is list:
+            result.categories = list(self.categories)
+        # the cached json and hash are still valid for the copy
+        if self.hash_fragments is not None:
+            result.hash_fragments = dict(self.hash_fragments)
+        if self.hash_dirty is not None:
+            result.hash_dirty = set(self.hash_dirty)
+        result.hash_digest = self.hash_digest
+        return result
     
+    def __reset_hash(self) -> None:
+        self.hash_fragments = None
+        self.hash_dirty = None
+        self.hash_digest = None
+
+    def __mark_dirty(self, key) -> None:
+        """
+        Forget the hash, and the json of the field if it is cached
+        """
+        self.hash_digest = None
+        if self.hash_fragments is not None:
+            if self.hash_dirty is None:
+                self.hash_dirty = set()
+            self.hash_dirty.add(key)
+
+    def canonical_json(self, include_hash=False) -> str:
+        """
+        Same text as json.dumps(self.as_dict(), sort_keys=True), made from
+        json fragments cached per field. Only the fields stored since the
+        last call are serialised again.
+
+        Note: change fields through store(), a field changed in place
+        (e.g. appending to categories) is not seen as changed.
+
+        @param include_hash: False to leave out the hash field, as when hashing
+        @retval str: the json of the recipe
+        """
+        fragments = self.hash_fragments
+        if fragments is None:
+            fragments = {}
+            dirty = RecipeObject.FIELDS
+        else:
+            dirty = self.hash_dirty or ()
+        for key in dirty:
+            if key != "hash":
+                fragments[key] = "{}: {}".format(json.dumps(key), json.dumps(self.load(key)))
+        self.hash_fragments = fragments
+        self.hash_dirty = None
+
+        if include_hash is True:
+            parts = [fragments[key] if key != "hash" else "{}: {}".format(json.dumps(key), json.dumps(self.hash))
+                     for key in RecipeObject.SORTED_FIELDS]
+        else:
+            parts = [fragments[key] for key in RecipeObject.SORTED_FIELDS if key != "hash"]
+        return "{" + ", ".join(parts) + "}"
+
     def as_json(self) -> str:
         """
         @retval None: if the conversion to JSON does not work
@@ -190,28 +339,256 @@ class RecipeObject (object):
         """
         result = None
         try:
-            result = json.dumps(self.__recipe_data, sort_keys=True)
+            result = self.canonical_json(include_hash=True)
         except Exception as e:
-            mpp_utils.dbgPrint("[{}] error while converting recipe to json".format(self.__recipe_data["uid"]))
-            mpp_utils.dbgPrint(e)
+            log.warning("[%s] error while converting recipe to json: %s", self.uid, e)
 
         return result
     
     def calculate_hash_sha256(self) -> None:
         """
-        Calculate the SHA256 Hash of the Paprika Recipe
+        Calculate the SHA256 Hash of the Paprika Recipe.
+        Reuses the last hash if no field was stored since.
         """
         # ref. https://github.com/coddingtonbear/paprika-recipes/blob/master/paprika_recipes/recipe.py
-        # create a copy of the recipe
-        scratch_recipe = dict(self.__recipe_data)
-        # remove hash field while calculating new hash value
+        # hash field is left out while calculating new hash value
+        if self.hash_digest is None:
+            scratch_recipe_json = self.canonical_json(include_hash=False).encode(encoding="utf-8")
+            self.hash_digest = hashlib.sha256(scratch_recipe_json).hexdigest()
+        # update the recipe
+        self.hash = self.hash_digest
+
+    @staticmethod
+    def hash_values(values) -> str:
+        """
+        Hash of a recipe from its field values, run in the hash_many workers
+
+        @param values: the field values in RecipeObject.FIELDS order
+        @retval str: the SHA256 hash, same as calculate_hash_sha256
+        """
+        scratch_recipe = {}
+        for key, value in zip(RecipeObject.FIELDS, values):
+            if type(value) is CompressedText:
+                value = value.decompress()
+            scratch_recipe[key] = value
         scratch_recipe.pop('hash', None)
-        # get JSON and do utf-8 encoding
         scratch_recipe_json = json.dumps(scratch_recipe, sort_keys=True).encode(encoding="utf-8")
-        calculated_hash = hashlib.sha256(scratch_recipe_json).hexdigest()
-        # update the recipe
-        self.__recipe_data["hash"] = calculated_hash
+        return hashlib.sha256(scratch_recipe_json).hexdigest()
+
+    @staticmethod
+    def package_values(values) -> tuple:
+        """
+        Push body of a recipe from its field values, run in the package_many workers
+
+        @param values: the field values in RecipeObject.FIELDS order
+        @retval tuple: (SHA256 hash, gzip compressed json of the recipe with that hash)
+        """
+        digest = RecipeObject.hash_values(values)
+        scratch_recipe = {}
+        for key, value in zip(RecipeObject.FIELDS, values):
+            if type(value) is CompressedText:
+                value = value.decompress()
+            scratch_recipe[key] = value
+        scratch_recipe['hash'] = digest
+        recipe_json = json.dumps(scratch_recipe, sort_keys=True).encode(encoding="utf-8")
+        return (digest, gzip.compress(recipe_json, compresslevel=RecipeObject.PUSH_GZIP_LEVEL))
+
+    @staticmethod
+    def __pool_map(function, paprika_recipes, max_workers):
+        """
+        @retval list: function(values) per recipe, computed in a process pool
+        """
+        # spawn, the callers are threads and fork does not mix well with them
+        with ProcessPoolExecutor(max_workers=max_workers,
+                                 mp_context=multiprocessing.get_context("spawn")) as pool:
+            return list(pool.map(function,
+                                 [paprika_recipe.values(decompress=False) for paprika_recipe in paprika_recipes],
+                                 chunksize=64))
+
+    @staticmethod
+    def hash_many(paprika_recipes, max_workers=None) -> None:
+        """
+        calculate_hash_sha256 for many recipes. Recipes with a cached hash are
+        skipped, the rest are hashed in a process pool when there are enough
+        of them to pay for starting it.
+
+        @param max_workers: size of the process pool, None for the number of CPUs
+        """
+        pending = [paprika_recipe for paprika_recipe in paprika_recipes if paprika_recipe.hash_digest is None]
+        if len(pending) >= RecipeObject.HASH_POOL_MIN_RECIPES:
+            digests = RecipeObject.__pool_map(function=RecipeObject.hash_values,
+                                              paprika_recipes=pending, max_workers=max_workers)
+            for paprika_recipe, digest in zip(pending, digests):
+                paprika_recipe.hash_digest = digest
+
+        for paprika_recipe in paprika_recipes:
+            paprika_recipe.calculate_hash_sha256()
+
+    @staticmethod
+    def package_many(paprika_recipes, max_workers=None) -> list:
+        """
+        Hashes the recipes and makes their gzip compressed push bodies, in a
+        process pool when there are enough of them to pay for starting it.
+        The hash of each recipe is updated, as by calculate_hash_sha256.
+
+        @param max_workers: size of the process pool, None for the number of CPUs
+        @retval list: the gzip compressed json per recipe, in the same order
+        """
+        paprika_recipes = list(paprika_recipes)
+        if len(paprika_recipes) >= RecipeObject.HASH_POOL_MIN_RECIPES:
+            packages = RecipeObject.__pool_map(function=RecipeObject.package_values,
+                                               paprika_recipes=paprika_recipes, max_workers=max_workers)
+            result = []
+            for paprika_recipe, (digest, packaged_data) in zip(paprika_recipes, packages):
+                paprika_recipe.hash_digest = digest
+                paprika_recipe.calculate_hash_sha256()
+                result.append(packaged_data)
+            return result
+
+        result = []
+        for paprika_recipe in paprika_recipes:
+            paprika_recipe.calculate_hash_sha256()
+            recipe_json = paprika_recipe.as_json().encode(encoding="utf-8")
+            result.append(gzip.compress(recipe_json, compresslevel=RecipeObject.PUSH_GZIP_LEVEL))
+        return result
+
+    def __str__(self) -> str:
+        result = "Paprika Recipe <{}> ({})".format(self.uid, self.name)
+        return result
+
+"""
+Lazy Recipe Object
+
+Recipe read from the database, holding the row values as they are
+stored. A field is decoded (flags to bool, categories from json,
+compressed text) the first time it is loaded, so reading only a
+few fields of many recipes skips most of the decode work.
+
+The first store() decodes the rest and turns the recipe into a
+plain RecipeObject. Read fields through load(), not the attributes.
+"""
+class LazyRecipeObject (RecipeObject):
+
+    BOOLEAN_FIELDS = frozenset(["on_favorites", "is_pinned", "on_grocery_list", "in_trash"])
+
+    # same layout as RecipeObject, so the class can be switched on store()
+    __slots__ = ()
+
+    @staticmethod
+    def decode(key, value):
+        """
+        @retval value: the field value as a RecipeObject holds it,
+                       the same object if it is already decoded
+        """
+        if key in LazyRecipeObject.BOOLEAN_FIELDS:
+            if type(value) is int:
+                return bool(value)
+        elif key == "categories":
+            if type(value) is not list:
+                return json.loads(value) if value else []
+        elif type(value) is bytes:
+            return CompressedText(value)
+        return value
+
+    def __decode_field(self, key) -> None:
+        value = getattr(self, key)
+        decoded = LazyRecipeObject.decode(key, value)
+        if decoded is not value:
+            setattr(self, key, decoded)
+
+    def load(self, key):
+        """
+        Throws a KeyError exception if the key is not a recipe field.
+
+        @retval value: if key exists
+        """
+        if key not in RecipeObject.FIELD_SET:
+            raise KeyError(key)
+        self.__decode_field(key=key)
+        return RecipeObject.load(self, key)
+
+    def store(self, key, value):
+        """
+        Same as RecipeObject.store, the recipe becomes a RecipeObject first
+        """
+        if key not in RecipeObject.FIELD_SET:
+            raise KeyError(key)
+        self.promote()
+        RecipeObject.store(self, key, value)
+
+    def promote(self) -> RecipeObject:
+        """
+        Decode every field and make this recipe a plain RecipeObject
+
+        @retval RecipeObject: this recipe
+        """
+        for key in RecipeObject.FIELDS:
+            self.__decode_field(key=key)
+        self.__class__ = RecipeObject
+        return self
+
+    def values(self, decompress=True) -> tuple:
+        """
+        @param decompress: False to leave the compressed fields as CompressedText,
+                           e.g. when writing them back to the database
+        @retval tuple: the decoded field values in RecipeObject.FIELDS order
+        """
+        for key in RecipeObject.FIELDS:
+            self.__decode_field(key=key)
+        return RecipeObject.values(self, decompress=decompress)
+
+"""
+Recipe Header
+
+Lightweight, read-only view of a recipe with only the fields
+needed to pick and list meals. Skips the heavy text fields
+(photo, directions, ingredients, notes, ...).
+"""
+class RecipeHeader (object):
+
+    # the fields held by a header, also the columns read from the database
+    FIELDS = (
+        "uid", "name", "categories", "rating", "prep_time", "cook_time",
+        "total_time", "servings", "nutritional_info", "hash", "in_trash"
+    )
+
+    __slots__ = FIELDS
+
+    def __init__(self, uid: str, name: str, categories, rating: int, prep_time: str, cook_time: str,
+        total_time: str, servings: str, nutritional_info: str, hash: str, in_trash: bool
+    ) -> None:
+        self.uid = uid
+        self.name = name
+        self.categories = categories
+        self.rating = rating
+        self.prep_time = prep_time
+        self.cook_time = cook_time
+        self.total_time = total_time
+        self.servings = servings
+        self.nutritional_info = nutritional_info
+        self.hash = hash
+        self.in_trash = in_trash
+
+    def load(self, key):
+        """
+        Same contract as RecipeObject.load, limited to the header fields.
+        Throws a KeyError exception if the key is not a header field.
+
+        @retval value: if key exists
+        """
+        if key not in RecipeHeader.FIELDS:
+            raise KeyError
+        return getattr(self, key)
+
+    def hydrate(self, database):
+        """
+        Read the full recipe from the database
+
+        @retval RecipeObject: the full recipe
+        @retval None: if the recipe is NOT found
+        """
+        return database.read_recipe(uid=self.uid)
 
     def __str__(self) -> str:
-        result = "Paprika Recipe <{}> ({})".format(self.__recipe_data["uid"], self.__recipe_data["name"])
-        return result
\ No newline at end of file
+        result = "Paprika Recipe Header <{}> ({})".format(self.uid, self.name)
+        return result
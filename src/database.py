@@ -1,13 +1,339 @@
-
 import sqlite3
 import json
+import hashlib
 import threading
+import queue
+import time
+import os
+from urllib.request import pathname2url
+from collections import OrderedDict
+from concurrent.futures import Future
 from enum import Enum
 
 # App packages
 import mpp_utils
-from data.recipe import RecipeObject
+import schema
+from data.recipe import RecipeObject, LazyRecipeObject, RecipeHeader, CompressedText
+from data.ingredient import Ingredient
+from data.meal import Meal
 from data.surface import AppSurface
+from recipe_cache import RecipeCache
+
+log = mpp_utils.get_logger(__name__)
+
+
+"""
+Connection Manager
+
+Keeps one long-lived SQLite connection per thread instead of
+opening and closing the database file for every read/write.
+Connections are opened in WAL journal mode so readers can keep
+reading while a writer is active.
+"""
+class ConnectionManager (object):
+
+    # Applied to every new connection, in order
+    # Ref. https://www.sqlite.org/pragma.html
+    CONNECTION_PRAGMAS = [
+        "PRAGMA journal_mode=WAL",
+        "PRAGMA synchronous=NORMAL",   # safe with WAL, fsync only on checkpoint
+        "PRAGMA busy_timeout=5000",    # milliseconds to wait on a locked database
+        "PRAGMA temp_store=MEMORY",
+        "PRAGMA cache_size=-8000",     # negative value is KiB, ~8MB page cache
+    ]
+
+    # Applied instead for read only connections
+    READ_ONLY_PRAGMAS = [
+        "PRAGMA query_only=1",
+        "PRAGMA busy_timeout=5000",
+        "PRAGMA temp_store=MEMORY",
+        "PRAGMA cache_size=-8000",
+        "PRAGMA mmap_size=268435456",  # read pages straight from a 256MB memory map
+    ]
+
+    def __init__(self, path, read_only=False) -> None:
+        self.path = path
+        self.read_only = read_only
+        self.manager_lock = threading.Lock()
+        self.thread_local = threading.local()
+        # bumped by close_all, connections opened before are closed by their thread
+        self.generation = 0
+
+    def connection(self) -> sqlite3.Connection:
+        """
+        @retval sqlite3.Connection: the connection owned by the calling thread
+        """
+        connection = getattr(self.thread_local, "connection", None)
+        if connection is not None:
+            if self.thread_local.generation == self.generation:
+                return connection
+            # retired by close_all, this thread is the only one that used it
+            self.release()
+
+        generation = self.generation
+        # the connection is only ever used by the thread that opened it,
+        # sqlite3 raises if another thread tries to
+        if self.read_only is True:
+            # Ref. https://www.sqlite.org/uri.html
+            uri = "file:{}?mode=ro".format(pathname2url(os.path.abspath(self.path)))
+            connection = sqlite3.connect(uri, uri=True)
+            pragmas = ConnectionManager.READ_ONLY_PRAGMAS
+        else:
+            connection = sqlite3.connect(self.path)
+            pragmas = ConnectionManager.CONNECTION_PRAGMAS
+        # rows are read by column name
+        connection.row_factory = sqlite3.Row
+        schema.register_functions(connection=connection)
+        for pragma in pragmas:
+            connection.execute(pragma)
+
+        self.thread_local.connection = connection
+        self.thread_local.generation = generation
+        return connection
+
+    def release(self) -> None:
+        """
+        Closes the connection of the calling thread, if it has one.
+        """
+        connection = getattr(self.thread_local, "connection", None)
+        self.thread_local.connection = None
+        if connection is None:
+            return
+        try:
+            connection.close()
+        except Exception as e:
+            log.warning("%s", e)
+
+    def close_all(self) -> None:
+        """
+        Closes the connection of the calling thread & retires the others.
+        A connection is never closed under the thread using it: each thread
+        closes its retired connection the next time it asks for one, and the
+        connections of threads that exit are closed with their thread locals.
+        """
+        with self.manager_lock:
+            self.generation += 1
+        self.release()
+
+
+"""
+Database Writer
+
+Single background thread that owns the only write connection.
+Recipe writes are queued, repeated writes to the same uid are
+coalesced, and the recipes already queued are committed together
+(up to BATCH_SIZE per commit) as soon as the queue runs empty, so a
+lone write is never held back waiting for a batch to fill up.
+Callers get a Future that resolves to a Database.Error once the
+write is committed (or failed).
+"""
+class DatabaseWriter (threading.Thread):
+
+    # most recipes per commit
+    BATCH_SIZE = 200
+
+    class Request (Enum):
+        REQ_RECIPE = 0,
+        REQ_OPERATION = 1,
+        REQ_STOP = 2,
+
+    def __init__(self, manager: ConnectionManager) -> None:
+        super().__init__(group=None, target=None, name="DatabaseWriter", args=(), kwargs={}, daemon=True)
+        self.manager = manager
+        self.request_queue = queue.Queue()
+        self.accepting = True
+        self.accepting_lock = threading.Lock()
+        # stats
+        self.commits = 0
+        self.recipes_written = 0
+        self.recipes_coalesced = 0
+
+    def __submit(self, request) -> Future:
+        future = request[-1]
+        with self.accepting_lock:
+            if self.accepting is False:
+                future.set_result(Database.Error.ERR_APP_SHUTDOWN)
+                return future
+            self.request_queue.put(request)
+        return future
+
+    def submit_recipe(self, uid: str, row: tuple, category_rows: list, ingredients: str, journal=None) -> Future:
+        """
+        @param row: recipe values in Database.RECIPE_COLUMNS order
+        @param category_rows: (uid, category) rows for RECIPE_CATEGORY
+        @param ingredients: the recipe ingredients as text, parsed into RECIPE_INGREDIENT
+        @param journal: sync journal command the recipe is marked done in, in the same commit
+        @retval Future: resolves to Database.Error once committed
+        """
+        return self.__submit((DatabaseWriter.Request.REQ_RECIPE, uid, row, category_rows, ingredients, journal, Future()))
+
+    def submit_operation(self, operation, invalidate_uids=()) -> Future:
+        """
+        Runs operation(cursor) in its own transaction on the writer thread,
+        after every recipe queued before it is committed.
+
+        @param invalidate_uids: recipes to drop from the cache once committed
+        @retval Future: resolves to Database.Error once committed
+        """
+        return self.__submit((DatabaseWriter.Request.REQ_OPERATION, operation, list(invalidate_uids), Future()))
+
+    def stop(self) -> None:
+        """
+        Commits everything queued so far, then stops the thread.
+        """
+        with self.accepting_lock:
+            if self.accepting is False:
+                return
+            self.accepting = False
+            self.request_queue.put((DatabaseWriter.Request.REQ_STOP, None))
+        if self.is_alive() and threading.current_thread() is not self:
+            self.join()
+
+    def run(self) -> None:
+        connection = self.manager.connection()
+        cursor = connection.cursor()
+        # uid -> (row, category_rows, ingredients, [futures], journal), in arrival order
+        pending = OrderedDict()
+
+        while True:
+            try:
+                # only wait while nothing is pending, otherwise take what is already queued
+                request = self.request_queue.get(block=len(pending) == 0)
+            except queue.Empty:
+                # the queue ran empty, commit the batch right away
+                self.__flush(connection=connection, cursor=cursor, pending=pending)
+                continue
+
+            kind = request[0]
+            if kind == DatabaseWriter.Request.REQ_RECIPE:
+                (_, uid, row, category_rows, ingredients, journal, future) = request
+                futures = [future]
+                if uid in pending:
+                    # only the latest version of the recipe is written
+                    previous = pending.pop(uid)
+                    futures = previous[3] + futures
+                    journal = journal if journal is not None else previous[4]
+                    self.recipes_coalesced += 1
+                pending[uid] = (row, category_rows, ingredients, futures, journal)
+                if len(pending) >= DatabaseWriter.BATCH_SIZE:
+                    self.__flush(connection=connection, cursor=cursor, pending=pending)
+
+            elif kind == DatabaseWriter.Request.REQ_OPERATION:
+                (_, operation, invalidate_uids, future) = request
+                # keep the order of writes
+                self.__flush(connection=connection, cursor=cursor, pending=pending)
+                future.set_result(self.__run_operation(connection=connection, cursor=cursor,
+                                                       operation=operation, invalidate_uids=invalidate_uids))
+
+            elif kind == DatabaseWriter.Request.REQ_STOP:
+                self.__flush(connection=connection, cursor=cursor, pending=pending)
+                break
+
+        cursor.close()
+        # only this thread ever used the write connection
+        self.manager.release()
+
+    def __run_operation(self, connection, cursor, operation, invalidate_uids) -> int:
+        try:
+            result = operation(cursor)
+            connection.commit()
+            self.commits += 1
+            Database.RECIPE_CACHE.invalidate(uids=invalidate_uids)
+        except Exception as e:
+            log.warning("%s", e)
+            connection.rollback()
+            return Database.Error.ERR_OPERATION_FAILED
+
+        if result is None:
+            result = Database.Error.ERR_SUCCESS
+        return result
+
+    def __write_recipes(self, cursor, uids, entries) -> None:
+        """
+        Upserts the recipes & replaces their category rows. The ingredient
+        rows are only parsed again for recipes whose hash changed, or that
+        have no hash. Recipes written for a sync are marked done in its
+        journal, so the journal never runs behind the commits. Does NOT commit.
+        """
+        result = cursor.execute("SELECT uid, ingredients_hash FROM RECIPE_TABLE WHERE uid IN ({})".format(
+            ", ".join(["?"] * len(uids))), uids)
+        parsed_hashes = {row[0]: row[1] for row in result.fetchall()}
+
+        cursor.executemany(Database.RECIPE_UPSERT_SQL, [entry[0] for entry in entries])
+        cursor.executemany("DELETE FROM RECIPE_CATEGORY WHERE uid = ?", [(uid,) for uid in uids])
+        cursor.executemany("INSERT OR IGNORE INTO RECIPE_CATEGORY (uid, category) VALUES (?, ?)",
+                           [category_row for entry in entries for category_row in entry[1]])
+
+        changed_recipes = []
+        for (uid, entry) in zip(uids, entries):
+            recipe_hash = entry[0][Database.HASH_INDEX]
+            if recipe_hash == "" or parsed_hashes.get(uid) != recipe_hash:
+                changed_recipes.append((uid, recipe_hash, entry[2]))
+        DatabaseWriter.write_ingredients(cursor=cursor, recipes=changed_recipes)
+        cursor.executemany("UPDATE SYNC_JOURNAL SET done = 1 WHERE command = ? AND uid = ?",
+                           [(entry[4], uid) for (uid, entry) in zip(uids, entries) if entry[4] is not None])
+
+    @staticmethod
+    def write_ingredients(cursor, recipes) -> None:
+        """
+        Parses the ingredients & replaces the RECIPE_INGREDIENT rows of the recipes.
+        Does NOT commit.
+
+        @param recipes: (uid, hash, ingredients) per recipe
+        """
+        if len(recipes) == 0:
+            return
+        ingredient_rows = []
+        for (uid, recipe_hash, ingredients) in recipes:
+            for ingredient in Ingredient.parse_all(ingredients=ingredients or ""):
+                ingredient_rows.append(ingredient.as_row(uid=uid))
+        cursor.executemany("DELETE FROM RECIPE_INGREDIENT WHERE uid = ?", [(recipe[0],) for recipe in recipes])
+        cursor.executemany(Database.INGREDIENT_INSERT_SQL, ingredient_rows)
+        cursor.executemany("UPDATE RECIPE_TABLE SET ingredients_hash = ? WHERE uid = ?",
+                           [(recipe[1], recipe[0]) for recipe in recipes])
+
+    def __flush(self, connection, cursor, pending: OrderedDict) -> None:
+        """
+        Commits every pending recipe in one transaction. If the batch
+        fails, its recipes are retried one by one so that a single bad
+        recipe does not fail the rest of the batch.
+        """
+        if len(pending) == 0:
+            return
+
+        uids = list(pending.keys())
+        entries = list(pending.values())
+        pending.clear()
+
+        try:
+            self.__write_recipes(cursor=cursor, uids=uids, entries=entries)
+            connection.commit()
+            self.commits += 1
+            self.recipes_written += len(uids)
+            Database.RECIPE_CACHE.invalidate(uids=uids)
+            for entry in entries:
+                for future in entry[3]:
+                    future.set_result(Database.Error.ERR_SUCCESS)
+            return
+        except Exception as e:
+            log.warning("batch write failed, retrying recipes one at a time: %s", e)
+            connection.rollback()
+
+        # find the recipes that are actually failing
+        for (uid, entry) in zip(uids, entries):
+            status = Database.Error.ERR_SUCCESS
+            try:
+                self.__write_recipes(cursor=cursor, uids=[uid], entries=[entry])
+                connection.commit()
+                self.commits += 1
+                self.recipes_written += 1
+                Database.RECIPE_CACHE.invalidate(uids=[uid])
+            except Exception as e:
+                log.warning("[%s] unable to write recipe: %s", uid, e)
+                connection.rollback()
+                status = Database.Error.ERR_OPERATION_FAILED
+            for future in entry[3]:
+                future.set_result(status)
 
 
 """
@@ -19,7 +345,74 @@ database interface.
 class Database (object):
 
     DATABASE_PATH = "./datastore/mpp.db"
-    DATABASE_WR_MUX = threading.Lock()
+    # copy of the database for read only planning, see refresh_snapshot
+    SNAPSHOT_PATH = "./datastore/mpp_snapshot.db"
+    SNAPSHOT_MAX_AGE_SECONDS = 300
+
+    # RECIPE_TABLE columns, in table order
+    RECIPE_COLUMNS = [
+        "uid", "rating", "photo_hash", "on_favorites", "photo", "scale",
+        "ingredients", "is_pinned", "source", "total_time", "hash", "description",
+        "source_url", "difficulty", "on_grocery_list", "in_trash", "directions",
+        "categories", "photo_url", "cook_time", "name", "created", "notes",
+        "photo_large", "image_url", "prep_time", "servings", "nutritional_info",
+        # METADATA
+        "b_has_nutritional_info", "b_recipe_modified"
+    ]
+
+    # insert a recipe, or update every column if the uid already exists
+    # Ref. https://www.sqlite.org/lang_upsert.html
+    RECIPE_UPSERT_SQL = "INSERT INTO RECIPE_TABLE ({}) VALUES ({}) ON CONFLICT(uid) DO UPDATE SET {}".format(
+        ", ".join(RECIPE_COLUMNS),
+        ", ".join(["?"] * len(RECIPE_COLUMNS)),
+        ", ".join(["{0} = excluded.{0}".format(column) for column in RECIPE_COLUMNS[1:]])
+    )
+
+    # select every recipe column
+    RECIPE_SELECT_SQL = "SELECT {} FROM RECIPE_TABLE".format(", ".join(RECIPE_COLUMNS))
+
+    # large text columns that may be stored zlib compressed, as BLOBs
+    COMPRESSIBLE_COLUMNS = ["photo", "ingredients", "description", "directions", "notes", "photo_large"]
+
+    # positions of the fields converted between row values and recipe values
+    # Note: the recipe columns start with RecipeObject.FIELDS, in the same order
+    COMPRESSIBLE_INDEXES = [RecipeObject.FIELDS.index(column) for column in COMPRESSIBLE_COLUMNS]
+    CATEGORIES_INDEX = RecipeObject.FIELDS.index("categories")
+    HASH_INDEX = RecipeObject.FIELDS.index("hash")
+
+    INGREDIENT_INSERT_SQL = "INSERT INTO RECIPE_INGREDIENT (uid, {}) VALUES ({})".format(
+        ", ".join(Ingredient.FIELDS), ", ".join(["?"] * (len(Ingredient.FIELDS) + 1)))
+
+    # paprika collections synced whole, name as in /sync/status -> (table, columns after uid)
+    # Note: the table names are only ever formatted into queries from here
+    COLLECTIONS = {
+        "categories": ("CATEGORY_TABLE", ("name", "parent_uid", "order_flag")),
+        "meals": ("MEAL_TABLE", Meal.FIELDS[1:]),
+        "groceries": ("GROCERY_TABLE", ("recipe_uid", "name", "ingredient", "aisle", "purchased", "order_flag")),
+        "bookmarks": ("BOOKMARK_TABLE", ("recipe_uid", "title", "url", "order_flag")),
+    }
+
+    # select only the light columns needed for a RecipeHeader
+    RECIPE_HEADER_SELECT_SQL = "SELECT {} FROM RECIPE_TABLE".format(", ".join(RecipeHeader.FIELDS))
+
+    # number of uids per IN (...) query, and rows per fetch when streaming
+    READ_CHUNK_SIZE = 500
+
+    # bm25 weight of each RECIPE_SEARCH column (name, ingredients, directions, notes)
+    SEARCH_WEIGHTS = (10.0, 4.0, 1.0, 1.0)
+
+    # shared by all Database objects, created on first use
+    CONNECTION_MANAGER = None
+    CONNECTION_MANAGER_MUX = threading.Lock()
+    DATABASE_WRITER = None
+    READ_ONLY_MANAGER = None
+    SNAPSHOT_MANAGER = None
+    SNAPSHOT_MUX = threading.Lock()
+    SNAPSHOT_REFRESHED = None
+
+    # hydrated recipes shared by all Database objects, see read_recipe
+    RECIPE_CACHE = RecipeCache(max_recipes=mpp_utils.APP__CONFIG__DATABASE__CACHE_MAX_RECIPES,
+                               max_bytes=mpp_utils.APP__CONFIG__DATABASE__CACHE_MAX_BYTES)
 
     class Error (Enum):
         ERR_SUCCESS = 0,
@@ -27,29 +420,177 @@ class Database (object):
         ERR_CONNECTION_NOT_OPEN = 2,
         ERR_CONNECTION_ALREADY_OPEN = 3,
         ERR_OPERATION_FAILED = 4,
+        ERR_APP_SHUTDOWN = 5,
+        ERR_READ_ONLY = 6,
 
-    def __init__(self) -> None:
+    def __init__(self, app_surface: AppSurface=None, read_only=False, snapshot=False) -> None:
+        """
+        @param read_only: only read, through read only memory mapped connections
+        @param snapshot: read from a periodically refreshed copy of the database
+                         instead, so reads never contend with the writer (implies read_only)
+        """
+        self.app_surface = app_surface
+        self.snapshot = snapshot
+        self.read_only = read_only or snapshot
         self.connection_is_open = False
         self.connection = None
         self.cursor = None
 
+    @staticmethod
+    def connection_manager() -> ConnectionManager:
+        """
+        @retval ConnectionManager: the manager for Database.DATABASE_PATH
+        """
+        with Database.CONNECTION_MANAGER_MUX:
+            manager = Database.CONNECTION_MANAGER
+            if manager is None or manager.path != Database.DATABASE_PATH:
+                if manager is not None:
+                    Database.__stop_writer()
+                    manager.close_all()
+                manager = ConnectionManager(path=Database.DATABASE_PATH)
+                Database.CONNECTION_MANAGER = manager
+                # cached recipes belong to the previous database
+                Database.RECIPE_CACHE.clear()
+                # cheap no-op once the schema is current
+                schema.migrate(connection=manager.connection())
+        return manager
+
+    @staticmethod
+    def read_only_manager() -> ConnectionManager:
+        """
+        @retval ConnectionManager: read only manager for Database.DATABASE_PATH
+        """
+        # the schema is brought up to date through the primary connections
+        Database.connection_manager()
+        with Database.CONNECTION_MANAGER_MUX:
+            manager = Database.READ_ONLY_MANAGER
+            if manager is None or manager.path != Database.DATABASE_PATH:
+                if manager is not None:
+                    manager.close_all()
+                manager = ConnectionManager(path=Database.DATABASE_PATH, read_only=True)
+                Database.READ_ONLY_MANAGER = manager
+        return manager
+
+    @staticmethod
+    def snapshot_manager() -> ConnectionManager:
+        """
+        @retval ConnectionManager: read only manager for Database.SNAPSHOT_PATH,
+                                   the snapshot is refreshed once it is too old
+        """
+        refreshed = Database.SNAPSHOT_REFRESHED
+        if refreshed is None or time.monotonic() - refreshed > Database.SNAPSHOT_MAX_AGE_SECONDS:
+            Database.refresh_snapshot()
+
+        with Database.CONNECTION_MANAGER_MUX:
+            manager = Database.SNAPSHOT_MANAGER
+            if manager is None or manager.path != Database.SNAPSHOT_PATH:
+                if manager is not None:
+                    manager.close_all()
+                manager = ConnectionManager(path=Database.SNAPSHOT_PATH, read_only=True)
+                Database.SNAPSHOT_MANAGER = manager
+        return manager
+
+    @staticmethod
+    def refresh_snapshot() -> int:
+        """
+        Copies the database to Database.SNAPSHOT_PATH with the online backup API.
+        Snapshot readers see the new copy on their next query.
+
+        @retval Database.Error.ERR_SUCCESS: the snapshot was refreshed
+        """
+        # Ref. https://www.sqlite.org/backup.html
+        with Database.SNAPSHOT_MUX:
+            try:
+                source = Database.connection_manager().connection()
+                destination = sqlite3.connect(Database.SNAPSHOT_PATH)
+                try:
+                    source.backup(destination)
+                finally:
+                    destination.close()
+            except Exception as e:
+                log.warning("unable to refresh the database snapshot: %s", e)
+                return Database.Error.ERR_OPERATION_FAILED
+
+            Database.SNAPSHOT_REFRESHED = time.monotonic()
+
+        return Database.Error.ERR_SUCCESS
+
+    def __manager(self) -> ConnectionManager:
+        """
+        @retval ConnectionManager: the manager this Database reads through
+        """
+        if self.snapshot is True:
+            return Database.snapshot_manager()
+        if self.read_only is True:
+            return Database.read_only_manager()
+        return Database.connection_manager()
+
+    @staticmethod
+    def database_writer() -> DatabaseWriter:
+        """
+        @retval DatabaseWriter: the running writer for Database.DATABASE_PATH
+        """
+        manager = Database.connection_manager()
+        with Database.CONNECTION_MANAGER_MUX:
+            writer = Database.DATABASE_WRITER
+            if writer is None or writer.accepting is False or writer.manager is not manager:
+                writer = DatabaseWriter(manager=manager)
+                writer.start()
+                Database.DATABASE_WRITER = writer
+        return writer
+
+    @staticmethod
+    def __stop_writer() -> None:
+        # CONNECTION_MANAGER_MUX must be held
+        if Database.DATABASE_WRITER is not None:
+            Database.DATABASE_WRITER.stop()
+            Database.DATABASE_WRITER = None
+
+    @staticmethod
+    def close_all() -> None:
+        """
+        Commit the queued writes & close all of the database connections.
+        Called on application shutdown.
+        """
+        with Database.CONNECTION_MANAGER_MUX:
+            Database.__stop_writer()
+            for manager in [Database.CONNECTION_MANAGER, Database.READ_ONLY_MANAGER, Database.SNAPSHOT_MANAGER]:
+                if manager is not None:
+                    manager.close_all()
+
+    def __app_is_running(self) -> bool:
+        """
+        @retval False: the app is shutting down, every connection is released
+        """
+        if self.app_surface is not None and self.app_surface.b_app_running == False:
+            log.debug("app is shutting down, closing database connections")
+            Database.close_all()
+            return False
+        return True
+
     def __open(self) -> int:
         """
         Handled internally to make sure database operations are handled correctly.
+        Borrows the connection of the calling thread, opening it if needed.
 
         @retval True: open was successfull
         @retval False: failed to open the database
         """
         if self.connection_is_open is True:
-            mpp_utils.dbgPrint("connection is already open")
+            log.debug("connection is already open")
             return Database.Error.ERR_CONNECTION_ALREADY_OPEN
+
+        # once the app is shutting down, release every connection
+        if self.__app_is_running() is False:
+            return Database.Error.ERR_APP_SHUTDOWN
         
         try:
-            self.connection = sqlite3.connect(Database.DATABASE_PATH)
+            self.connection = self.__manager().connection()
             self.cursor = self.connection.cursor()
         except:
-            mpp_utils.dbgPrint("failed to open connection")
+            log.warning("failed to open connection")
             self.connection_is_open = False
+            self.connection = None
             self.cursor = None
             return Database.Error.ERR_GENERIC
         
@@ -59,32 +600,34 @@ class Database (object):
     def __close(self) -> int:
         """
         Handled internally to make sure database operations are handled correctly.
+        The thread connection stays open, only the cursor is released.
 
         @retval True: open was successfull
         @retval False: close was not successful
         """
         if self.connection_is_open is False:
-            mpp_utils.dbgPrint("connection is already closed")
+            log.debug("connection is already closed")
             return Database.Error.ERR_CONNECTION_NOT_OPEN
         
         if type(self.connection) is not sqlite3.Connection:
-            mpp_utils.dbgPrint("invalid database connection")
+            log.warning("invalid database connection")
             return Database.Error.ERR_GENERIC 
         
         if self.cursor is None:
-            mpp_utils.dbgPrint("invalid database cursor (Nones)")
+            log.warning("invalid database cursor (Nones)")
             return Database.Error.ERR_GENERIC
 
         if type(self.cursor) is not sqlite3.Cursor:
-            mpp_utils.dbgPrint("invalid database cursor")
+            log.warning("invalid database cursor")
             return Database.Error.ERR_GENERIC
         
         try:
+            self.cursor.close()
             self.cursor = None
-            self.connection.close()
+            self.connection = None
             self.connection_is_open = False
         except:
-            mpp_utils.dbgPrint("failed to close the database connction")
+            log.warning("failed to close the database connction")
             return Database.Error.ERR_OPERATION_FAILED
 
         return Database.Error.ERR_SUCCESS
@@ -95,7 +638,7 @@ class Database (object):
         @retval list: list of uids of all of the recipes
         """
         uid_list = None
-        mpp_utils.dbgPrint("pulling recipe list")
+        log.debug("pulling recipe list")
 
         try:
             # get a cursor
@@ -107,7 +650,7 @@ class Database (object):
             uid_list = result.fetchall()  
 
         except Exception as e:
-            mpp_utils.dbgPrint(e)
+            log.warning("%s", e)
             
         finally: 
             status = self.__close()
@@ -116,194 +659,785 @@ class Database (object):
         
         return uid_list
     
+    def __recipe_row(self, paprika_recipe: RecipeObject) -> tuple:
+        """
+        @retval tuple: the recipe values in Database.RECIPE_COLUMNS order
+        """
+        values = list(paprika_recipe.values(decompress=False))
+        for index in Database.COMPRESSIBLE_INDEXES:
+            values[index] = self.__stored_text(value=values[index])
+        values[Database.CATEGORIES_INDEX] = json.dumps(values[Database.CATEGORIES_INDEX])
+        # METADATA
+        values.append(int(paprika_recipe.metadata_has_nutritional_info))
+        values.append(int(paprika_recipe.metadata_is_modified))
+        return tuple(values)
+
+    def __stored_text(self, value):
+        """
+        @retval bytes: compressed text, if already compressed or if
+                       APP__CONFIG__DATABASE__COMPRESS_TEXT is on and the text is large
+        @retval value: the value as is otherwise
+        """
+        if type(value) is CompressedText:
+            return value.data
+        if (mpp_utils.APP__CONFIG__DATABASE__COMPRESS_TEXT == True and type(value) is str
+                and len(value) >= mpp_utils.APP__CONFIG__DATABASE__COMPRESS_MIN_BYTES):
+            return CompressedText.compress(text=value).data
+        return value
+
+    def write_recipe_async(self, paprika_recipe: RecipeObject, journal=None) -> Future:
+        """
+        Queues the recipe on the database writer. The recipe is copied
+        into a row right away, so it can be modified after the call.
+
+        @param journal: sync journal command (see journal_start) the recipe is
+                        marked done in, in the same commit as the recipe
+        @retval Future: resolves to Database.Error.ERR_SUCCESS once the write is committed
+        """
+        if self.read_only is True:
+            future = Future()
+            future.set_result(Database.Error.ERR_READ_ONLY)
+            return future
+
+        if self.__app_is_running() is False:
+            future = Future()
+            future.set_result(Database.Error.ERR_APP_SHUTDOWN)
+            return future
+
+        uid = paprika_recipe.load("uid")
+        category_rows = [(uid, category) for category in paprika_recipe.load("categories")]
+        return Database.database_writer().submit_recipe(uid=uid,
+                                                        row=self.__recipe_row(paprika_recipe=paprika_recipe),
+                                                        category_rows=category_rows,
+                                                        ingredients=paprika_recipe.load("ingredients"),
+                                                        journal=journal)
+
     def write_recipe(self, paprika_recipe: RecipeObject) -> int:
         """
+        Writes the recipe and waits until it is committed.
+
         @retval Database.Error.ERR_SUCCESS: write was successful
         """
-        status = Database.Error.ERR_GENERIC
+        try:
+            return self.write_recipe_async(paprika_recipe=paprika_recipe).result()
+        except Exception as e:
+            log.warning("%s", e)
+            return Database.Error.ERR_OPERATION_FAILED
+
+    def write_recipes(self, paprika_recipes) -> dict:
+        """
+        Upserts many recipes and waits until they are committed. The writer
+        commits them in batches instead of once per recipe.
+
+        @retval dict: uid -> Database.Error.ERR_SUCCESS or the failure for that recipe
+        """
+        futures = []
+        for paprika_recipe in paprika_recipes:
+            futures.append((paprika_recipe.load("uid"), self.write_recipe_async(paprika_recipe=paprika_recipe)))
+
+        results = {}
+        for (uid, future) in futures:
+            try:
+                results[uid] = future.result()
+            except Exception as e:
+                log.warning("%s", e)
+                results[uid] = Database.Error.ERR_OPERATION_FAILED
+
+        return results
+
+    def __write_operation(self, operation, invalidate_uids=()) -> int:
+        """
+        Runs operation(cursor) on the database writer and waits for the commit.
+
+        @retval Database.Error.ERR_SUCCESS: the operation was committed
+        """
+        if self.read_only is True:
+            return Database.Error.ERR_READ_ONLY
+
+        if self.__app_is_running() is False:
+            return Database.Error.ERR_APP_SHUTDOWN
+
+        try:
+            return Database.database_writer().submit_operation(operation=operation,
+                                                               invalidate_uids=invalidate_uids).result()
+        except Exception as e:
+            log.warning("%s", e)
+            return Database.Error.ERR_OPERATION_FAILED
+
+    def __recipe_from_row(self, row) -> RecipeObject:
+        """
+        @retval RecipeObject: recipe filled in from a row with the recipe columns
+        """
+        # the fields are decoded when they are first loaded
+        paprika_recipe = LazyRecipeObject.from_fields(values=row[:len(RecipeObject.FIELDS)],
+                                                      has_nutritional_info=bool(row["b_has_nutritional_info"]),
+                                                      is_modified=bool(row["b_recipe_modified"]))
+        return paprika_recipe
+
+    def read_recipe(self, uid) -> RecipeObject:
+        """
+        Served from Database.RECIPE_CACHE when possible.
+
+        @retval RecipeObject: if the recipe with the uid is found
+        @retval None: if the recipe is NOT found
+        """
+        paprika_recipe = Database.RECIPE_CACHE.get(uid=uid)
+        if paprika_recipe is not None:
+            return paprika_recipe
+        generation = Database.RECIPE_CACHE.generation
 
-        # Open and close the DB connection per read/write
+        # Borrow and release the thread connection per read/write
         # FAIL if either open or close fails
 
         # get a cursor
         status = self.__open()
         if status != Database.Error.ERR_SUCCESS:
-            return status
-        
-        recipe_uid = paprika_recipe.load("uid")
-        recipe_in_database = False
-
-        # load the data
-        recipe_dict = paprika_recipe.as_dict()
-        data = (
-            recipe_dict["rating"],
-            recipe_dict["photo_hash"],
-            recipe_dict["on_favorites"],
-            recipe_dict["photo"],
-            recipe_dict["scale"],
-            recipe_dict["ingredients"],
-            recipe_dict["is_pinned"],
-            recipe_dict["source"],
-            recipe_dict["total_time"],
-            recipe_dict["hash"],
-            recipe_dict["description"],
-            recipe_dict["source_url"],
-            recipe_dict["difficulty"],
-            recipe_dict["on_grocery_list"],
-            recipe_dict["in_trash"],
-            recipe_dict["directions"],
-            json.dumps(recipe_dict["categories"]),
-            recipe_dict["photo_url"],
-            recipe_dict["cook_time"],
-            recipe_dict["name"],
-            recipe_dict["created"],
-            recipe_dict["notes"],
-            recipe_dict["photo_large"],
-            recipe_dict["image_url"],
-            recipe_dict["prep_time"],
-            recipe_dict["servings"],
-            recipe_dict["nutritional_info"],
-            # METADATA
-            int(paprika_recipe.metadata_has_nutritional_info),
-            int(paprika_recipe.metadata_is_modified)
-        )
+            return None
 
-        ## Performe the database operation
         try:
-            # acquire lock 
-            Database.DATABASE_WR_MUX.acquire()
-
-            # check if the recipe exists
-            result = self.cursor.execute("SELECT * FROM RECIPE_TABLE WHERE uid='{}'".format(recipe_uid))
+            result = self.cursor.execute("{} WHERE uid = ?".format(Database.RECIPE_SELECT_SQL), (uid,))
             row = result.fetchone()
 
+            # fill in the paprika recipe if it was found
             if row is not None:
-                recipe_in_database = True
-            else:
-                recipe_in_database = False
-            
-            # update or create recipe
-            if recipe_in_database is True:
-                # if it exists, we alter
-                self.cursor.execute(f"""
-                    UPDATE RECIPE_TABLE 
-                        SET rating = ?,
-                            photo_hash = ?,
-                            on_favorites = ?,
-                            photo = ?,
-                            scale = ?,
-                            ingredients = ?,
-                            is_pinned = ?,
-                            source = ?,
-                            total_time = ?,
-                            hash = ?,
-                            description = ?,
-                            source_url = ?,
-                            difficulty = ?,
-                            on_grocery_list = ?,
-                            in_trash = ?,
-                            directions = ?,
-                            categories = ?,
-                            photo_url = ?,
-                            cook_time = ?,
-                            name = ?,
-                            created = ?,
-                            notes = ?,
-                            photo_large = ?,
-                            image_url = ?,
-                            prep_time = ?,
-                            servings = ?,
-                            nutritional_info = ?,
-                            b_has_nutritional_info = ?,
-                            b_recipe_modified = ?
-                            WHERE uid = '{recipe_uid}'
-                """, data)
+                paprika_recipe = self.__recipe_from_row(row=row)
+                if self.snapshot is False:
+                    Database.RECIPE_CACHE.put(paprika_recipe=paprika_recipe, generation=generation)
+        except Exception as e:
+            log.warning("%s", e)
+            paprika_recipe = None
+        finally:
+            status = self.__close()
+            if status != Database.Error.ERR_SUCCESS:
+                return None
+
+        return paprika_recipe
+
+    def read_recipes(self, uids) -> dict:
+        """
+        Reads many recipes with one query per Database.READ_CHUNK_SIZE uids,
+        instead of one query per recipe. Cached recipes are not queried.
+
+        @retval dict: uid -> RecipeObject, uids that are not found are left out
+        @retval None: unable to read the recipes
+        """
+        recipes = {}
+        generation = Database.RECIPE_CACHE.generation
+
+        # only query the recipes that are not cached
+        missing_uids = []
+        for uid in uids:
+            paprika_recipe = Database.RECIPE_CACHE.get(uid=uid)
+            if paprika_recipe is not None:
+                recipes[uid] = paprika_recipe
             else:
-                # if it doenst exist, lets add
-                self.cursor.execute(f"""
-                    INSERT INTO RECIPE_TABLE VALUES (
-                        '{recipe_uid}',?,?,?,?,?,?,?,?,?,?,?,
-                        ?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?
-                    )""", data)
-            
-            # commit the transaction to solidify the write
-            self.connection.commit()
+                missing_uids.append(uid)
+        uids = missing_uids
+        if len(uids) == 0:
+            return recipes
+
+        status = self.__open()
+        if status != Database.Error.ERR_SUCCESS:
+            return None
+
+        try:
+            for idx in range(0, len(uids), Database.READ_CHUNK_SIZE):
+                chunk = uids[idx:idx + Database.READ_CHUNK_SIZE]
+                result = self.cursor.execute("{} WHERE uid IN ({})".format(
+                    Database.RECIPE_SELECT_SQL, ", ".join(["?"] * len(chunk))), chunk)
+                for row in result.fetchall():
+                    paprika_recipe = self.__recipe_from_row(row=row)
+                    if self.snapshot is False:
+                        Database.RECIPE_CACHE.put(paprika_recipe=paprika_recipe, generation=generation)
+                    recipes[row["uid"]] = paprika_recipe
         except Exception as e:
-            mpp_utils.dbgPrint(e)
-            status = Database.Error.ERR_OPERATION_FAILED
+            log.warning("%s", e)
+            recipes = None
         finally:
-            # close the database connection
-            status_close = self.__close()
+            status = self.__close()
+            if status != Database.Error.ERR_SUCCESS:
+                return None
 
-            # release lock 
-            if Database.DATABASE_WR_MUX.locked():
-                Database.DATABASE_WR_MUX.release()
+        return recipes
 
-            if status != Database.Error.ERR_SUCCESS or status_close != Database.Error.ERR_SUCCESS:
-                return Database.Error.ERR_OPERATION_FAILED
+    def __iter_rows(self, query, params=(), batch_size=None):
+        """
+        Generator that streams rows for a query, fetching batch_size rows
+        at a time. Uses its own cursor, so the Database object stays
+        usable (e.g. for writes) while iterating.
+
+        @retval generator: yields rows
+        """
+        if batch_size is None:
+            batch_size = Database.READ_CHUNK_SIZE
+
+        if self.app_surface is not None and self.app_surface.b_app_running == False:
+            return
+
+        cursor = self.__manager().connection().cursor()
+        try:
+            cursor.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if len(rows) == 0:
+                    break
+                for row in rows:
+                    yield row
+        finally:
+            cursor.close()
+
+    def iter_recipes(self, where=None, params=(), batch_size=None):
+        """
+        Generator that streams recipes from the database, so the
+        whole library is never in memory.
+
+        @param where: optional SQL condition, e.g. "in_trash = ?"
+        @param params: parameters for the placeholders in where
+        @retval generator: yields RecipeObject
+        """
+        query = Database.RECIPE_SELECT_SQL
+        if where is not None:
+            query = "{} WHERE {}".format(query, where)
+
+        for row in self.__iter_rows(query=query, params=params, batch_size=batch_size):
+            yield self.__recipe_from_row(row=row)
+
+    def iter_modified_recipes(self, batch_size=None):
+        """
+        Streams the recipes modified locally since they were last pushed.
+        Backed by the RECIPE_MODIFIED partial index, so the cost follows
+        the number of modified recipes, not the size of the library.
+
+        @retval generator: yields RecipeObject
+        """
+        return self.iter_recipes(where="b_recipe_modified = 1", batch_size=batch_size)
+
+    def iter_recipes_missing_nutrition(self, batch_size=None):
+        """
+        Streams the recipes without nutritional information.
+        Backed by the RECIPE_MISSING_NUTRITION partial index.
+
+        @retval generator: yields RecipeObject
+        """
+        return self.iter_recipes(where="b_has_nutritional_info = 0", batch_size=batch_size)
+
+    def mark_recipes_pushed(self, recipe_hashes: dict) -> int:
+        """
+        Marks the recipes as no longer modified and stores the hash they
+        were pushed with. Do not call while iterating iter_modified_recipes,
+        collect the pushed recipes first.
 
-        result = Database.Error.ERR_SUCCESS
+        @param recipe_hashes: uid -> hash of the pushed recipe
+        @retval Database.Error.ERR_SUCCESS: the recipes were updated
+        """
+        uids = list(recipe_hashes.keys())
+        if len(uids) == 0:
+            return Database.Error.ERR_SUCCESS
+
+        def operation(cursor):
+            cursor.executemany("UPDATE RECIPE_TABLE SET b_recipe_modified = 0, hash = ? WHERE uid = ?",
+                               [(recipe_hashes[uid], uid) for uid in uids])
+
+        return self.__write_operation(operation=operation, invalidate_uids=uids)
+
+    def diff_recipe_hashes(self, remote_hashes: dict) -> tuple:
+        """
+        Compares the hashes of the recipes on the server against the local
+        hash column, in a single query.
+
+        @param remote_hashes: uid -> hash, as listed by the server
+        @retval tuple: (uids that are new or changed on the server,
+                        local uids the server no longer has)
+        @retval None: unable to compare
+        """
+        # modified recipes are not pushed yet, the server cannot have them
+        query = """
+            SELECT remote.key, 0 FROM json_each(:remote) AS remote
+                LEFT JOIN RECIPE_TABLE ON RECIPE_TABLE.uid = remote.key
+                WHERE RECIPE_TABLE.hash IS NOT remote.value
+            UNION ALL
+            SELECT uid, 1 FROM RECIPE_TABLE
+                WHERE in_trash = 0 AND b_recipe_modified = 0
+                    AND uid NOT IN (SELECT key FROM json_each(:remote))
+        """
+        changed_uids = []
+        deleted_uids = []
+        try:
+            for row in self.__iter_rows(query=query, params={"remote": json.dumps(remote_hashes)}):
+                if row[1] == 0:
+                    changed_uids.append(row[0])
+                else:
+                    deleted_uids.append(row[0])
+        except Exception as e:
+            log.warning("%s", e)
+            return None
+
+        return (changed_uids, deleted_uids)
+
+    def trash_recipes(self, uids) -> int:
+        """
+        Moves recipes to the trash, e.g. recipes deleted on the server.
+        Their hash is cleared so they are pulled again if they come back.
+
+        @retval Database.Error.ERR_SUCCESS: the recipes were updated
+        """
+        uids = list(uids)
+        if len(uids) == 0:
+            return Database.Error.ERR_SUCCESS
+
+        def operation(cursor):
+            cursor.executemany("UPDATE RECIPE_TABLE SET in_trash = 1, hash = '' WHERE uid = ?",
+                               [(uid,) for uid in uids])
+
+        return self.__write_operation(operation=operation, invalidate_uids=uids)
+
+    def journal_start(self, command: str, recipe_hashes: dict) -> list:
+        """
+        Starts or resumes the sync journal of a command. Recipes already
+        done by an interrupted run with the same hash stay done, recipes
+        that are no longer listed are dropped.
+
+        @param recipe_hashes: uid -> hash of every recipe the sync has to fetch
+        @retval list: uids that are not done yet
+        @retval None: unable to use the journal
+        """
+        def operation(cursor):
+            cursor.execute("DELETE FROM SYNC_JOURNAL WHERE command = ? AND uid NOT IN (SELECT key FROM json_each(?))",
+                           (command, json.dumps(recipe_hashes)))
+            cursor.executemany("""
+                INSERT INTO SYNC_JOURNAL (command, uid, hash) VALUES (?, ?, ?)
+                    ON CONFLICT (command, uid) DO UPDATE SET
+                        done = CASE WHEN SYNC_JOURNAL.hash IS excluded.hash THEN SYNC_JOURNAL.done ELSE 0 END,
+                        hash = excluded.hash
+            """, [(command, uid, recipe_hashes[uid]) for uid in recipe_hashes.keys()])
+
+        if self.__write_operation(operation=operation) != Database.Error.ERR_SUCCESS:
+            return None
+
+        try:
+            pending_uids = [row[0] for row in self.__iter_rows(
+                query="SELECT uid FROM SYNC_JOURNAL WHERE command = ? AND done = 0", params=(command,))]
+        except Exception as e:
+            log.warning("%s", e)
+            return None
+
+        return pending_uids
+
+    def journal_mark_done(self, command: str, uids) -> int:
+        """
+        @retval Database.Error.ERR_SUCCESS: the recipes are marked done
+        """
+        uids = list(uids)
+        if len(uids) == 0:
+            return Database.Error.ERR_SUCCESS
+
+        def operation(cursor):
+            cursor.executemany("UPDATE SYNC_JOURNAL SET done = 1 WHERE command = ? AND uid = ?",
+                               [(command, uid) for uid in uids])
+
+        return self.__write_operation(operation=operation)
+
+    def journal_finish(self, command: str) -> int:
+        """
+        Clears the journal of a command once every recipe is done
+
+        @retval Database.Error.ERR_SUCCESS: the journal is cleared
+        """
+        def operation(cursor):
+            cursor.execute("DELETE FROM SYNC_JOURNAL WHERE command = ?", (command,))
+
+        return self.__write_operation(operation=operation)
+
+    def sync_collection(self, collection: str, items, counter=None) -> tuple:
+        """
+        Brings a collection table in line with the items listed by the server,
+        in one transaction. Only the items whose hash changed are written, and
+        the items the server no longer lists are deleted.
+
+        @param collection: a Database.COLLECTIONS key, e.g. "meals"
+        @param items: the json objects listed by the server
+        @param counter: the /sync/status counter the items are at, kept for the next sync
+        @retval tuple: (number of items written, number of items deleted)
+        @retval None: unable to sync the collection
+        """
+        if collection not in Database.COLLECTIONS:
+            return None
+        (table, columns) = Database.COLLECTIONS[collection]
+
+        # uid -> row, the hash of the whole item last
+        rows = {}
+        for item in items:
+            if type(item) is not dict or item.get("uid") is None:
+                continue
+            item_hash = hashlib.sha256(json.dumps(item, sort_keys=True).encode(encoding="utf-8")).hexdigest()
+            rows[item["uid"]] = (item["uid"],) + tuple(item.get(column) for column in columns) + (item_hash,)
+        remote_hashes = json.dumps({uid: row[-1] for (uid, row) in rows.items()})
+
+        upsert = "INSERT INTO {0} (uid, {1}, hash) VALUES ({2}) ON CONFLICT(uid) DO UPDATE SET {3}".format(
+            table, ", ".join(columns), ", ".join(["?"] * (len(columns) + 2)),
+            ", ".join(["{0} = excluded.{0}".format(column) for column in columns + ("hash",)]))
+        counts = {}
+
+        def operation(cursor):
+            changed_uids = [row[0] for row in cursor.execute("""
+                SELECT remote.key FROM json_each(?) AS remote
+                    LEFT JOIN {0} ON {0}.uid = remote.key
+                    WHERE {0}.hash IS NOT remote.value
+            """.format(table), (remote_hashes,)).fetchall()]
+            cursor.executemany(upsert, [rows[uid] for uid in changed_uids])
+            cursor.execute("DELETE FROM {} WHERE uid NOT IN (SELECT key FROM json_each(?))".format(table),
+                           (remote_hashes,))
+            counts["deleted"] = cursor.rowcount
+            counts["written"] = len(changed_uids)
+            if counter is not None:
+                cursor.execute("INSERT OR REPLACE INTO SYNC_STATUS (collection, counter) VALUES (?, ?)",
+                               (collection, counter))
+
+        if self.__write_operation(operation=operation) != Database.Error.ERR_SUCCESS:
+            return None
+
+        return (counts["written"], counts["deleted"])
+
+    def read_sync_counters(self) -> dict:
+        """
+        @retval dict: collection -> /sync/status counter at its last sync
+        @retval None: unable to read the counters
+        """
+        try:
+            counters = {row[0]: row[1] for row in self.__iter_rows(query="SELECT collection, counter FROM SYNC_STATUS")}
+        except Exception as e:
+            log.warning("%s", e)
+            return None
+
+        return counters
+
+    def read_categories(self) -> dict:
+        """
+        The local category lookup table, recipes list their categories by uid
+
+        @retval dict: category uid -> name
+        @retval None: unable to read the categories
+        """
+        try:
+            categories = {row[0]: row[1] for row in self.__iter_rows(query="SELECT uid, name FROM CATEGORY_TABLE")}
+        except Exception as e:
+            log.warning("%s", e)
+            return None
+
+        return categories
+
+    def resolve_categories(self, categories) -> list:
+        """
+        @param categories: category names (any case) or uids
+        @retval list: the category uids, entries that are neither a known name
+                      nor a known uid are kept as they are
+        """
+        known = self.read_categories() or {}
+        uids_by_name = {}
+        for (uid, name) in known.items():
+            uids_by_name.setdefault(name.lower(), []).append(uid)
+
+        result = []
+        for category in categories:
+            if category in known:
+                result.append(category)
+            else:
+                result.extend(uids_by_name.get(category.lower(), [category]))
         return result
 
-    def read_recipe(self, uid) -> RecipeObject:
+    def read_meals(self, start_date=None, end_date=None) -> list:
         """
-        @retval RecipeObject: if the recipe with the uid is found
-        @retval None: if the recipe is NOT found
+        The paprika meal history, from MEAL_TABLE
+
+        @param start_date: only meals on or after, e.g. "2023-01-01"
+        @param end_date: only meals before, e.g. "2023-02-01"
+        @retval list: Meal per meal, by date
+        @retval None: unable to read the meals
         """
-        paprika_recipe = RecipeObject()
+        query = "SELECT {} FROM MEAL_TABLE WHERE date >= ? AND date < ? ORDER BY date, order_flag".format(
+            ", ".join(Meal.FIELDS))
+        params = (start_date or "", end_date or "\uffff")
+        try:
+            meals = [Meal.from_row(row=row) for row in self.__iter_rows(query=query, params=params)]
+        except Exception as e:
+            log.warning("%s", e)
+            return None
 
-        # Open and close the DB connection per read/write
-        # FAIL if either open or close fails
+        return meals
 
-        # get a cursor
-        status = self.__open()
-        if status != Database.Error.ERR_SUCCESS:
+    def __header_from_row(self, row) -> RecipeHeader:
+        """
+        @retval RecipeHeader: header filled in from a row with the RecipeHeader.FIELDS columns
+        """
+        return RecipeHeader(
+            uid=row["uid"],
+            name=row["name"],
+            categories=json.loads(row["categories"]) if row["categories"] else [],
+            rating=row["rating"],
+            prep_time=row["prep_time"],
+            cook_time=row["cook_time"],
+            total_time=row["total_time"],
+            servings=row["servings"],
+            nutritional_info=row["nutritional_info"],
+            hash=row["hash"],
+            in_trash=bool(row["in_trash"])
+        )
+
+    def iter_recipe_headers(self, where=None, params=(), batch_size=None, include_trash=False):
+        """
+        Generator that streams recipe headers, only reading the
+        columns in RecipeHeader.FIELDS.
+
+        @param where: optional SQL condition, e.g. "rating >= ?"
+        @param params: parameters for the placeholders in where
+        @param include_trash: True to also stream the recipes in the trash
+        @retval generator: yields RecipeHeader
+        """
+        conditions = [] if include_trash is True else ["in_trash = 0"]
+        if where is not None:
+            conditions.append("({})".format(where))
+        query = Database.RECIPE_HEADER_SELECT_SQL
+        if len(conditions) > 0:
+            query = "{} WHERE {}".format(query, " AND ".join(conditions))
+
+        for row in self.__iter_rows(query=query, params=params, batch_size=batch_size):
+            yield self.__header_from_row(row=row)
+
+    def read_recipe_headers(self, uids=None, include_trash=False) -> list:
+        """
+        @param uids: uids to read, None to read the headers of every recipe
+        @param include_trash: True to also read the recipes in the trash
+        @retval list: RecipeHeader for each recipe found
+        @retval None: unable to read the headers
+        """
+        headers = []
+        try:
+            if uids is None:
+                headers = list(self.iter_recipe_headers(include_trash=include_trash))
+            else:
+                uids = list(uids)
+                for idx in range(0, len(uids), Database.READ_CHUNK_SIZE):
+                    chunk = uids[idx:idx + Database.READ_CHUNK_SIZE]
+                    where = "uid IN ({})".format(", ".join(["?"] * len(chunk)))
+                    headers.extend(self.iter_recipe_headers(where=where, params=chunk, include_trash=include_trash))
+        except Exception as e:
+            log.warning("%s", e)
             return None
-        
-        result = self.cursor.execute("SELECT * FROM RECIPE_TABLE WHERE uid='{}'".format(uid))
-        row = result.fetchone()
 
-        # if nothing was found, return none
-        if row is None:
+        return headers
+
+    def recipes_in_categories(self, categories, match_all=False) -> list:
+        """
+        Uses the RECIPE_CATEGORY index instead of decoding every recipe.
+        Recipes in the trash are left out.
+
+        @param categories: category uids to look for
+        @param match_all: True to only return recipes that have every category
+        @retval list: RecipeHeader for each matching recipe
+        @retval None: unable to query the categories
+        """
+        categories = list(set(categories))
+        if len(categories) == 0:
+            return []
+
+        placeholders = ", ".join(["?"] * len(categories))
+        if match_all is True:
+            where = "uid IN (SELECT uid FROM RECIPE_CATEGORY WHERE category IN ({}) GROUP BY uid HAVING COUNT(*) = {})".format(
+                placeholders, len(categories))
+        else:
+            where = "uid IN (SELECT uid FROM RECIPE_CATEGORY WHERE category IN ({}))".format(placeholders)
+
+        try:
+            headers = list(self.iter_recipe_headers(where=where, params=categories))
+        except Exception as e:
+            log.warning("%s", e)
             return None
-        
-        # fill in the paprika recipe otherwise
-        paprika_recipe.init(
-            uid=row[0],
-            rating=row[1],
-            photo_hash=row[2],
-            on_favorites=bool(row[3]),
-            photo=row[4],
-            scale=row[5],
-            ingredients=row[6],
-            is_pinned=bool(row[7]),
-            source=row[8],
-            total_time=row[9],
-            hash=row[10],
-            description=row[11],
-            source_url=row[12],
-            difficulty=row[13],
-            on_grocery_list=bool(row[14]),
-            in_trash=bool(row[15]),
-            directions=row[16],
-            categories=json.loads(row[17]),
-            photo_url=row[18],
-            cook_time=row[19],
-            name=row[20],
-            created=row[21],
-            notes=row[22],
-            photo_large=row[23],
-            image_url=row[24],
-            prep_time=row[25],
-            servings=row[26],
-            nutritional_info=row[27]
+
+        return headers
+
+    def search(self, query: str, limit=20) -> list:
+        """
+        Full-text search over recipe name, ingredients, directions and notes.
+        Every word of the query has to match (as a prefix), best matches first.
+        Recipes in the trash are left out.
+
+        @retval list: RecipeHeader for each match, ranked by bm25
+        @retval None: unable to search
+        """
+        # quote each word so user input is never parsed as FTS5 syntax
+        words = ['"{}"*'.format(word.replace('"', '""')) for word in query.split()]
+        if len(words) == 0:
+            return []
+
+        query = """
+            SELECT {} FROM RECIPE_SEARCH
+                JOIN RECIPE_TABLE ON RECIPE_TABLE.rowid = RECIPE_SEARCH.rowid
+                WHERE RECIPE_SEARCH MATCH ? AND RECIPE_TABLE.in_trash = 0
+                ORDER BY bm25(RECIPE_SEARCH, {})
+                LIMIT ?
+        """.format(
+            ", ".join(["RECIPE_TABLE.{}".format(field) for field in RecipeHeader.FIELDS]),
+            ", ".join([str(weight) for weight in Database.SEARCH_WEIGHTS])
         )
 
-        status = self.__close()
-        if status != Database.Error.ERR_SUCCESS:
+        try:
+            headers = [self.__header_from_row(row=row)
+                       for row in self.__iter_rows(query=query, params=(" ".join(words), limit))]
+        except Exception as e:
+            log.warning("%s", e)
             return None
 
-        return paprika_recipe
+        return headers
+
+    def read_recipe_ingredients(self, uid: str) -> list:
+        """
+        The ingredients as parsed when the recipe was written.
+
+        @retval list: Ingredient per ingredient line, in recipe order
+        @retval None: unable to read the ingredients
+        """
+        query = "SELECT {} FROM RECIPE_INGREDIENT WHERE uid = ? ORDER BY position".format(", ".join(Ingredient.FIELDS))
+        try:
+            ingredients = [Ingredient.from_row(row=row) for row in self.__iter_rows(query=query, params=(uid,))]
+        except Exception as e:
+            log.warning("%s", e)
+            return None
+
+        return ingredients
+
+    def recipes_with_ingredient(self, item: str) -> list:
+        """
+        Uses the RECIPE_INGREDIENT item index, the item has to match exactly (ignoring case).
+        Recipes in the trash are left out.
+
+        @retval list: RecipeHeader for each recipe using the item
+        @retval None: unable to query the ingredients
+        """
+        where = "uid IN (SELECT uid FROM RECIPE_INGREDIENT WHERE item = ? COLLATE NOCASE)"
+        try:
+            headers = list(self.iter_recipe_headers(where=where, params=(item,)))
+        except Exception as e:
+            log.warning("%s", e)
+            return None
+
+        return headers
+
+    def read_recipe_photos(self) -> dict:
+        """
+        The photos of the recipes not in the trash, recipes sharing a photo share the hash.
+
+        @retval dict: photo_hash -> photo_url
+        @retval None: unable to read the photos
+        """
+        query = """
+            SELECT photo_hash, MAX(photo_url) FROM RECIPE_TABLE
+                WHERE in_trash = 0 AND photo_hash != "" AND photo_url != ""
+                GROUP BY photo_hash
+        """
+        try:
+            photos = {row[0]: row[1] for row in self.__iter_rows(query=query)}
+        except Exception as e:
+            log.warning("%s", e)
+            return None
+
+        return photos
+
+    def rebuild_search_index(self) -> int:
+        """
+        Rebuilds RECIPE_SEARCH from RECIPE_TABLE, needed after a VACUUM
+        since the index refers to the recipe rowids, or after editing
+        recipes without the search triggers (see datastore/setup.sql),
+        which are put back.
+
+        @retval Database.Error.ERR_SUCCESS: the index was rebuilt
+        """
+        def operation(cursor):
+            for name in schema.SEARCH_TRIGGER_NAMES:
+                cursor.execute("DROP TRIGGER IF EXISTS {}".format(name))
+            for trigger in schema.SEARCH_TRIGGERS_SQL:
+                cursor.execute(trigger)
+            cursor.execute("INSERT INTO RECIPE_SEARCH (RECIPE_SEARCH) VALUES ('delete-all')")
+            cursor.execute("""
+                INSERT INTO RECIPE_SEARCH (rowid, name, ingredients, directions, notes)
+                    SELECT rowid, mpp_text(name), mpp_text(ingredients), mpp_text(directions), mpp_text(notes)
+                    FROM RECIPE_TABLE""")
+
+        return self.__write_operation(operation=operation)
+
+    def compress_recipes(self, batch_size=None) -> int:
+        """
+        One time pass that compresses the large text columns of the recipes
+        already in the database, see APP__CONFIG__DATABASE__COMPRESS_TEXT.
+        Freed pages are reused by later writes, run VACUUM and then
+        rebuild_search_index to also shrink the file.
+
+        @retval Database.Error.ERR_SUCCESS: every recipe was compressed
+        """
+        if batch_size is None:
+            batch_size = DatabaseWriter.BATCH_SIZE
+
+        min_bytes = mpp_utils.APP__CONFIG__DATABASE__COMPRESS_MIN_BYTES
+        where = " OR ".join(["(typeof({0}) = 'text' AND length({0}) >= ?)".format(column)
+                             for column in Database.COMPRESSIBLE_COLUMNS])
+        query = "SELECT uid, {} FROM RECIPE_TABLE WHERE {}".format(", ".join(Database.COMPRESSIBLE_COLUMNS), where)
+        update = "UPDATE RECIPE_TABLE SET {} WHERE uid = ?".format(
+            ", ".join(["{} = ?".format(column) for column in Database.COMPRESSIBLE_COLUMNS]))
+
+        def compressed_row(row) -> tuple:
+            values = []
+            for column in Database.COMPRESSIBLE_COLUMNS:
+                value = row[column]
+                if type(value) is str and len(value) >= min_bytes:
+                    value = CompressedText.compress(text=value).data
+                values.append(value)
+            values.append(row["uid"])
+            return tuple(values)
+
+        def write_batch(rows) -> int:
+            def operation(cursor):
+                cursor.executemany(update, rows)
+            return self.__write_operation(operation=operation, invalidate_uids=[row[-1] for row in rows])
+
+        # collect everything first, the writer changes the rows being selected
+        rows = [compressed_row(row) for row in
+                self.__iter_rows(query=query, params=[min_bytes] * len(Database.COMPRESSIBLE_COLUMNS))]
+
+        status = Database.Error.ERR_SUCCESS
+        for idx in range(0, len(rows), batch_size):
+            status = write_batch(rows=rows[idx:idx + batch_size])
+            if status != Database.Error.ERR_SUCCESS:
+                break
+
+        return status
+
+    def update_ingredient_index(self, batch_size=None) -> int:
+        """
+        Parses the ingredients of the recipes whose RECIPE_INGREDIENT rows are
+        missing or were parsed at another hash, e.g. recipes written before the
+        table existed. Recipes written since are parsed by the writer.
+
+        @retval Database.Error.ERR_SUCCESS: every recipe is parsed
+        """
+        if batch_size is None:
+            batch_size = DatabaseWriter.BATCH_SIZE
+
+        query = "SELECT uid, hash, mpp_text(ingredients) FROM RECIPE_TABLE WHERE ingredients_hash IS NOT hash"
+
+        def write_batch(recipes) -> int:
+            def operation(cursor):
+                DatabaseWriter.write_ingredients(cursor=cursor, recipes=recipes)
+            return self.__write_operation(operation=operation)
+
+        # collect everything first, the writer changes the rows being selected
+        recipes = [(row[0], row[1], row[2]) for row in self.__iter_rows(query=query, params=())]
+
+        status = Database.Error.ERR_SUCCESS
+        for idx in range(0, len(recipes), batch_size):
+            status = write_batch(recipes=recipes[idx:idx + batch_size])
+            if status != Database.Error.ERR_SUCCESS:
+                break
+
+        return status
 
 ##########################
 ## IN-FILE UNIT TESTING ##
@@ -407,7 +1541,184 @@ if mpp_utils.APP__CONFIG__DATABASE__UNIT_TEST == True:
 
         return status
 
-    TestList = [test0, test1]
+    """
+    Run a test on a new, empty database instead of Database.DATABASE_PATH
+    """
+    def on_scratch_database(test) -> bool:
+        import tempfile
+        database_path = Database.DATABASE_PATH
+        scratch_directory = tempfile.mkdtemp(prefix="mpp_test_")
+        Database.DATABASE_PATH = os.path.join(scratch_directory, "test.db")
+        try:
+            return test()
+        finally:
+            Database.close_all()
+            Database.DATABASE_PATH = database_path
+
+    """
+    Ensure that the migrations bring a database created before them up to date
+    """
+    def test2() -> bool:
+        def test() -> bool:
+            # the recipe table as it was before the metadata columns
+            connection = sqlite3.connect(Database.DATABASE_PATH)
+            schema.register_functions(connection=connection)
+            connection.execute("CREATE TABLE RECIPE_TABLE ({})".format(", ".join(
+                ["uid TEXT UNIQUE NOT NULL"] + ["{} DEFAULT ''".format(field) for field in RecipeObject.FIELDS[1:]])))
+            connection.execute("INSERT INTO RECIPE_TABLE (uid, name, in_trash) VALUES ('old-uid', 'Old Recipe', 0)")
+            connection.commit()
+
+            status = schema.migrate(connection=connection)
+            version = connection.execute("PRAGMA user_version").fetchone()[0]
+            status = status and (version == schema.SCHEMA_VERSION)
+            # once current, migrating again does nothing
+            status = status and schema.migrate(connection=connection)
+            tables = [row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+            for table in ["RECIPE_CATEGORY", "RECIPE_INGREDIENT", "SYNC_JOURNAL", "SYNC_STATUS"] + \
+                         [table for (table, _) in Database.COLLECTIONS.values()]:
+                status = status and (table in tables)
+            columns = [row[1] for row in connection.execute("PRAGMA table_info(RECIPE_TABLE)")]
+            status = status and ("b_recipe_modified" in columns) and ("ingredients_hash" in columns)
+            connection.close()
+
+            # the recipe made it through, and is readable
+            recipe = Database().read_recipe(uid="old-uid")
+            status = status and (recipe is not None) and (recipe.load("name") == "Old Recipe")
+            return status
+
+        return on_scratch_database(test=test)
+
+    """
+    Write a recipe, as pulled from the server unless modified
+    """
+    def write_test_recipe(database: Database, uid: str, recipe_hash: str, modified=False) -> int:
+        paprika_recipe = RecipeObject()
+        paprika_recipe.store(key="uid", value=uid)
+        paprika_recipe.store(key="name", value="Baked {}".format(uid))
+        paprika_recipe.store(key="hash", value=recipe_hash)
+        paprika_recipe.metadata_is_modified = modified
+        return database.write_recipe(paprika_recipe=paprika_recipe)
+
+    """
+    Ensure that the server listing is diffed against the local hashes,
+    and that trashed recipes are left out of the reads
+    """
+    def test3() -> bool:
+        def test() -> bool:
+            database = Database()
+            for (uid, recipe_hash) in [("same", "h1"), ("changed", "h2"), ("deleted", "h3")]:
+                write_test_recipe(database=database, uid=uid, recipe_hash=recipe_hash)
+            # not pushed yet, so the server does not list it
+            write_test_recipe(database=database, uid="modified", recipe_hash="h4", modified=True)
+
+            diff = database.diff_recipe_hashes(remote_hashes={"same": "h1", "changed": "h2-new", "new": "h5"})
+            status = diff is not None
+            (changed_uids, deleted_uids) = diff
+            status = status and (sorted(changed_uids) == ["changed", "new"]) and (deleted_uids == ["deleted"])
+
+            status = status and (database.trash_recipes(uids=deleted_uids) == Database.Error.ERR_SUCCESS)
+            trashed = database.read_recipe(uid="deleted")
+            status = status and (trashed.load("in_trash") == True) and (trashed.load("hash") == "")
+            status = status and ("deleted" not in [header.uid for header in database.read_recipe_headers()])
+            status = status and ("deleted" in [header.uid for header in database.read_recipe_headers(include_trash=True)])
+            status = status and ("deleted" not in [header.uid for header in database.search(query="baked")])
+
+            # a trashed recipe is not deleted again, and is pulled again if it comes back
+            (changed_uids, deleted_uids) = database.diff_recipe_hashes(remote_hashes={"same": "h1", "deleted": "h3"})
+            status = status and (changed_uids == ["deleted"]) and (sorted(deleted_uids) == ["changed"])
+            return status
+
+        return on_scratch_database(test=test)
+
+    """
+    Ensure that an interrupted sync resumes with the recipes it did not finish
+    """
+    def test4() -> bool:
+        def test() -> bool:
+            database = Database()
+            pending_uids = database.journal_start(command="pull", recipe_hashes={"a": "h1", "b": "h2", "c": "h3"})
+            status = (pending_uids is not None) and (sorted(pending_uids) == ["a", "b", "c"])
+            status = status and (database.journal_mark_done(command="pull", uids=["a", "b"]) == Database.Error.ERR_SUCCESS)
+
+            # interrupted: "b" changed on the server since, "c" is gone and "d" is new
+            pending_uids = database.journal_start(command="pull", recipe_hashes={"a": "h1", "b": "h2-new", "d": "h4"})
+            status = status and (sorted(pending_uids) == ["b", "d"])
+            # the journals of other commands are kept apart
+            status = status and (database.journal_start(command="other", recipe_hashes={"a": "h1"}) == ["a"])
+
+            # finished, the next sync starts over
+            status = status and (database.journal_finish(command="pull") == Database.Error.ERR_SUCCESS)
+            pending_uids = database.journal_start(command="pull", recipe_hashes={"a": "h1", "b": "h2-new"})
+            status = status and (sorted(pending_uids) == ["a", "b"])
+
+            # the app closes in the middle of a pull: the recipes queued on the writer
+            # are still committed, and marked done along with them
+            app_surface = AppSurface()
+            pulling = Database(app_surface=app_surface)
+            recipe_hashes = {"e": "h5", "f": "h6", "g": "h7"}
+            status = status and (sorted(pulling.journal_start(command="pull", recipe_hashes=recipe_hashes)) == ["e", "f", "g"])
+            release = threading.Event()
+            def operation(cursor):
+                release.wait()
+            Database.database_writer().submit_operation(operation=operation)
+            futures = []
+            for uid in ["e", "f"]:
+                paprika_recipe = RecipeObject()
+                paprika_recipe.store(key="uid", value=uid)
+                paprika_recipe.store(key="hash", value=recipe_hashes[uid])
+                futures.append(pulling.write_recipe_async(paprika_recipe=paprika_recipe, journal="pull"))
+            release.set()
+            app_surface.b_app_running = False
+            paprika_recipe = RecipeObject()
+            paprika_recipe.store(key="uid", value="g")
+            status = status and (pulling.write_recipe_async(paprika_recipe=paprika_recipe, journal="pull").result()
+                                 == Database.Error.ERR_APP_SHUTDOWN)
+            status = status and all([future.result() == Database.Error.ERR_SUCCESS for future in futures])
+            # the next run only fetches the recipe that was never written
+            status = status and (Database().journal_start(command="pull", recipe_hashes=recipe_hashes) == ["g"])
+            return status
+
+        return on_scratch_database(test=test)
+
+    """
+    Ensure that the writer commits what is queued together, coalesces
+    repeated writes, and does not hold back a lone write
+    """
+    def test5() -> bool:
+        def test() -> bool:
+            database = Database()
+            writer = Database.database_writer()
+
+            # hold the writer so every recipe below is queued before it drains the queue
+            release = threading.Event()
+            def operation(cursor):
+                release.wait()
+            blocked = writer.submit_operation(operation=operation)
+            futures = []
+            for idx in range(50):
+                paprika_recipe = RecipeObject()
+                paprika_recipe.store(key="uid", value="uid-{}".format(idx % 40))
+                paprika_recipe.store(key="name", value="Recipe {}".format(idx))
+                futures.append(database.write_recipe_async(paprika_recipe=paprika_recipe))
+            (commits, coalesced) = (writer.commits, writer.recipes_coalesced)
+            release.set()
+
+            status = blocked.result() == Database.Error.ERR_SUCCESS
+            status = status and all([future.result() == Database.Error.ERR_SUCCESS for future in futures])
+            # the operation's commit, then one commit for the 40 recipes
+            status = status and (writer.commits - commits == 2) and (writer.recipes_coalesced - coalesced == 10)
+            status = status and (database.read_recipe(uid="uid-0").load("name") == "Recipe 40")
+
+            # a lone write is committed on its own as soon as it is queued, not held for a batch
+            commits = writer.commits
+            for idx in range(50):
+                write_test_recipe(database=database, uid="sequential-{}".format(idx), recipe_hash="h")
+                status = status and (writer.commits == commits + idx + 1)
+            return status
+
+        return on_scratch_database(test=test)
+
+    TestList = [test0, test1, test2, test3, test4, test5]
     SuccessCount = 0
 
     for test in TestList:
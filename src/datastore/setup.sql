@@ -1,5 +1,9 @@
 --
 -- References root: https://www.sqlite.org/doclist.html
+--
+-- NOTE: database.py applies the schema automatically through the
+-- versioned migrations in schema.py, this file mirrors the latest
+-- schema for manual setup & inspection.
 
 -- Create the recipe table
 -- Ref. https://www.sqlite.org/lang_createtable.html
@@ -9,26 +13,26 @@ CREATE TABLE IF NOT EXISTS RECIPE_TABLE (
     rating          INT     DEFAULT 0,
     photo_hash      TEXT    DEFAULT "",
     on_favorites    INT     DEFAULT 0, -- False
-    photo           TEXT    DEFAULT "",
+    photo           TEXT    DEFAULT "", -- or zlib compressed BLOB
     scale           TEXT    DEFAULT "",
-    ingredients     TEXT    DEFAULT "",
+    ingredients     TEXT    DEFAULT "", -- or zlib compressed BLOB
     is_pinned       INT     DEFAULT 0, -- False
     source          TEXT    DEFAULT "",
     total_time      TEXT    DEFAULT "",
     hash            TEXT    DEFAULT "",
-    description     TEXT    DEFAULT "",
+    description     TEXT    DEFAULT "", -- or zlib compressed BLOB
     source_url      TEXT    DEFAULT "",
     difficulty      TEXT    DEFAULT "",
     on_grocery_list INT     DEFAULT 0, -- False
     in_trash        INT     DEFAULT 0, -- False
-    directions      TEXT    DEFAULT "",
+    directions      TEXT    DEFAULT "", -- or zlib compressed BLOB
     categories      TEXT    DEFAULT "", -- JSON list of categories
     photo_url       TEXT    DEFAULT "", -- Originally None
     cook_time       TEXT    DEFAULT "",
     name            TEXT    DEFAULT "",
     created         TEXT    DEFAULT "",
-    notes           TEXT    DEFAULT "",
-    photo_large     TEXT    DEFAULT "", -- Originally None
+    notes           TEXT    DEFAULT "", -- or zlib compressed BLOB
+    photo_large     TEXT    DEFAULT "", -- Originally None, or zlib compressed BLOB
     image_url       TEXT    DEFAULT "",
     prep_time       TEXT    DEFAULT "",
     servings        TEXT    DEFAULT "",
@@ -36,16 +40,149 @@ CREATE TABLE IF NOT EXISTS RECIPE_TABLE (
     -- Metadata for database management
     -- NOT a part of the recipe
     b_has_nutritional_info  INT    DEFAULT 0, -- False
-    b_recipe_modified       INT    DEFAULT 0  -- False    
+    b_recipe_modified       INT    DEFAULT 0, -- False    
+    ingredients_hash        TEXT              -- hash the RECIPE_INGREDIENT rows were parsed at
 );
 
--- Create the meals table
--- Meals are one or more recipes
-CREATE TABLE IF NOT EXISTS MEAL_TABLE (
-    -- locally created ID
-    id TEXT NOT NULL
+-- Indexes for the columns that are filtered on
+-- the metadata flags use partial indexes, only the few flagged rows are indexed
+-- Ref. https://www.sqlite.org/partialindex.html
+CREATE INDEX IF NOT EXISTS RECIPE_BY_HASH ON RECIPE_TABLE (uid, hash);
+CREATE INDEX IF NOT EXISTS RECIPE_BY_NAME ON RECIPE_TABLE (name);
+CREATE INDEX IF NOT EXISTS RECIPE_BY_TRASH ON RECIPE_TABLE (in_trash);
+CREATE INDEX IF NOT EXISTS RECIPE_MODIFIED ON RECIPE_TABLE (uid) WHERE b_recipe_modified = 1;
+CREATE INDEX IF NOT EXISTS RECIPE_MISSING_NUTRITION ON RECIPE_TABLE (uid) WHERE b_has_nutritional_info = 0;
+
+-- Create the recipe category index
+-- One row per (recipe, category), mirrors the RECIPE_TABLE.categories JSON list
+-- so recipes can be filtered by category without decoding every row
+-- Ref. https://www.sqlite.org/withoutrowid.html
+CREATE TABLE IF NOT EXISTS RECIPE_CATEGORY (
+    uid         TEXT    NOT NULL,
+    category    TEXT    NOT NULL,
+    PRIMARY KEY (uid, category)
+) WITHOUT ROWID;
+
+-- Ref. https://www.sqlite.org/lang_createindex.html
+CREATE INDEX IF NOT EXISTS RECIPE_CATEGORY_BY_CATEGORY ON RECIPE_CATEGORY (category, uid);
+
+-- Create the recipe full-text search index
+-- Contentless, since recipe text columns may hold zlib compressed BLOBs.
+-- The triggers call mpp_text(), an application defined function that
+-- database.py registers on its connections (see schema.register_functions).
+-- REQUIRED: any connection without it, such as the sqlite3 CLI, fails every
+-- INSERT/UPDATE/DELETE on RECIPE_TABLE with "no such function: mpp_text".
+-- For manual edits, drop the triggers first:
+--     DROP TRIGGER RECIPE_SEARCH_INSERT;
+--     DROP TRIGGER RECIPE_SEARCH_DELETE;
+--     DROP TRIGGER RECIPE_SEARCH_UPDATE;
+-- then run cmd_rebuild_search in app_cmd.py (Database.rebuild_search_index),
+-- which puts the triggers back and re-indexes every recipe.
+-- Ref. https://www.sqlite.org/fts5.html#contentless_tables
+CREATE VIRTUAL TABLE IF NOT EXISTS RECIPE_SEARCH USING fts5 (
+    name, ingredients, directions, notes,
+    content=''
 );
 
+-- Ref. https://www.sqlite.org/lang_createtrigger.html
+CREATE TRIGGER IF NOT EXISTS RECIPE_SEARCH_INSERT AFTER INSERT ON RECIPE_TABLE BEGIN
+    INSERT INTO RECIPE_SEARCH (rowid, name, ingredients, directions, notes)
+        VALUES (new.rowid, mpp_text(new.name), mpp_text(new.ingredients), mpp_text(new.directions), mpp_text(new.notes));
+END;
+
+CREATE TRIGGER IF NOT EXISTS RECIPE_SEARCH_DELETE AFTER DELETE ON RECIPE_TABLE BEGIN
+    INSERT INTO RECIPE_SEARCH (RECIPE_SEARCH, rowid, name, ingredients, directions, notes)
+        VALUES ('delete', old.rowid, mpp_text(old.name), mpp_text(old.ingredients), mpp_text(old.directions), mpp_text(old.notes));
+END;
+
+CREATE TRIGGER IF NOT EXISTS RECIPE_SEARCH_UPDATE AFTER UPDATE OF name, ingredients, directions, notes ON RECIPE_TABLE BEGIN
+    INSERT INTO RECIPE_SEARCH (RECIPE_SEARCH, rowid, name, ingredients, directions, notes)
+        VALUES ('delete', old.rowid, mpp_text(old.name), mpp_text(old.ingredients), mpp_text(old.directions), mpp_text(old.notes));
+    INSERT INTO RECIPE_SEARCH (rowid, name, ingredients, directions, notes)
+        VALUES (new.rowid, mpp_text(new.name), mpp_text(new.ingredients), mpp_text(new.directions), mpp_text(new.notes));
+END;
+
+-- Create the parsed ingredient table
+-- One row per ingredient line, parsed by data/ingredient.py when the recipe is written
+CREATE TABLE IF NOT EXISTS RECIPE_INGREDIENT (
+    uid             TEXT    NOT NULL,
+    position        INT     NOT NULL, -- line number in RECIPE_TABLE.ingredients
+    section         TEXT,             -- e.g. "FOR THE CRUST"
+    text            TEXT    NOT NULL, -- the line as written
+    quantity        REAL,
+    quantity_max    REAL,             -- upper end of a range, e.g. 2-3
+    unit            TEXT,
+    item            TEXT    NOT NULL,
+    recipe_ref      TEXT,             -- name in [recipe:...]
+    note            TEXT,
+    PRIMARY KEY (uid, position)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS RECIPE_INGREDIENT_BY_ITEM ON RECIPE_INGREDIENT (item COLLATE NOCASE, uid);
+CREATE INDEX IF NOT EXISTS RECIPE_INGREDIENT_BY_RECIPE_REF ON RECIPE_INGREDIENT (recipe_ref)
+    WHERE recipe_ref IS NOT NULL;
+
+-- Create the sync journal
+-- Progress of the running sync, so an interrupted sync resumes where it stopped
+CREATE TABLE IF NOT EXISTS SYNC_JOURNAL (
+    command     TEXT    NOT NULL, -- e.g. "pull_recipes"
+    uid         TEXT    NOT NULL,
+    hash        TEXT,             -- hash listed by the server
+    done        INT     DEFAULT 0, -- False
+    PRIMARY KEY (command, uid)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS SYNC_JOURNAL_PENDING ON SYNC_JOURNAL (command, uid) WHERE done = 0;
+
+-- Create the synced paprika collections
+-- hash is of the item as the server sent it, so only changed items are written
+CREATE TABLE IF NOT EXISTS CATEGORY_TABLE (
+    uid         TEXT    NOT NULL PRIMARY KEY,
+    name        TEXT    DEFAULT "",
+    parent_uid  TEXT,
+    order_flag  INT     DEFAULT 0,
+    hash        TEXT
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS CATEGORY_BY_NAME ON CATEGORY_TABLE (name COLLATE NOCASE);
+
+-- Meals planned in paprika, one recipe per meal
+CREATE TABLE IF NOT EXISTS MEAL_TABLE (
+    uid         TEXT    NOT NULL PRIMARY KEY,
+    recipe_uid  TEXT,
+    date        TEXT    DEFAULT "", -- e.g. "2023-01-01 00:00:00"
+    type        INT     DEFAULT 0, -- 0 breakfast, 1 lunch, 2 dinner, 3 snack
+    name        TEXT    DEFAULT "",
+    order_flag  INT     DEFAULT 0,
+    hash        TEXT
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS MEAL_BY_DATE ON MEAL_TABLE (date);
+CREATE INDEX IF NOT EXISTS MEAL_BY_RECIPE ON MEAL_TABLE (recipe_uid);
+
+CREATE TABLE IF NOT EXISTS GROCERY_TABLE (
+    uid         TEXT    NOT NULL PRIMARY KEY,
+    recipe_uid  TEXT,
+    name        TEXT    DEFAULT "",
+    ingredient  TEXT    DEFAULT "",
+    aisle       TEXT    DEFAULT "",
+    purchased   INT     DEFAULT 0, -- False
+    order_flag  INT     DEFAULT 0,
+    hash        TEXT
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS GROCERY_BY_RECIPE ON GROCERY_TABLE (recipe_uid);
+
+CREATE TABLE IF NOT EXISTS BOOKMARK_TABLE (
+    uid         TEXT    NOT NULL PRIMARY KEY,
+    recipe_uid  TEXT,
+    title       TEXT    DEFAULT "",
+    url         TEXT    DEFAULT "",
+    order_flag  INT     DEFAULT 0,
+    hash        TEXT
+) WITHOUT ROWID;
+
+-- /sync/status change counter of each collection at its last sync
+CREATE TABLE IF NOT EXISTS SYNC_STATUS (
+    collection  TEXT    NOT NULL PRIMARY KEY, -- e.g. "meals"
+    counter     INT
+) WITHOUT ROWID;
+
 -- Insert some fake values in
 -- Ref. https://www.sqlite.org/lang_insert.html
 -- Ref. https://www.sqlite.org/lang_delete.html
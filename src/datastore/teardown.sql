@@ -4,4 +4,16 @@
 
 -- Ref. https://www.sqlite.org/lang_droptable.html
 DROP TABLE IF EXISTS RECIPE_TABLE;
-DROP TABLE IF EXISTS MEAL_TABLE;
\ No newline at end of file
+DROP TABLE IF EXISTS MEAL_TABLE;
+DROP TABLE IF EXISTS RECIPE_CATEGORY;
+DROP TABLE IF EXISTS RECIPE_SEARCH;
+DROP TABLE IF EXISTS RECIPE_INGREDIENT;
+DROP TABLE IF EXISTS SYNC_JOURNAL;
+DROP TABLE IF EXISTS CATEGORY_TABLE;
+DROP TABLE IF EXISTS GROCERY_TABLE;
+DROP TABLE IF EXISTS BOOKMARK_TABLE;
+DROP TABLE IF EXISTS SYNC_STATUS;
+
+-- Reset the schema version so the migrations run again
+-- Ref. https://www.sqlite.org/pragma.html#pragma_user_version
+PRAGMA user_version = 0;
@@ -1,14 +1,113 @@
+import json
+import logging
+import sys
+
 ## CONFIGURATIONS
 APP__CONFIG__DEBUG_PRINT = True
 APP__CONFIG__RECIPE_AGENT__UNIT_TEST = False
 APP__CONFIG__DATABASE__UNIT_TEST = False
 APP__CONFIG__NUTRITION_AGENT__UNIT_TEST = False
 APP__CONFIG__MEAL_SCHEDULER_AGENT__UNIT_TEST = False
+# recipe cache in front of the database (0 disables the cache)
+APP__CONFIG__DATABASE__CACHE_MAX_RECIPES = 2048
+APP__CONFIG__DATABASE__CACHE_MAX_BYTES = 64 * 1024 * 1024
+# zlib compress large recipe text columns when they are written
+APP__CONFIG__DATABASE__COMPRESS_TEXT = False
+APP__CONFIG__DATABASE__COMPRESS_MIN_BYTES = 1024
+# concurrent requests to paprika, also the size of the keep-alive connection pool
+APP__CONFIG__RECIPE_AGENT__FETCH_CONCURRENCY = 8
+# asyncio sync engine (recipe_sync.py): request rate limit, open requests,
+# and pulled recipes allowed to wait on the database writer
+APP__CONFIG__RECIPE_SYNC__REQUESTS_PER_SECOND = 10
+APP__CONFIG__RECIPE_SYNC__BURST = 20
+APP__CONFIG__RECIPE_SYNC__MAX_IN_FLIGHT = 32
+APP__CONFIG__RECIPE_SYNC__MAX_PENDING_WRITES = 400
+# photo cache (photo_cache.py): where the photos are kept, size cap (least recently
+# used photos are removed past it) and concurrent photo downloads
+APP__CONFIG__PHOTO_CACHE__DIRECTORY = "./datastore/photos"
+APP__CONFIG__PHOTO_CACHE__MAX_BYTES = 512 * 1024 * 1024
+APP__CONFIG__PHOTO_CACHE__DOWNLOAD_CONCURRENCY = 4
+# logging (see get_logger): level of every module, None for DEBUG if
+# APP__CONFIG__DEBUG_PRINT is set and nothing at all otherwise (as dbgPrint
+# did), per module levels (e.g. {"database": "DEBUG"}), and a file to also
+# write JSON lines to
+APP__CONFIG__LOG_LEVEL = None
+APP__CONFIG__LOG_MODULES = {}
+APP__CONFIG__LOG_JSON_PATH = None
+
+## Logging
+# every app logger is a child of this one
+LOGGER_ROOT = "mpp"
+# above every level, nothing is logged
+LOGGER_SILENT = logging.CRITICAL + 1
+# module loggers given a level by the last configure_logging
+LOGGER_OVERRIDES = []
+LOGGER_CONFIGURED = False
+
+"""
+JSON Lines Formatter
+
+One JSON object per record: time, level, module, message, and the
+fields passed as extra={"fields": {...}}
+"""
+class JsonLinesFormatter (logging.Formatter):
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": record.created,
+            "level": record.levelname,
+            "module": record.name[len(LOGGER_ROOT) + 1:],
+            "message": record.getMessage(),
+        }
+        fields = getattr(record, "fields", None)
+        if type(fields) is dict:
+            entry.update(fields)
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
 
-## Utility Functions
 """
-Wrapper around print to only print when configured
+Applies the APP__CONFIG__LOG_* configuration, call again after changing it.
+"""
+def configure_logging() -> None:
+    global LOGGER_CONFIGURED, LOGGER_OVERRIDES
+    root = logging.getLogger(LOGGER_ROOT)
+    level = APP__CONFIG__LOG_LEVEL
+    if level is None:
+        level = logging.DEBUG if APP__CONFIG__DEBUG_PRINT == True else LOGGER_SILENT
+    root.setLevel(level)
+    # the app logs are not mixed into the logs of other libraries
+    root.propagate = False
+
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+    console = logging.StreamHandler(stream=sys.stdout)
+    console.setFormatter(logging.Formatter("[%(levelname)s] %(message)s"))
+    root.addHandler(console)
+    if APP__CONFIG__LOG_JSON_PATH is not None:
+        json_lines = logging.FileHandler(APP__CONFIG__LOG_JSON_PATH, encoding="utf-8")
+        json_lines.setFormatter(JsonLinesFormatter())
+        root.addHandler(json_lines)
+
+    for name in LOGGER_OVERRIDES:
+        logging.getLogger(name).setLevel(logging.NOTSET)
+    LOGGER_OVERRIDES = []
+    for (module, module_level) in APP__CONFIG__LOG_MODULES.items():
+        name = "{}.{}".format(LOGGER_ROOT, module)
+        logging.getLogger(name).setLevel(module_level)
+        LOGGER_OVERRIDES.append(name)
+
+    LOGGER_CONFIGURED = True
+
+"""
+Logger of a module, e.g. log = mpp_utils.get_logger(__name__)
+
+Arguments are only formatted when the level is enabled, so pass them
+separately: log.debug("Recipe Count: %s", count). For arguments that are
+costly to build, check log.isEnabledFor(logging.DEBUG) first.
 """
-def dbgPrint(message):
-    if APP__CONFIG__DEBUG_PRINT == True:
-        print("[DEBUG] {}".format(message))
\ No newline at end of file
+def get_logger(module: str) -> logging.Logger:
+    if LOGGER_CONFIGURED is False:
+        configure_logging()
+    return logging.getLogger("{}.{}".format(LOGGER_ROOT, module))
@@ -14,11 +14,14 @@ from typing import Any
 import time
 import mpp_utils
 from data.surface import AppSurface
+from data.ingredient import Ingredient
 from database import Database
 
 # for testing purposes
 from recipe_agent import *
 
+log = mpp_utils.get_logger(__name__)
+
 """
 Edmam
 
@@ -74,7 +77,7 @@ class NutritionAgent(threading.Thread):
 
     def __init__(self, app_surface: AppSurface, force_update=False) -> None:
         super().__init__(group=None, target=None, name=None, args=(), kwargs={}, daemon=None)
-        self.database = Database()
+        self.database = Database(app_surface=app_surface)
         self.app_surface = app_surface
         self.status = NutritionAgent.Error.ERR_GENERIC
         self.force_update = force_update
@@ -102,20 +105,20 @@ class NutritionAgent(threading.Thread):
         nutritional_info = NutritionalInfo()
 
         if debug is True:
-            mpp_utils.dbgPrint(paprika_recipe)
+            log.debug("%s", paprika_recipe)
 
         if paprika_recipe is None:
             return NutritionAgent.Error.ERR_GENERIC
         
         ## extract ingredients
-        # load string
-        ingredients_as_str = paprika_recipe.load(key="ingredients")
-        # split by newline
-        ingredient_list = ingredients_as_str.split('\n')
+        # parsed when the recipe was written, parse here only if they are missing
+        ingredient_list = self.database.read_recipe_ingredients(uid=paprika_recipe.load(key="uid"))
+        if not ingredient_list:
+            ingredient_list = Ingredient.parse_all(ingredients=paprika_recipe.load(key="ingredients"))
         TotalIngredients = len(ingredient_list)
 
         # iterate through the ingredients
-        for element in ingredient_list:
+        for ingredient in ingredient_list:
             TotalIngredients += 1
             b_ingredient_found = False
 
@@ -128,16 +131,12 @@ class NutritionAgent(threading.Thread):
             ##
             ## Ingredient is recipe: (can have spaces)
             ## 2 tbsp [recipe:Persillade and something]
-            # use regex to determine if ingredient is a recipe
-            expression = '\[recipe\:(\w|\s|-)*\]'
-            recipe_match = re.search(expression, element)
-            if recipe_match is not None:
+            if ingredient.recipe_ref is not None:
                 b_ingredient_found = True
                 IngredientsFound += 1
                 continue
 
-            # split by spaces
-            ingredient = element.split(" ")
+            # quantity, unit & item are already split out
             ##
             ## INGREDIENT LOOKUP ALGORITHM
             ##
@@ -153,7 +152,7 @@ class NutritionAgent(threading.Thread):
                 IngredientsFound += 1 
 
         if debug is True:
-            mpp_utils.dbgPrint("Found {}/{} ingredients".format(IngredientsFound, TotalIngredients))
+            log.debug("Found %s/%s ingredients", IngredientsFound, TotalIngredients)
 
         # store nutritional information in recipe
         paprika_recipe.store(key="nutritional_info", value=str(nutritional_info))
@@ -171,25 +170,22 @@ class NutritionAgent(threading.Thread):
         Iterate through all of the recipes. Update nutritional 
         information as necessary.
         """
-        uid_list = self.database.pull_recipe_list()
-
-        if uid_list is None:
-            return NutritionAgent.Error.ERR_GENERIC
-        
         if debug is True:
-            mpp_utils.dbgPrint("Nutritional Agent Recipe (UPDATE PASS)")
-            mpp_utils.dbgPrint("UIDs counted: {}".format(len(uid_list)))
-
-        # iterate through uids
-        for item in uid_list:
-            uid = item[0]
-            # calculate the nutritional information
-            paprika_recipe = self.database.read_recipe(uid=uid)
+            log.debug("Nutritional Agent Recipe (UPDATE PASS)")
+
+        # only the recipes without nutritional info, unless forcing an update
+        if self.force_update is True:
+            recipes = self.database.iter_recipes()
+        else:
+            recipes = self.database.iter_recipes_missing_nutrition()
+
+        for paprika_recipe in recipes:
+            uid = paprika_recipe.load(key="uid")
             # check for force update & if recipe has nutritional info
             if (self.force_update is True) or (not paprika_recipe.metadata_has_nutritional_info):
                 # outputting debug information
                 if debug is True:
-                    mpp_utils.dbgPrint("<uid: {}, force_update: {}, has nutritional info: {}".format(uid, self.force_update, paprika_recipe.metadata_has_nutritional_info))
+                    log.debug("<uid: %s, force_update: %s, has nutritional info: %s", uid, self.force_update, paprika_recipe.metadata_has_nutritional_info)
                 # calculate the hash value
                 self.__calculate_nutritional_info(paprika_recipe=paprika_recipe, debug=debug)
                 # print(paprika_recipe.load(key="nutritional_info"))
@@ -199,7 +195,7 @@ class NutritionAgent(threading.Thread):
         return NutritionAgent.Error.ERR_SUCCESS
 
     def run(self) -> None:
-        mpp_utils.dbgPrint("Running Nutritional Agent")
+        log.debug("Running Nutritional Agent")
 
         # confirm that the app surface is real
         if (type(self.app_surface) is not AppSurface) or (self.app_surface is None):
@@ -222,11 +218,11 @@ class NutritionAgent(threading.Thread):
                 self.__recipe_update_pass(debug=True)
             time.sleep(60)
         else:
-            mpp_utils.dbgPrint("Nutritional Agent FINAL PASS")
+            log.debug("Nutritional Agent FINAL PASS")
             self.__recipe_update_pass(debug=True)
             pass
         
-        mpp_utils.dbgPrint("Nutritional Agent COMPLETED")
+        log.debug("Nutritional Agent COMPLETED")
 
         # set surface
         self.app_surface.surface_lock.acquire()
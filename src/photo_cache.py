@@ -0,0 +1,349 @@
+##
+## Local copy of the recipe photos, addressed by the recipe's photo_hash.
+## Recipes sharing a photo share the file, and a file never changes once
+## written, so it can be served with a long cache lifetime.
+##
+## Layout: <directory>/ab/cd/abcd...ef.jpg, with thumbnails next to it
+## as abcd...ef.<variant>.jpg
+##
+
+import os
+import re
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import requests
+
+# pip install pillow (optional, thumbnails are not made without it)
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# App packages
+import mpp_utils
+from recipe_agent import FetchEngine
+
+log = mpp_utils.get_logger(__name__)
+
+
+"""
+Photo Cache
+
+Size bounded LRU cache of photo files on disk. The index (hash -> bytes
+on disk) is rebuilt from the files the first time it is needed, in
+order of last use (file modification time, touched on each get).
+
+    photo_cache = PhotoCache()
+    photo_cache.sync(database=database)
+    path = photo_cache.get(photo_hash=recipe.load("photo_hash"), variant="small")
+"""
+class PhotoCache (object):
+
+    EXTENSION = ".jpg"
+    # variant -> longest side of the thumbnail, in pixels
+    THUMBNAIL_SIZES = {"small": 160, "medium": 480}
+    THUMBNAIL_QUALITY = 85
+    # cache lifetime of a served photo, the file behind a hash never changes
+    MAX_AGE_SECONDS = 365 * 24 * 60 * 60
+    # photo_hash is a SHA256, kept lower case on disk
+    HASH_EXPRESSION = re.compile(r"^[0-9a-f]{64}$")
+
+    def __init__(self, directory=None, max_bytes=None, concurrency=None) -> None:
+        self.directory = directory or mpp_utils.APP__CONFIG__PHOTO_CACHE__DIRECTORY
+        self.max_bytes = max_bytes or mpp_utils.APP__CONFIG__PHOTO_CACHE__MAX_BYTES
+        self.concurrency = concurrency or mpp_utils.APP__CONFIG__PHOTO_CACHE__DOWNLOAD_CONCURRENCY
+        self.cache_lock = threading.Lock()
+        # hash -> bytes of the photo & its thumbnails, least recently used first
+        self.entries = None
+        self.total_bytes = 0
+        # stats
+        self.hits = 0
+        self.misses = 0
+        self.downloads = 0
+        self.evictions = 0
+
+    @staticmethod
+    def normalize(photo_hash):
+        """
+        @retval str: the hash as used on disk
+        @retval None: not a photo hash (also keeps paths inside the cache directory)
+        """
+        if type(photo_hash) is not str:
+            return None
+        photo_hash = photo_hash.strip().lower()
+        if PhotoCache.HASH_EXPRESSION.match(photo_hash) is None:
+            return None
+        return photo_hash
+
+    def path(self, photo_hash: str, variant=None) -> str:
+        """
+        @param photo_hash: a normalized hash
+        @param variant: a THUMBNAIL_SIZES key, None for the photo itself
+        @retval str: where the file is kept
+        """
+        name = photo_hash if variant is None else "{}.{}".format(photo_hash, variant)
+        return os.path.join(self.directory, photo_hash[0:2], photo_hash[2:4], name + PhotoCache.EXTENSION)
+
+    def __variant_paths(self, photo_hash: str) -> list:
+        return [self.path(photo_hash=photo_hash)] + \
+               [self.path(photo_hash=photo_hash, variant=variant) for variant in PhotoCache.THUMBNAIL_SIZES.keys()]
+
+    def __size_on_disk(self, photo_hash: str) -> int:
+        size = 0
+        for path in self.__variant_paths(photo_hash=photo_hash):
+            try:
+                size += os.path.getsize(path)
+            except OSError:
+                pass
+        return size
+
+    def __load(self) -> None:
+        """
+        Builds the index from the files on disk, call with cache_lock held
+        """
+        if self.entries is not None:
+            return
+        # hash -> [bytes, last used]
+        found = {}
+        for (root, _, files) in os.walk(self.directory):
+            for name in files:
+                if not name.endswith(PhotoCache.EXTENSION):
+                    continue
+                photo_hash = PhotoCache.normalize(name.split(".")[0])
+                if photo_hash is None:
+                    continue
+                stat = os.stat(os.path.join(root, name))
+                entry = found.setdefault(photo_hash, [0, 0.0])
+                entry[0] += stat.st_size
+                entry[1] = max(entry[1], stat.st_mtime)
+
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        for (photo_hash, (size, _)) in sorted(found.items(), key=lambda item: item[1][1]):
+            self.entries[photo_hash] = size
+            self.total_bytes += size
+
+    def __evict(self) -> None:
+        """
+        Removes the least recently used photos until the cache fits max_bytes,
+        call with cache_lock held
+        """
+        while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+            (photo_hash, size) = self.entries.popitem(last=False)
+            self.total_bytes -= size
+            self.evictions += 1
+            for path in self.__variant_paths(photo_hash=photo_hash):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def __update(self, photo_hash: str) -> None:
+        """
+        Records the current size of a photo & its thumbnails as most recently used
+        """
+        size = self.__size_on_disk(photo_hash=photo_hash)
+        with self.cache_lock:
+            self.__load()
+            self.total_bytes += size - self.entries.pop(photo_hash, 0)
+            self.entries[photo_hash] = size
+            self.__evict()
+
+    def contains(self, photo_hash) -> bool:
+        photo_hash = PhotoCache.normalize(photo_hash)
+        if photo_hash is None:
+            return False
+        with self.cache_lock:
+            self.__load()
+            return photo_hash in self.entries
+
+    def get(self, photo_hash, variant=None):
+        """
+        @param variant: a THUMBNAIL_SIZES key, None for the photo itself
+        @retval str: path of the cached file
+        @retval None: the photo (or the thumbnail) is not cached
+        """
+        photo_hash = PhotoCache.normalize(photo_hash)
+        if photo_hash is None or (variant is not None and variant not in PhotoCache.THUMBNAIL_SIZES):
+            return None
+
+        path = self.path(photo_hash=photo_hash, variant=variant)
+        with self.cache_lock:
+            self.__load()
+            if photo_hash not in self.entries or not os.path.exists(path):
+                self.misses += 1
+                return None
+            self.entries.move_to_end(photo_hash)
+            self.hits += 1
+        try:
+            # the modification time is the last use when the index is rebuilt
+            os.utime(path)
+        except OSError:
+            pass
+        return path
+
+    def put(self, photo_hash, content: bytes):
+        """
+        Stores a photo, written to a temporary file first so a reader
+        never sees a partial photo
+
+        @retval str: path of the cached file
+        @retval None: not a photo hash, or unable to write
+        """
+        photo_hash = PhotoCache.normalize(photo_hash)
+        if photo_hash is None:
+            return None
+
+        path = self.path(photo_hash=photo_hash)
+        scratch_path = "{}.{}.tmp".format(path, threading.get_ident())
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(scratch_path, "wb") as photo_file:
+                photo_file.write(content)
+            os.replace(scratch_path, path)
+        except OSError as e:
+            log.warning("[%s] unable to store the photo: %s", photo_hash, e)
+            return None
+
+        self.__update(photo_hash=photo_hash)
+        return path
+
+    def fetch(self, photos: dict, fetch_engine=None) -> list:
+        """
+        Downloads the photos that are not cached yet, concurrently. A recipe
+        whose photo changed has a new hash, so only it is downloaded again.
+
+        @param photos: photo_hash -> url
+        @param fetch_engine: FetchEngine to download with, None for one of self.concurrency workers
+        @retval list: hashes of the photos downloaded
+        """
+        pending = {}
+        for (photo_hash, url) in photos.items():
+            photo_hash = PhotoCache.normalize(photo_hash)
+            if photo_hash is not None and url and not self.contains(photo_hash=photo_hash):
+                pending[photo_hash] = url
+        if len(pending) == 0:
+            return []
+
+        engine = fetch_engine or FetchEngine(auth_info=None, concurrency=self.concurrency)
+
+        def download(photo_hash):
+            # one unreachable photo must not stop the others
+            try:
+                response = engine.get(pending[photo_hash])
+            except requests.RequestException as e:
+                log.warning("[%s] photo download failed: %s", photo_hash, e)
+                return None
+            if response.status_code != 200:
+                log.debug("[%s] photo download Status(%s)", photo_hash, response.status_code)
+                return None
+            return self.put(photo_hash=photo_hash, content=response.content)
+
+        downloaded = []
+        try:
+            for (photo_hash, path) in engine.run(fetch=download, items=pending.keys()):
+                if path is not None:
+                    downloaded.append(photo_hash)
+        except Exception as e:
+            log.warning("photo download failed: %s", e)
+        finally:
+            if fetch_engine is None:
+                engine.close()
+
+        with self.cache_lock:
+            self.downloads += len(downloaded)
+        return downloaded
+
+    @staticmethod
+    def write_thumbnails(job) -> bool:
+        """
+        Makes the thumbnails of one photo, run in the make_thumbnails workers
+
+        @param job: (photo path, [(thumbnail path, longest side), ...])
+        @retval bool: True if the thumbnails were written
+        """
+        (source_path, thumbnails) = job
+        try:
+            with Image.open(source_path) as photo:
+                photo = photo.convert("RGB")
+                for (thumbnail_path, size) in thumbnails:
+                    thumbnail = photo.copy()
+                    thumbnail.thumbnail((size, size))
+                    scratch_path = "{}.{}.tmp".format(thumbnail_path, os.getpid())
+                    thumbnail.save(scratch_path, format="JPEG", quality=PhotoCache.THUMBNAIL_QUALITY)
+                    os.replace(scratch_path, thumbnail_path)
+        except Exception:
+            return False
+        return True
+
+    def make_thumbnails(self, photo_hashes=None, max_workers=None) -> int:
+        """
+        Makes the missing thumbnails in a process pool, each one only once
+
+        @param photo_hashes: photos to make thumbnails of, None for every cached photo
+        @param max_workers: size of the process pool, None for the number of CPUs
+        @retval int: number of photos that got new thumbnails
+        """
+        if Image is None:
+            log.warning("pillow is not installed, no thumbnails are made")
+            return 0
+
+        if photo_hashes is None:
+            with self.cache_lock:
+                self.__load()
+                photo_hashes = list(self.entries.keys())
+
+        jobs = []
+        for photo_hash in photo_hashes:
+            photo_hash = PhotoCache.normalize(photo_hash)
+            if photo_hash is None or not os.path.exists(self.path(photo_hash=photo_hash)):
+                continue
+            thumbnails = [(self.path(photo_hash=photo_hash, variant=variant), size)
+                          for (variant, size) in PhotoCache.THUMBNAIL_SIZES.items()
+                          if not os.path.exists(self.path(photo_hash=photo_hash, variant=variant))]
+            if len(thumbnails) > 0:
+                jobs.append((photo_hash, (self.path(photo_hash=photo_hash), thumbnails)))
+        if len(jobs) == 0:
+            return 0
+
+        # spawn, the callers are threads and fork does not mix well with them
+        with ProcessPoolExecutor(max_workers=max_workers,
+                                 mp_context=multiprocessing.get_context("spawn")) as pool:
+            results = list(pool.map(PhotoCache.write_thumbnails, [job for (_, job) in jobs], chunksize=4))
+
+        made = 0
+        for ((photo_hash, _), written) in zip(jobs, results):
+            if written is True:
+                self.__update(photo_hash=photo_hash)
+                made += 1
+        return made
+
+    def sync(self, database, fetch_engine=None) -> int:
+        """
+        Downloads the photos of the recipes in the database that are not
+        cached yet, and makes their thumbnails
+
+        @retval int: number of photos downloaded
+        @retval None: unable to read the recipe photos
+        """
+        photos = database.read_recipe_photos()
+        if photos is None:
+            return None
+        downloaded = self.fetch(photos=photos, fetch_engine=fetch_engine)
+        self.make_thumbnails(photo_hashes=downloaded)
+        return len(downloaded)
+
+    def stats(self) -> dict:
+        with self.cache_lock:
+            self.__load()
+            return {
+                "photos": len(self.entries),
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "downloads": self.downloads,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,163 @@
+##
+## Staged pipeline: each stage has its own worker threads and a bounded
+## input queue, so stages overlap and the slowest stage sets the pace.
+## A full queue blocks the stage before it (backpressure).
+##
+
+import queue
+import threading
+import time
+
+# App packages
+import mpp_utils
+
+log = mpp_utils.get_logger(__name__)
+
+
+"""
+Pipeline Stage
+
+One step of a Pipeline, function(item) runs on each of the stage
+workers. Returning None drops the item.
+"""
+class PipelineStage (object):
+
+    def __init__(self, name: str, function, workers: int, queue_size: int) -> None:
+        self.name = name
+        self.function = function
+        self.workers = max(1, workers)
+        self.input_queue = queue.Queue(maxsize=queue_size)
+        self.stats_lock = threading.Lock()
+        # workers still running, the last one to finish stops the next stage
+        self.running_workers = self.workers
+        # stats
+        self.processed = 0
+        self.dropped = 0
+        self.failed = 0
+        self.busy_seconds = 0.0
+        self.max_queue_depth = 0
+
+    def stats(self) -> dict:
+        """
+        @retval dict: counters of the stage, items/second is per busy worker second
+        """
+        with self.stats_lock:
+            return {
+                "workers": self.workers,
+                "processed": self.processed,
+                "dropped": self.dropped,
+                "failed": self.failed,
+                "busy_seconds": round(self.busy_seconds, 3),
+                "items_per_second": round(self.processed / self.busy_seconds, 1) if self.busy_seconds > 0 else 0.0,
+                "queue_depth": self.input_queue.qsize(),
+                "max_queue_depth": self.max_queue_depth,
+            }
+
+"""
+Pipeline
+
+    pipeline = Pipeline(name="pull")
+    pipeline.add_stage(name="fetch", function=fetch, workers=8)
+    pipeline.add_stage(name="parse", function=parse, workers=2)
+    pipeline.run(items=uids, should_continue=lambda: app_surface.b_app_running)
+
+Items go through the stages in order. The output of the last stage is
+discarded, use it for side effects (e.g. recording progress).
+"""
+class Pipeline (object):
+
+    # marks the end of the items on a stage queue, one per worker
+    STOP = object()
+    DEFAULT_QUEUE_SIZE = 64
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.stages = []
+
+    def add_stage(self, name: str, function, workers=1, queue_size=None) -> None:
+        if queue_size is None:
+            queue_size = Pipeline.DEFAULT_QUEUE_SIZE
+        self.stages.append(PipelineStage(name=name, function=function, workers=workers, queue_size=queue_size))
+
+    def __put(self, stage: PipelineStage, item) -> None:
+        stage.input_queue.put(item)
+        depth = stage.input_queue.qsize()
+        with stage.stats_lock:
+            if depth > stage.max_queue_depth:
+                stage.max_queue_depth = depth
+
+    def __work(self, index: int) -> None:
+        stage = self.stages[index]
+        next_stage = self.stages[index + 1] if index + 1 < len(self.stages) else None
+
+        while True:
+            item = stage.input_queue.get()
+            if item is Pipeline.STOP:
+                break
+
+            start = time.monotonic()
+            try:
+                output = stage.function(item)
+            except Exception as e:
+                log.warning("pipeline %s: stage %s failed: %s", self.name, stage.name, e)
+                output = None
+                with stage.stats_lock:
+                    stage.failed += 1
+            with stage.stats_lock:
+                stage.busy_seconds += time.monotonic() - start
+                stage.processed += 1
+                if output is None:
+                    stage.dropped += 1
+
+            if output is not None and next_stage is not None:
+                self.__put(stage=next_stage, item=output)
+
+        # the last worker of the stage stops the next one
+        with stage.stats_lock:
+            stage.running_workers -= 1
+            last_worker = stage.running_workers == 0
+        if last_worker and next_stage is not None:
+            for _ in range(next_stage.workers):
+                next_stage.input_queue.put(Pipeline.STOP)
+
+    def run(self, items, should_continue=None) -> bool:
+        """
+        Feeds the items through every stage and waits until they are through.
+        When should_continue() returns False no more items are fed, the
+        items already in the pipeline still finish.
+
+        @retval True: every item was fed
+        @retval False: stopped early by should_continue
+        """
+        if len(self.stages) == 0:
+            return True
+
+        threads = []
+        for (index, stage) in enumerate(self.stages):
+            stage.running_workers = stage.workers
+            for worker in range(stage.workers):
+                thread = threading.Thread(target=self.__work, args=(index,), daemon=True,
+                                          name="{}-{}-{}".format(self.name, stage.name, worker))
+                thread.start()
+                threads.append(thread)
+
+        completed = True
+        first_stage = self.stages[0]
+        for item in items:
+            if should_continue is not None and should_continue() is False:
+                completed = False
+                break
+            self.__put(stage=first_stage, item=item)
+        for _ in range(first_stage.workers):
+            first_stage.input_queue.put(Pipeline.STOP)
+
+        for thread in threads:
+            thread.join()
+
+        return completed
+
+    def stats(self) -> dict:
+        """
+        @retval dict: stage name -> PipelineStage.stats()
+        """
+        return {stage.name: stage.stats() for stage in self.stages}
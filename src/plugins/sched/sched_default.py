@@ -12,37 +12,61 @@ from recipe_agent import *
 from nutritional_agent import *
 from meal_scheduler_agent import *
 
+log = mpp_utils.get_logger(__name__)
+
 
 """
 Creates a meal plan
 """
-def create_schedule(app_surface: AppSurface, recipe_agent: RecipeAgent, database: Database, start_day: str, end_day: str) -> MealPlan:
+def create_schedule(app_surface: AppSurface, recipe_agent: RecipeAgent, database: Database, start_day: str, end_day: str, meal_categories=None) -> MealPlan:
+    """
+    meal_categories optionally maps a meal (e.g. "dinner") to a list of
+    category names or uids, meals with categories are only picked from those
+    recipes. Names are resolved through the local category table.
+    """
     # define the schedule
     # do a basic mealplan
     plan = MealPlan(start_day=start_day, end_day=end_day)
+    if meal_categories is None:
+        meal_categories = {}
 
-    uid_list = database.pull_recipe_list()
-    uid_count = len(uid_list)
+    # only the light recipe headers are needed to pick meals, recipes in the trash are left out
+    header_list = database.read_recipe_headers()
+    if header_list is None:
+        return plan
+    uid_count = len(header_list)
 
     # if there are no recipes available just return the plan
     if uid_count == 0:
         return plan
 
-    # iterate through each day
+    # pick a uid for each meal first
+    meal_uids = {}
+    meal_candidates = {}
     for day in plan.meal_plan.keys():
         # iterate through each meal
         day_elt = plan.meal_plan[day]
         for meal in day_elt.day_plan.keys():
-            generate_meal = True
-            while generate_meal is True:
-                # generate uid
-                uid_num = random.randrange(start=0, stop=uid_count)
-                uid = uid_list[uid_num][0]
-                # only store if not duplicate
-                recipe = database.read_recipe(uid=uid)
-                # store in meal
-                day_elt.day_plan[meal] = recipe
-                generate_meal = False
+            # candidates for the meal, from the category index when possible
+            candidates = header_list
+            if meal in meal_categories:
+                if meal not in meal_candidates:
+                    categories = database.resolve_categories(categories=meal_categories[meal])
+                    meal_candidates[meal] = database.recipes_in_categories(categories=categories)
+                if meal_candidates[meal]:
+                    candidates = meal_candidates[meal]
+            # generate uid
+            uid_num = random.randrange(start=0, stop=len(candidates))
+            meal_uids[(day, meal)] = candidates[uid_num].uid
+
+    # read all of the picked recipes at once
+    recipes = database.read_recipes(uids=set(meal_uids.values()))
+    if recipes is None:
+        return plan
+
+    # store in meal
+    for (day, meal), uid in meal_uids.items():
+        plan.meal_plan[day].day_plan[meal] = recipes.get(uid)
 
 
     # print the mealplan
@@ -54,22 +78,24 @@ Update a single meal in schedule
 def update_schedule_meal(app_surface: AppSurface, recipe_agent: RecipeAgent, database: Database, day_key, meal_key, recipe: RecipeObject) -> None:
     # sanity check meal/day
     if day_key not in app_surface.current_mealplan.meal_plan.keys():
-        mpp_utils.dbgPrint("requested day does not exist")
+        log.warning("requested day does not exist")
         return
 
     if meal_key not in app_surface.current_mealplan.meal_plan[day_key].day_plan.keys():
-        mpp_utils.dbgPrint("requested meal does not exist")
+        log.warning("requested meal does not exist")
         return
 
-    # if there is no recipe, select a random one
+    # if there is no recipe, select a random one (the trash is left out)
     if recipe is None:
-        uid_list = database.pull_recipe_list()
-        uid_count = len(uid_list)
-        uid_num = random.randrange(start=0, stop=uid_count)
-        uid = uid_list[uid_num]
+        header_list = database.read_recipe_headers()
+        if not header_list:
+            log.warning("no recipes to pick from")
+            return
+        uid_num = random.randrange(start=0, stop=len(header_list))
+        uid = header_list[uid_num].uid
 
         # SCHEDULING
-        new_recipe = database.read_recipe(uid=uid[0])
+        new_recipe = database.read_recipe(uid=uid)
 
         # ASSIGN
         app_surface.current_mealplan.meal_plan[day_key].day_plan[meal_key] = new_recipe
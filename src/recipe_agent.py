@@ -8,15 +8,22 @@
 
 # pip install httplib2
 from enum import Enum
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 import requests
+import requests.adapters
 import threading
-import gzip
+import json
+import random
+import time
 
 # App packages
 import mpp_utils
 from data.recipe import RecipeObject
 from data.surface import AppSurface
 from database import Database
+from pipeline import Pipeline
+
+log = mpp_utils.get_logger(__name__)
 
 
 """
@@ -57,6 +64,8 @@ class Paprika3Service (object):
     API__SYNC_ALL_GROCERIES  = "{}/sync/groceries".format(API__BASE)
     API__SYNC_ALL_CATEGORIES = "{}/sync/categories".format(API__BASE)
     API__SYNC_ALL_MEALS      = "{}/sync/meals".format(API__BASE)
+    ## change counter per collection, bumped when anything in it changes
+    API__SYNC_STATUS         = "{}/sync/status".format(API__BASE)
     ## SYNC SINGLE ITEMS
     API__SYNC_RECIPE         = "{}/sync/recipe".format(API__BASE)
 
@@ -70,6 +79,22 @@ class Paprika3Service (object):
     def __init__(self) -> None:
         pass
 
+    @classmethod
+    def use_base_url(cls, base: str) -> None:
+        """
+        Points every API at another server, e.g. benchmarks.fake_paprika
+
+        @param base: replaces API__BASE, e.g. "http://127.0.0.1:8000/api/v1"
+        """
+        cls.API__BASE                = base.rstrip("/")
+        cls.API__SYNC_ALL_RECIPIES   = "{}/sync/recipes".format(cls.API__BASE)
+        cls.API__SYNC_BOOKMARKS      = "{}/sync/bookmarks".format(cls.API__BASE)
+        cls.API__SYNC_ALL_GROCERIES  = "{}/sync/groceries".format(cls.API__BASE)
+        cls.API__SYNC_ALL_CATEGORIES = "{}/sync/categories".format(cls.API__BASE)
+        cls.API__SYNC_ALL_MEALS      = "{}/sync/meals".format(cls.API__BASE)
+        cls.API__SYNC_STATUS         = "{}/sync/status".format(cls.API__BASE)
+        cls.API__SYNC_RECIPE         = "{}/sync/recipe".format(cls.API__BASE)
+
     def add(self, api, item) -> str:
         """
         The goal is to make sure there is always a forwards slash at the end
@@ -84,6 +109,110 @@ class Paprika3Service (object):
             formatted_str = "{}/{}/".format(api, item)
         return formatted_str
 
+"""
+Fetch Engine
+
+Runs paprika requests over one keep-alive requests.Session, with a
+bounded pool of worker threads so several requests are in flight at
+once. The connection pool holds a connection per worker, so workers
+never wait for a connection or redo the TLS handshake.
+"""
+class FetchEngine (object):
+
+    # seconds to wait for the server before a request fails
+    REQUEST_TIMEOUT_SECONDS = 30
+    # hosts to keep connection pools for, paprika is a single host
+    POOL_HOSTS = 1
+    # retries of a request that failed to connect, timed out, or got a status in RETRY_STATUS_CODES,
+    # waiting a random time up to RETRY_BASE_SECONDS * 2^retry (capped) in between
+    # Ref. https://aws.amazon.com/blogs/architecture/exponential-backoff-and-jitter/
+    RETRY_ATTEMPTS = 4
+    RETRY_BASE_SECONDS = 0.5
+    RETRY_MAX_SECONDS = 10.0
+    RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+    def __init__(self, auth_info, concurrency=None) -> None:
+        if concurrency is None:
+            concurrency = mpp_utils.APP__CONFIG__RECIPE_AGENT__FETCH_CONCURRENCY
+        self.concurrency = max(1, concurrency)
+        self.session = requests.Session()
+        self.session.auth = auth_info
+        adapter = requests.adapters.HTTPAdapter(pool_connections=FetchEngine.POOL_HOSTS,
+                                                pool_maxsize=self.concurrency)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    @staticmethod
+    def backoff_seconds(retry: int) -> float:
+        """
+        @retval float: seconds to wait before the retry, with full jitter
+        """
+        return random.uniform(0, min(FetchEngine.RETRY_MAX_SECONDS, FetchEngine.RETRY_BASE_SECONDS * (2 ** retry)))
+
+    def request(self, method: str, request_url, files=None):
+        """
+        Sends the request, retrying transient failures with backoff
+
+        @retval requests.Response: the last response, raises on connection errors after the last retry
+        """
+        retry = 0
+        while True:
+            try:
+                response = self.session.request(method, request_url, files=files,
+                                                timeout=FetchEngine.REQUEST_TIMEOUT_SECONDS)
+                if response.status_code not in FetchEngine.RETRY_STATUS_CODES or retry >= FetchEngine.RETRY_ATTEMPTS:
+                    return response
+                log.warning("Request Status(%s), retrying: %s", response.status_code, request_url)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if retry >= FetchEngine.RETRY_ATTEMPTS:
+                    raise
+                log.warning("Request failed (%s), retrying: %s", e, request_url)
+            time.sleep(FetchEngine.backoff_seconds(retry=retry))
+            retry += 1
+
+    def get(self, request_url):
+        """
+        @retval requests.Response: the response, raises on connection errors
+        """
+        return self.request("GET", request_url)
+
+    def post(self, request_url, files):
+        """
+        @retval requests.Response: the response, raises on connection errors
+        """
+        return self.request("POST", request_url, files=files)
+
+    def run(self, fetch, items):
+        """
+        Generator that calls fetch(item) for each item on the worker pool and
+        yields the results as they complete, not in item order. At most two
+        requests per worker are queued at once. Stopping the iteration early
+        cancels the requests that have not started.
+
+        @retval generator: yields (item, fetch(item))
+        """
+        items = iter(items)
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="fetch") as pool:
+            # future -> item
+            in_flight = {}
+            try:
+                while True:
+                    for item in items:
+                        in_flight[pool.submit(fetch, item)] = item
+                        if len(in_flight) >= 2 * self.concurrency:
+                            break
+                    if len(in_flight) == 0:
+                        break
+                    (done, _) = wait(in_flight.keys(), return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield (in_flight.pop(future), future.result())
+            finally:
+                for future in in_flight.keys():
+                    future.cancel()
+
+    def close(self) -> None:
+        self.session.close()
+
 """
 Recipe Agent Object
 
@@ -96,14 +225,24 @@ Recipe Sync/Update
 - Pull recipes from Paprika3 Cloud -> local Paprika3 Storage
 - Update recipes local Paprika3 storage -> Paprika3 Cloud
 
+Category, Meal, Grocery & Bookmark Sync
+- Pull each collection from Paprika3 Cloud -> local Paprika3 Storage
+
 To Dos:
-- Grocery Sync/Update
-- Meal Sync/Update
+- Grocery Update
+- Meal Update
 """
 class RecipeAgent(threading.Thread):
 
     PaprikaObj=None
 
+    # number of modified recipes hashed together before pushing them
+    PUSH_BATCH_SIZE = 512
+    # pull pipeline: json decode workers, and recipes allowed to wait on the database writer
+    PARSE_WORKERS = 2
+    WRITE_WINDOW = 400
+    JOURNAL_PULL_RECIPES = "pull_recipes"
+
     # Error codes
     class Error(Enum):
         ERR_SUCCESS = 0,
@@ -117,16 +256,41 @@ class RecipeAgent(threading.Thread):
     class Command(Enum):
         CMD_PULL_RECIPES = 0,
         CMD_PUSH_RECIPES = 1,
+        CMD_PULL_CATEGORIES = 2,
+        CMD_PULL_MEALS = 3,
+        CMD_PULL_GROCERIES = 4,
+        CMD_PULL_BOOKMARKS = 5,
+        CMD_PULL_COLLECTIONS = 6,
+
+    # collections pulled by each command (see Database.COLLECTIONS),
+    # and the Paprika3Service API listing each one
+    COLLECTION_COMMANDS = {
+        Command.CMD_PULL_CATEGORIES: ["categories"],
+        Command.CMD_PULL_MEALS: ["meals"],
+        Command.CMD_PULL_GROCERIES: ["groceries"],
+        Command.CMD_PULL_BOOKMARKS: ["bookmarks"],
+        Command.CMD_PULL_COLLECTIONS: ["categories", "meals", "groceries", "bookmarks"],
+    }
+    COLLECTION_APIS = {
+        "categories": "API__SYNC_ALL_CATEGORIES",
+        "meals": "API__SYNC_ALL_MEALS",
+        "groceries": "API__SYNC_ALL_GROCERIES",
+        "bookmarks": "API__SYNC_BOOKMARKS",
+    }
     
-    def __init__(self, app_surface: AppSurface, auth: AuthenticationObject, cmd, debug=False) -> None:
+    def __init__(self, app_surface: AppSurface, auth: AuthenticationObject, cmd, debug=False, incremental=True) -> None:
         super().__init__(group=None, target=None, name=None, args=(), kwargs={}, daemon=None)
         self.app_surface = app_surface
         self.authentication = auth
         self.command = cmd
         self.status = RecipeAgent.Error.ERR_GENERIC
-        self.database = Database()
+        self.database = Database(app_surface=app_surface)
         self.debug = debug
         self.show_progress_status = False
+        # only pull the recipes whose hash changed on the server
+        self.incremental = incremental
+        # PipelineStage counters of the last pull
+        self.pipeline_stats = None
 
         if RecipeAgent.PaprikaObj is None:
             RecipeAgent.PaprikaObj = Paprika3Service()
@@ -136,26 +300,35 @@ class RecipeAgent(threading.Thread):
         if type(cmd) is not RecipeAgent.Command:
             self.command = None
 
+        # keep-alive session & request workers, shared by every request of the agent
+        auth_info = None
+        if self.authentication is not None:
+            auth_info = self.authentication.auth_info
+        self.fetch_engine = FetchEngine(auth_info=auth_info)
+
     ## HELPER FUNCTIONS
     # performs the actual http operation
-    def __make_http_request(self, command, request_url, data=None, debug=False):
+    def __make_http_request(self, command, request_url, data=None, debug=False, decode=True):
         """
+        @param decode: False to return the response body undecoded
         @retval None: if the request does not work as intended
         @retval Dict: a dictionary object of the recipe
+        @retval bytes: the response body, if decode is False
         """
         result = None
 
-        mpp_utils.dbgPrint("Request Sent: {}".format(request_url))
+        log.debug("Request Sent: %s", request_url)
 
         try:
-            if command == RecipeAgent.Command.CMD_PULL_RECIPES:
-                result = requests.get(request_url, auth=self.authentication.auth_info)
-            elif command == RecipeAgent.Command.CMD_PUSH_RECIPES:
+            if command == RecipeAgent.Command.CMD_PUSH_RECIPES:
                 # If pushing data, there needs to be data to push
                 if data is None:
                     return None
                 # send the request
-                result = requests.post(request_url, auth=self.authentication.auth_info, files={"data": data})
+                result = self.fetch_engine.post(request_url, files={"data": data})
+            elif type(command) is RecipeAgent.Command:
+                # every other command only pulls
+                result = self.fetch_engine.get(request_url)
             else:
                 pass
 
@@ -166,17 +339,19 @@ class RecipeAgent(threading.Thread):
                 result.raise_for_status()
 
         except Exception as e:
-            mpp_utils.dbgPrint("__make_http_request: an exception occured while submitting the request")
-            mpp_utils.dbgPrint("__make_http_request: {}".format(e))
+            log.warning("__make_http_request: an exception occured while submitting the request: %s", e)
             return None
 
         
         # information on debug
-        mpp_utils.dbgPrint("Request Response")
-        mpp_utils.dbgPrint("Status({}) - {}".format(result.status_code, result.reason))
-        mpp_utils.dbgPrint("Reponse Content: {}".format(result.json()))
-        
-        return result.json()
+        log.debug("Request Response Status(%s) - %s", result.status_code, result.reason)
+        if decode is False:
+            return result.content
+
+        # decoded once, only formatted when debug logging is on
+        response = result.json()
+        log.debug("Reponse Content: %s", response)
+        return response
 
     # Pulls a single recipe, and all of its details
     def __api_pull_recipe(self, recipe_uid: str):
@@ -194,26 +369,47 @@ class RecipeAgent(threading.Thread):
         return result
     
     # Pushes a single recipe, and all of its details
-    def __api_push_recipe(self, recipe_uid: str, paprika_recipe: RecipeObject):
+    def __api_push_recipe(self, recipe_uid: str, paprika_recipe: RecipeObject, packaged_data=None):
         """
         Uploads data fora single recipe  back to paprika
 
+        @param packaged_data: the body made by RecipeObject.package_many, None to make it here
         @retval None: if the request does not work as intended
         @retval Dict: a dictionary object of the recipe
         """
         result = None
 
-        # calculating the hash
-        paprika_recipe.calculate_hash_sha256()
-
-        # compress using gzip
-        packaged_data = gzip.compress(paprika_recipe.as_json().encode(encoding="utf-8"))
+        # calculating the hash & compress using gzip
+        if packaged_data is None:
+            (packaged_data,) = RecipeObject.package_many(paprika_recipes=[paprika_recipe])
 
         request_url = RecipeAgent.PaprikaObj.add(RecipeAgent.PaprikaObj.API__SYNC_RECIPE, recipe_uid)
         result = self.__make_http_request(command=RecipeAgent.Command.CMD_PUSH_RECIPES, request_url=request_url, data=packaged_data, debug=self.debug)
 
         return result
     
+    # Waits for the queued database writes of pulled recipes
+    def __wait_for_writes(self, write_futures) -> tuple:
+        """
+        @param write_futures: (uid, Future) per recipe queued on the database writer
+        @retval tuple: (number of recipes stored, number of recipes not stored)
+        """
+        stored = 0
+        not_stored = 0
+        for (uid, future) in write_futures:
+            try:
+                result = future.result()
+            except Exception as e:
+                log.warning("%s", e)
+                result = Database.Error.ERR_OPERATION_FAILED
+            if result == Database.Error.ERR_SUCCESS:
+                stored += 1
+            else:
+                log.warning("[%s] Unable to store into database", uid)
+                not_stored += 1
+
+        return (stored, not_stored)
+
     ## DIAGNOSTIC FUNCTION
     def test_pull(self, debug=False):
         """
@@ -226,19 +422,19 @@ class RecipeAgent(threading.Thread):
         result = self.__make_http_request(command=RecipeAgent.Command.CMD_PULL_RECIPES, request_url=request_url)
 
         if result is None:
-            mpp_utils.dbgPrint("diagnostic error: Unable to pull information from paprika")
+            log.warning("diagnostic error: Unable to pull information from paprika")
             return RecipeAgent.Error.ERR_REQUEST_FAIL
         
         # Iterate through each recipe and store into the local datastore
         uid_list = result['result']
 
-        mpp_utils.dbgPrint("UID Count: {}".format(len(uid_list)))
+        log.debug("UID Count: %s", len(uid_list))
 
         for uid in uid_list:
-            mpp_utils.dbgPrint("UID: {}".format(uid))
+            log.debug("UID: %s", uid)
 
         if result is None:
-            mpp_utils.dbgPrint("diagnostic error: Unable to pull information from paprika")
+            log.warning("diagnostic error: Unable to pull information from paprika")
             return RecipeAgent.Error.ERR_REQUEST_FAIL
         
         return RecipeAgent.Error.ERR_SUCCESS
@@ -314,100 +510,217 @@ class RecipeAgent(threading.Thread):
             return RecipeAgent.Error.ERR_REQUEST_FAIL
         
         recipe_list = req1_result['result']
-        total_recipes = len(recipe_list)
+        deleted_uids = []
+
+        # compare the listed hashes against the local ones,
+        # a full pull is done if they cannot be compared
+        if self.incremental is True:
+            diff = self.database.diff_recipe_hashes(
+                remote_hashes={recipe['uid']: recipe['hash'] for recipe in recipe_list})
+            if diff is not None:
+                (changed_uids, deleted_uids) = diff
+                changed_uids = set(changed_uids)
+                log.debug("Unchanged Recipes: %s", len(recipe_list) - len(changed_uids))
+                recipe_list = [recipe for recipe in recipe_list if recipe['uid'] in changed_uids]
 
-        mpp_utils.dbgPrint("Recipe Count: {}".format(total_recipes))
+        total_recipes = len(recipe_list)
 
-        # ITERATE THROUGH EACH RECIPE
-        for recipe in recipe_list:
-            # gather stats
+        log.debug("Recipe Count: %s", total_recipes)
+
+        # resume the journal of an interrupted pull, only the recipes
+        # that are not done yet are fetched
+        journal = RecipeAgent.JOURNAL_PULL_RECIPES
+        pending_uids = self.database.journal_start(command=journal,
+                                                   recipe_hashes={recipe['uid']: recipe['hash'] for recipe in recipe_list})
+        if pending_uids is None:
+            log.warning("Unable to use the sync journal, pulling every recipe")
+            journal = None
+            pending_uids = [recipe['uid'] for recipe in recipe_list]
+        elif len(pending_uids) < total_recipes:
+            log.debug("Resuming, %s recipes already done", total_recipes - len(pending_uids))
+        total_recipes = len(pending_uids)
+
+        ## PIPELINE STAGES
+        # fetch -> parse -> write -> commit, with bounded queues in between
+        def fetch(uid):
+            request_url = RecipeAgent.PaprikaObj.add(RecipeAgent.PaprikaObj.API__SYNC_RECIPE, uid)
+            content = self.__make_http_request(command=RecipeAgent.Command.CMD_PULL_RECIPES, request_url=request_url,
+                                               debug=self.debug, decode=False)
+            if content is None:
+                return None
+            return (uid, content)
+
+        def parse(fetched):
+            (uid, content) = fetched
+            paprika_recipe = RecipeObject.from_jsonobj(jsonobj=json.loads(content)['result'])
+            log.debug("Pull UID: %s", uid)
+            return paprika_recipe
+
+        def write(paprika_recipe):
+            # the writer batches the commits, and marks the recipes done in the journal as they commit
+            return (paprika_recipe.load("uid"), self.database.write_recipe_async(paprika_recipe=paprika_recipe,
+                                                                                 journal=journal))
+
+        def commit(written):
+            nonlocal current_recipe_count, successfully_stored, unable_to_store
+            (stored, not_stored) = self.__wait_for_writes(write_futures=[written])
+            successfully_stored += stored
+            unable_to_store += not_stored
             current_recipe_count += 1
 
-            # check for application close
-            if self.app_surface.b_app_running == False:
-                return RecipeAgent.Error.ERR_APP_SHUTDOWN
-
             # creating a loading bar
             if self.show_progress_status is True:
                 percent = int((current_recipe_count/total_recipes)*100.0)
                 residual = 100 - percent
                 print("[{}{}] ({}%)".format('='*percent,' '*residual, percent), end='\r')
+            return True
 
-            # recipe is an object with hash & uid
-            uid = recipe['uid']
-            reqx_result = self.__api_pull_recipe(recipe_uid=uid)
+        pipeline = Pipeline(name="pull")
+        pipeline.add_stage(name="fetch", function=fetch, workers=self.fetch_engine.concurrency)
+        pipeline.add_stage(name="parse", function=parse, workers=RecipeAgent.PARSE_WORKERS)
+        pipeline.add_stage(name="write", function=write, workers=1)
+        pipeline.add_stage(name="commit", function=commit, workers=1, queue_size=RecipeAgent.WRITE_WINDOW)
 
-            # only do things if the uid result is not none
-            if reqx_result is None:
-                continue
+        # stops feeding recipes on application close, what is already fetched is kept
+        completed = pipeline.run(items=pending_uids, should_continue=lambda: self.app_surface.b_app_running)
+        self.pipeline_stats = pipeline.stats()
+        log.debug("Pull Pipeline: %s", self.pipeline_stats)
 
-            # load into paprika object
-            jsonobject = reqx_result['result']
-            paprika_recipe = RecipeObject()
-            paprika_recipe.init_from_jsonobj(jsonobj=jsonobject)
+        if completed is False:
+            return RecipeAgent.Error.ERR_APP_SHUTDOWN
 
-            mpp_utils.dbgPrint("Pull UID: {}".format(recipe))
-            mpp_utils.dbgPrint(paprika_recipe)
+        # recipes that failed to fetch or parse are left in the journal for the next run
+        unable_to_store = total_recipes - successfully_stored
+        if journal is not None and unable_to_store == 0:
+            self.database.journal_finish(command=journal)
+
+        # recipes deleted on the server
+        if len(deleted_uids) > 0:
+            log.debug("Deleted Recipes: %s", len(deleted_uids))
+            if self.database.trash_recipes(uids=deleted_uids) != Database.Error.ERR_SUCCESS:
+                log.warning("Unable to trash the deleted recipes")
+
+        # parse the ingredients of recipes stored before the ingredient table existed
+        if self.database.update_ingredient_index() != Database.Error.ERR_SUCCESS:
+            log.warning("Unable to update the ingredient index")
 
-            # STORE INTO DATABASE
-            if self.database.write_recipe(paprika_recipe=paprika_recipe) != Database.Error.ERR_SUCCESS:
-                mpp_utils.dbgPrint("Unable to store into database")
-                unable_to_store += 1
-            else:
-                successfully_stored += 1
-                
         if unable_to_store > successfully_stored:
-            mpp_utils.dbgPrint("Failed when storing a majority of the recipes")
+            log.warning("Failed when storing a majority of the recipes")
             return RecipeAgent.Error.ERR_REQUEST_FAIL
 
         # iterate through each UID and pull each recipe and all of its contents
         # store it in the database
         return RecipeAgent.Error.ERR_SUCCESS
     
+    def __push_recipe_batch(self, paprika_recipes, pushed_recipes: dict) -> int:
+        """
+        Hash, serialise & compress the batch up front (in a process pool
+        when it is large), then push it with fetch_engine.concurrency POSTs
+        in flight.
+
+        @param pushed_recipes: uid -> hash, filled in with the recipes the server accepted
+        @retval RecipeAgent.Error.ERR_SUCCESS: the batch was pushed
+        @retval RecipeAgent.Error.ERR_APP_SHUTDOWN: the application is closing
+        """
+        if self.app_surface.b_app_running == False:
+            return RecipeAgent.Error.ERR_APP_SHUTDOWN
+        packages = RecipeObject.package_many(paprika_recipes=paprika_recipes)
+
+        def push(item):
+            (recipe, packaged_data) = item
+            uid = recipe.load("uid")
+            log.debug("UID: %s", uid)
+            # push the recipe back to the paprika server
+            return self.__api_push_recipe(recipe_uid=uid, paprika_recipe=recipe, packaged_data=packaged_data)
+
+        for ((recipe, _), result) in self.fetch_engine.run(fetch=push, items=zip(paprika_recipes, packages)):
+            # only recipes the server accepted are marked as pushed
+            if result is not None:
+                pushed_recipes[recipe.load("uid")] = recipe.load("hash")
+
+            # check for application close, the requests not started are dropped
+            if self.app_surface.b_app_running == False:
+                return RecipeAgent.Error.ERR_APP_SHUTDOWN
+
+        return RecipeAgent.Error.ERR_SUCCESS
+
     def __api_push_recipes(self, debug=False) -> int:
         """
         @retval RecipeAgent.Error.ERR_SUCCESS: recipes are pushed as expected
         @retval RecipeAgent.Error.ERR_REQUEST_FAIL: Unable to push recipes
         """
-        uid_list = self.database.pull_recipe_list()
-
-        # get all of the recipes from the database
-        if uid_list is None:
-            mpp_utils.dbgPrint("Unable to pull recipes")
-            return RecipeAgent.Error.ERR_REQUEST_FAIL
+        # uid -> hash of the recipes the server accepted
+        pushed_recipes = {}
+        status = RecipeAgent.Error.ERR_SUCCESS
+
+        # only the modified recipes are read from the database
+        pending_recipes = []
+        modified_count = 0
+        for recipe in self.database.iter_modified_recipes():
+            pending_recipes.append(recipe)
+            modified_count += 1
+            if len(pending_recipes) >= RecipeAgent.PUSH_BATCH_SIZE:
+                status = self.__push_recipe_batch(paprika_recipes=pending_recipes, pushed_recipes=pushed_recipes)
+                pending_recipes = []
+                if status != RecipeAgent.Error.ERR_SUCCESS:
+                    break
+        if status == RecipeAgent.Error.ERR_SUCCESS:
+            status = self.__push_recipe_batch(paprika_recipes=pending_recipes, pushed_recipes=pushed_recipes)
+
+        # clear the modified flag of what was pushed, after iterating
+        if self.database.mark_recipes_pushed(recipe_hashes=pushed_recipes) != Database.Error.ERR_SUCCESS:
+            log.warning("Unable to mark the pushed recipes")
+            if status == RecipeAgent.Error.ERR_SUCCESS:
+                status = RecipeAgent.Error.ERR_REQUEST_FAIL
+        if status == RecipeAgent.Error.ERR_SUCCESS and len(pushed_recipes) < modified_count:
+            log.warning("Unable to push %s recipes", modified_count - len(pushed_recipes))
+            status = RecipeAgent.Error.ERR_REQUEST_FAIL
+
+        return status
+
+    def __api_pull_collections(self, collections) -> int:
+        """
+        Pulls whole collections, skipping the ones whose /sync/status counter
+        did not change since their last sync. Only the changed items are written.
 
-        # iterate through each recipe in the database
-        for element in uid_list:
+        @param collections: Database.COLLECTIONS keys, e.g. ["categories", "meals"]
+        @retval RecipeAgent.Error.ERR_SUCCESS: the collections are pulled as expected
+        @retval RecipeAgent.Error.ERR_REQUEST_FAIL: Unable to pull a collection
+        """
+        # without the counters every collection is pulled
+        remote_counters = {}
+        status = self.__make_http_request(command=self.command, request_url=RecipeAgent.PaprikaObj.API__SYNC_STATUS)
+        if status is not None and type(status.get('result')) is dict:
+            remote_counters = status['result']
+        local_counters = self.database.read_sync_counters() or {}
+
+        for collection in collections:
             # check for application close
             if self.app_surface.b_app_running == False:
                 return RecipeAgent.Error.ERR_APP_SHUTDOWN
 
-            # uid is first and only element in tuple
-            # based on behavior of "pull_recipe_list"
-            uid = element[0]
-            mpp_utils.dbgPrint('UID: {}'.format(uid))
-            # construct the recipe object
-            recipe = self.database.read_recipe(uid=uid)
-
-            # skip if recipe is found
-            if recipe is None:
-                mpp_utils.dbgPrint("no recipe found")
+            counter = remote_counters.get(collection)
+            if counter is not None and local_counters.get(collection) == counter:
+                log.debug("Unchanged Collection: %s", collection)
                 continue
 
-            # skip if recipe has not been modified
-            if not recipe.metadata_is_modified:
-                mpp_utils.dbgPrint("recipe not modified")
-                continue
+            request_url = getattr(RecipeAgent.PaprikaObj, RecipeAgent.COLLECTION_APIS[collection])
+            result = self.__make_http_request(command=self.command, request_url=request_url)
+            if result is None:
+                return RecipeAgent.Error.ERR_REQUEST_FAIL
+
+            synced = self.database.sync_collection(collection=collection, items=result['result'], counter=counter)
+            if synced is None:
+                log.warning("[%s] Unable to store into database", collection)
+                return RecipeAgent.Error.ERR_REQUEST_FAIL
+            log.debug("%s: %s written, %s deleted", collection, synced[0], synced[1])
 
-            # push the recipe back to the paprika server
-            self.__api_push_recipe(recipe_uid=uid, paprika_recipe=recipe)
-                
         return RecipeAgent.Error.ERR_SUCCESS
 
     ## THREAD RUN DEFINITION
     def run(self) -> None:
-        mpp_utils.dbgPrint("Running Recipe Agent")
-        mpp_utils.dbgPrint("Command: {}".format(self.command))
+        log.debug("Running Recipe Agent")
+        log.debug("Command: %s", self.command)
 
         # check the surface
         if (type(self.app_surface) is not AppSurface) or (self.app_surface is None):
@@ -432,13 +745,16 @@ class RecipeAgent(threading.Thread):
             elif self.command == RecipeAgent.Command.CMD_PUSH_RECIPES:
                 status_code = self.__api_push_recipes()
 
+            elif self.command in RecipeAgent.COLLECTION_COMMANDS:
+                status_code = self.__api_pull_collections(collections=RecipeAgent.COLLECTION_COMMANDS[self.command])
+
             # error handling
             if status_code is not RecipeAgent.Error.ERR_SUCCESS:
-                mpp_utils.dbgPrint("Unable to complete command.")
-                mpp_utils.dbgPrint("Error: {}".format(status_code))
+                log.warning("Unable to complete command.")
+                log.warning("Error: %s", status_code)
 
         except:
-            mpp_utils.dbgPrint("RecipeAgent: an exception has occurred")
+            log.warning("RecipeAgent: an exception has occurred")
         finally:
             # set surface
             self.app_surface.surface_lock.acquire()
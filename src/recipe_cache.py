@@ -0,0 +1,129 @@
+import threading
+from collections import OrderedDict
+
+# App packages
+from data.recipe import RecipeObject, CompressedText
+
+
+"""
+Recipe Cache
+
+In-process, size bounded LRU cache of hydrated recipes, keyed by uid.
+Each entry remembers the recipe hash, so a lookup with a hash only
+hits when the cached copy is the same version.
+
+Recipes are copied on the way in and out, so callers can freely
+modify what they get back without touching the cache.
+"""
+class RecipeCache (object):
+
+    # rough fixed cost of a recipe object & its dictionary, in bytes
+    RECIPE_OVERHEAD_BYTES = 2048
+
+    def __init__(self, max_recipes: int, max_bytes: int) -> None:
+        self.cache_lock = threading.Lock()
+        self.max_recipes = max_recipes
+        self.max_bytes = max_bytes
+        # uid -> (hash, recipe, size), least recently used first
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        # bumped on every invalidation, see put()
+        self.generation = 0
+        # stats
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def estimate_size(paprika_recipe: RecipeObject) -> int:
+        """
+        @retval int: approximate memory used by the recipe, in bytes
+        """
+        size = RecipeCache.RECIPE_OVERHEAD_BYTES
+        # the fields as held, a lazy recipe is not decoded to be measured
+        for key in RecipeObject.FIELDS:
+            value = getattr(paprika_recipe, key)
+            if type(value) is str or type(value) is bytes:
+                size += len(value)
+            elif type(value) is CompressedText:
+                size += len(value.data)
+        return size
+
+    def get(self, uid: str, hash=None) -> RecipeObject:
+        """
+        @param hash: if given, only a cached recipe with the same hash is a hit
+        @retval RecipeObject: copy of the cached recipe
+        @retval None: the recipe is not cached
+        """
+        with self.cache_lock:
+            entry = self.entries.get(uid)
+            if entry is None or (hash is not None and entry[0] != hash):
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(uid)
+            self.hits += 1
+            return entry[1].copy()
+
+    def put(self, paprika_recipe: RecipeObject, generation=None) -> None:
+        """
+        Cache a copy of the recipe, evicting the least recently used
+        recipes until the cache is back within its limits.
+
+        @param generation: value of self.generation taken before the recipe was
+                           read from the database. If anything was invalidated
+                           since, the read may be stale and is not cached.
+        """
+        if self.max_recipes <= 0:
+            return
+
+        uid = paprika_recipe.load("uid")
+        size = RecipeCache.estimate_size(paprika_recipe)
+        # never let one recipe flush the whole cache
+        if size > self.max_bytes:
+            return
+
+        entry = (paprika_recipe.load("hash"), paprika_recipe.copy(), size)
+        with self.cache_lock:
+            if generation is not None and generation != self.generation:
+                return
+
+            self.__remove(uid)
+            self.entries[uid] = entry
+            self.total_bytes += size
+
+            while len(self.entries) > self.max_recipes or self.total_bytes > self.max_bytes:
+                (_, (_, _, evicted_size)) = self.entries.popitem(last=False)
+                self.total_bytes -= evicted_size
+                self.evictions += 1
+
+    def invalidate(self, uids) -> None:
+        """
+        Drop the recipes from the cache, called whenever they are written.
+        """
+        with self.cache_lock:
+            self.generation += 1
+            for uid in uids:
+                self.__remove(uid)
+
+    def clear(self) -> None:
+        with self.cache_lock:
+            self.generation += 1
+            self.entries.clear()
+            self.total_bytes = 0
+
+    def stats(self) -> dict:
+        with self.cache_lock:
+            return {
+                "recipes": len(self.entries),
+                "bytes": self.total_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
+
+    def __remove(self, uid: str) -> None:
+        # cache_lock must be held
+        entry = self.entries.pop(uid, None)
+        if entry is not None:
+            self.total_bytes -= entry[2]
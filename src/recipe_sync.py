@@ -0,0 +1,330 @@
+##
+## asyncio alternative to the RecipeAgent thread. Pulls & pushes recipes
+## with many requests in flight on a single thread. One account at a time,
+## every sync writes to Database.DATABASE_PATH and an incremental pull
+## trashes the local recipes its account does not list.
+##
+## Reference:
+## - https://docs.aiohttp.org/en/stable/client.html
+## - https://en.wikipedia.org/wiki/Token_bucket
+##
+
+import asyncio
+import time
+
+# pip install aiohttp
+import aiohttp
+
+# App packages
+import mpp_utils
+from data.recipe import RecipeObject
+from data.surface import AppSurface
+from database import Database
+from recipe_agent import AuthenticationObject, FetchEngine, Paprika3Service, RecipeAgent
+
+log = mpp_utils.get_logger(__name__)
+
+
+"""
+Token Bucket
+
+Rate limiter, each request takes a token. Tokens are refilled at
+rate per second up to burst, so short bursts are allowed but the
+average rate never goes over rate.
+"""
+class TokenBucket (object):
+
+    def __init__(self, rate: float, burst: int) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        """
+        Waits until a token is available and takes it
+        """
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1.0:
+                    self.tokens -= 1.0
+                    return
+                await asyncio.sleep((1.0 - self.tokens) / self.rate)
+
+"""
+Async Recipe Sync
+
+Same commands & results as RecipeAgent (RecipeAgent.Command / RecipeAgent.Error):
+- requests are rate limited by a TokenBucket
+- max_in_flight worker tasks, so at most max_in_flight requests are open at once
+- at most max_pending_writes pulled recipes wait on the database writer,
+  fetching pauses until the writer catches up
+- the AppSurface flags are kept up to date, and the sync is cancelled
+  when b_app_running goes False
+"""
+class AsyncRecipeSync (object):
+
+    # seconds between checks of AppSurface.b_app_running
+    CANCEL_POLL_SECONDS = 0.1
+    REQUEST_TIMEOUT_SECONDS = 30
+
+    def __init__(self, app_surface: AppSurface, auth: AuthenticationObject, incremental=True,
+        requests_per_second=None, burst=None, max_in_flight=None, max_pending_writes=None
+    ) -> None:
+        self.app_surface = app_surface
+        self.authentication = auth
+        self.database = Database(app_surface=app_surface)
+        self.incremental = incremental
+        self.requests_per_second = requests_per_second or mpp_utils.APP__CONFIG__RECIPE_SYNC__REQUESTS_PER_SECOND
+        self.burst = burst or mpp_utils.APP__CONFIG__RECIPE_SYNC__BURST
+        self.max_in_flight = max_in_flight or mpp_utils.APP__CONFIG__RECIPE_SYNC__MAX_IN_FLIGHT
+        self.max_pending_writes = max_pending_writes or mpp_utils.APP__CONFIG__RECIPE_SYNC__MAX_PENDING_WRITES
+        self.paprika = Paprika3Service()
+        self.status = RecipeAgent.Error.ERR_GENERIC
+        # progress of the current command
+        self.total_recipes = 0
+        self.completed_recipes = 0
+
+    def __set_running(self, running: bool) -> None:
+        self.app_surface.surface_lock.acquire()
+        self.app_surface.b_recipe_agent_running = running
+        self.app_surface.surface_lock.release()
+
+    async def __request(self, session, bucket: TokenBucket, in_flight: asyncio.Semaphore, method, request_url, data=None):
+        """
+        Sends the request, retrying transient failures with the backoff
+        of FetchEngine, so both sync engines treat the network the same.
+        Every attempt takes a token, and the in-flight slot is given
+        back while waiting to retry.
+
+        @retval None: if the request does not work as intended
+        @retval Dict: the json response
+        """
+        retry = 0
+        while True:
+            await bucket.acquire()
+            async with in_flight:
+                log.debug("Request Sent: %s", request_url)
+                try:
+                    if data is None:
+                        request = session.request(method, request_url)
+                    else:
+                        # a form is consumed by the request, built again on every attempt
+                        form = aiohttp.FormData()
+                        form.add_field("data", data, filename="data")
+                        request = session.request(method, request_url, data=form)
+                    async with request as response:
+                        if response.status not in FetchEngine.RETRY_STATUS_CODES or retry >= FetchEngine.RETRY_ATTEMPTS:
+                            # raises an exception when an error happens
+                            response.raise_for_status()
+                            return await response.json()
+                        log.warning("Request Status(%s), retrying: %s", response.status, request_url)
+                except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                    if retry >= FetchEngine.RETRY_ATTEMPTS:
+                        log.warning("request failed: %s", e)
+                        return None
+                    log.warning("Request failed (%s), retrying: %s", e, request_url)
+                except aiohttp.ClientError as e:
+                    log.warning("request failed: %s", e)
+                    return None
+            await asyncio.sleep(FetchEngine.backoff_seconds(retry=retry))
+            retry += 1
+
+    async def __drain(self, work, items) -> None:
+        """
+        Runs work(item) for every item on max_in_flight worker tasks taking
+        items off a queue, so the number of tasks does not grow with the
+        number of recipes
+        """
+        pending_items = asyncio.Queue()
+        for item in items:
+            pending_items.put_nowait(item)
+
+        async def worker() -> None:
+            while True:
+                try:
+                    item = pending_items.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                await work(item)
+
+        workers = min(self.max_in_flight, pending_items.qsize())
+        await asyncio.gather(*[worker() for _ in range(workers)])
+
+    async def __pull(self, session, bucket, in_flight) -> int:
+        """
+        @retval RecipeAgent.Error.ERR_SUCCESS: recipes are pulled as expected
+        @retval RecipeAgent.Error.ERR_REQUEST_FAIL: Unable to pull recipes
+        """
+        listing = await self.__request(session, bucket, in_flight, "GET", Paprika3Service.API__SYNC_ALL_RECIPIES)
+        if listing is None:
+            return RecipeAgent.Error.ERR_REQUEST_FAIL
+        recipe_list = listing['result']
+        deleted_uids = []
+
+        # the database calls block, they run off the event loop
+        if self.incremental is True:
+            diff = await asyncio.to_thread(self.database.diff_recipe_hashes,
+                                           {recipe['uid']: recipe['hash'] for recipe in recipe_list})
+            if diff is not None:
+                (changed_uids, deleted_uids) = diff
+                changed_uids = set(changed_uids)
+                recipe_list = [recipe for recipe in recipe_list if recipe['uid'] in changed_uids]
+
+        self.total_recipes = len(recipe_list)
+        loop = asyncio.get_running_loop()
+        # backpressure, a slot is held from the fetch until the write is committed
+        write_slots = asyncio.Semaphore(self.max_pending_writes)
+        results = {"stored": 0, "not_stored": 0}
+        # writes queued on the writer & not committed yet
+        pending_writes = set()
+
+        def finish_recipe(stored: bool) -> None:
+            write_slots.release()
+            results["stored" if stored is True else "not_stored"] += 1
+            self.completed_recipes += 1
+
+        def written(future) -> None:
+            pending_writes.discard(future)
+            finish_recipe(stored=not future.cancelled() and future.exception() is None
+                          and future.result() == Database.Error.ERR_SUCCESS)
+
+        async def pull_recipe(uid) -> None:
+            await write_slots.acquire()
+            queued = False
+            try:
+                reqx_result = await self.__request(session, bucket, in_flight, "GET",
+                                                   self.paprika.add(Paprika3Service.API__SYNC_RECIPE, uid))
+                if reqx_result is None:
+                    return
+                try:
+                    paprika_recipe = RecipeObject.from_jsonobj(jsonobj=reqx_result['result'])
+                except (KeyError, TypeError) as e:
+                    log.warning("[%s] malformed recipe: %s", uid, e)
+                    return
+                # only queues the write, the writer thread commits it and the worker
+                # moves on to the next recipe, the slot is released once committed
+                future = asyncio.wrap_future(self.database.write_recipe_async(paprika_recipe=paprika_recipe), loop=loop)
+                pending_writes.add(future)
+                future.add_done_callback(written)
+                queued = True
+            finally:
+                if queued is False:
+                    finish_recipe(stored=False)
+
+        await self.__drain(work=pull_recipe, items=[recipe['uid'] for recipe in recipe_list])
+        # wait does not cancel the writes if the sync is cancelled
+        if len(pending_writes) > 0:
+            await asyncio.wait(set(pending_writes))
+
+        if len(deleted_uids) > 0:
+            await asyncio.to_thread(self.database.trash_recipes, deleted_uids)
+        await asyncio.to_thread(self.database.update_ingredient_index)
+
+        if results["not_stored"] > results["stored"]:
+            log.warning("Failed when storing a majority of the recipes")
+            return RecipeAgent.Error.ERR_REQUEST_FAIL
+        return RecipeAgent.Error.ERR_SUCCESS
+
+    async def __push(self, session, bucket, in_flight) -> int:
+        """
+        @retval RecipeAgent.Error.ERR_SUCCESS: recipes are pushed as expected
+        @retval RecipeAgent.Error.ERR_REQUEST_FAIL: a recipe was not pushed, or not marked as pushed
+        """
+        def modified_recipes() -> list:
+            paprika_recipes = list(self.database.iter_modified_recipes())
+            return list(zip(paprika_recipes, RecipeObject.package_many(paprika_recipes=paprika_recipes)))
+
+        paprika_recipes = await asyncio.to_thread(modified_recipes)
+        self.total_recipes = len(paprika_recipes)
+        # uid -> hash of the recipes the server accepted
+        pushed_recipes = {}
+
+        async def push_recipe(item) -> None:
+            (paprika_recipe, packaged_data) = item
+            uid = paprika_recipe.load("uid")
+            result = await self.__request(session, bucket, in_flight, "POST",
+                                          self.paprika.add(Paprika3Service.API__SYNC_RECIPE, uid), data=packaged_data)
+            if result is not None:
+                pushed_recipes[uid] = paprika_recipe.load("hash")
+            self.completed_recipes += 1
+
+        await self.__drain(work=push_recipe, items=paprika_recipes)
+
+        if await asyncio.to_thread(self.database.mark_recipes_pushed, pushed_recipes) != Database.Error.ERR_SUCCESS:
+            log.warning("Unable to mark the pushed recipes")
+            return RecipeAgent.Error.ERR_REQUEST_FAIL
+        if len(pushed_recipes) < self.total_recipes:
+            log.warning("Unable to push %s recipes", self.total_recipes - len(pushed_recipes))
+            return RecipeAgent.Error.ERR_REQUEST_FAIL
+        return RecipeAgent.Error.ERR_SUCCESS
+
+    async def __watch_app(self, task: asyncio.Task) -> None:
+        """
+        Cancels the task once the application is closing
+        """
+        while not task.done():
+            if self.app_surface.b_app_running == False:
+                task.cancel()
+                return
+            await asyncio.sleep(AsyncRecipeSync.CANCEL_POLL_SECONDS)
+
+    async def sync(self, command) -> int:
+        """
+        Runs a RecipeAgent.Command on the running event loop
+
+        @retval RecipeAgent.Error: the result of the command, also kept in self.status
+        """
+        if type(self.app_surface) is not AppSurface:
+            self.status = RecipeAgent.Error.ERR_INALID_SURFACE
+            return self.status
+        # only the recipe commands, collections are pulled by RecipeAgent
+        if type(self.authentication) is not AuthenticationObject or \
+           command not in (RecipeAgent.Command.CMD_PULL_RECIPES, RecipeAgent.Command.CMD_PUSH_RECIPES):
+            self.status = RecipeAgent.Error.ERR_INVALID_PARAMS
+            return self.status
+
+        self.__set_running(running=True)
+        self.total_recipes = 0
+        self.completed_recipes = 0
+        bucket = TokenBucket(rate=self.requests_per_second, burst=self.burst)
+        in_flight = asyncio.Semaphore(self.max_in_flight)
+        (uname, pword) = self.authentication.auth_info
+
+        try:
+            async with aiohttp.ClientSession(
+                auth=aiohttp.BasicAuth(uname, pword),
+                connector=aiohttp.TCPConnector(limit=self.max_in_flight),
+                timeout=aiohttp.ClientTimeout(total=AsyncRecipeSync.REQUEST_TIMEOUT_SECONDS)
+            ) as session:
+                if command == RecipeAgent.Command.CMD_PULL_RECIPES:
+                    task = asyncio.ensure_future(self.__pull(session, bucket, in_flight))
+                else:
+                    task = asyncio.ensure_future(self.__push(session, bucket, in_flight))
+                watcher = asyncio.ensure_future(self.__watch_app(task=task))
+                try:
+                    self.status = await task
+                except asyncio.CancelledError:
+                    self.status = RecipeAgent.Error.ERR_APP_SHUTDOWN
+                finally:
+                    watcher.cancel()
+        except Exception as e:
+            log.warning("AsyncRecipeSync: an exception has occurred: %s", e)
+            self.status = RecipeAgent.Error.ERR_GENERIC
+        finally:
+            self.__set_running(running=False)
+
+        return self.status
+
+    def run(self, command) -> int:
+        """
+        Runs a RecipeAgent.Command to completion on a new event loop
+
+        @retval RecipeAgent.Error: the result of the command
+        """
+        return asyncio.run(self.sync(command=command))
+
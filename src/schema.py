@@ -0,0 +1,373 @@
+##
+## Database schema and versioned migrations
+##
+## The schema version is tracked with PRAGMA user_version. Each migration
+## brings the database up by one version, so a database that is already
+## current only costs a single PRAGMA read on startup.
+##
+## Ref. https://www.sqlite.org/pragma.html#pragma_user_version
+##
+
+import sqlite3
+import zlib
+
+# App packages
+import mpp_utils
+
+log = mpp_utils.get_logger(__name__)
+
+
+# Base tables, same as datastore/setup.sql before versioning
+RECIPE_SCHEMA_SQL = """
+    CREATE TABLE IF NOT EXISTS RECIPE_TABLE (
+        uid             TEXT    UNIQUE NOT NULL,
+        rating          INT     DEFAULT 0,
+        photo_hash      TEXT    DEFAULT "",
+        on_favorites    INT     DEFAULT 0,
+        photo           TEXT    DEFAULT "",
+        scale           TEXT    DEFAULT "",
+        ingredients     TEXT    DEFAULT "",
+        is_pinned       INT     DEFAULT 0,
+        source          TEXT    DEFAULT "",
+        total_time      TEXT    DEFAULT "",
+        hash            TEXT    DEFAULT "",
+        description     TEXT    DEFAULT "",
+        source_url      TEXT    DEFAULT "",
+        difficulty      TEXT    DEFAULT "",
+        on_grocery_list INT     DEFAULT 0,
+        in_trash        INT     DEFAULT 0,
+        directions      TEXT    DEFAULT "",
+        categories      TEXT    DEFAULT "",
+        photo_url       TEXT    DEFAULT "",
+        cook_time       TEXT    DEFAULT "",
+        name            TEXT    DEFAULT "",
+        created         TEXT    DEFAULT "",
+        notes           TEXT    DEFAULT "",
+        photo_large     TEXT    DEFAULT "",
+        image_url       TEXT    DEFAULT "",
+        prep_time       TEXT    DEFAULT "",
+        servings        TEXT    DEFAULT "",
+        nutritional_info TEXT   DEFAULT ""
+    );
+    CREATE TABLE IF NOT EXISTS MEAL_TABLE (
+        id TEXT NOT NULL
+    );
+"""
+
+# Metadata columns that older databases may not have yet
+# (column name, column definition)
+RECIPE_METADATA_COLUMNS = [
+    ("b_has_nutritional_info", "INT DEFAULT 0"),
+    ("b_recipe_modified", "INT DEFAULT 0"),
+]
+
+# One row per (recipe, category), mirrors the RECIPE_TABLE.categories JSON list
+CATEGORY_INDEX_SCHEMA_SQL = """
+    CREATE TABLE IF NOT EXISTS RECIPE_CATEGORY (
+        uid         TEXT    NOT NULL,
+        category    TEXT    NOT NULL,
+        PRIMARY KEY (uid, category)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS RECIPE_CATEGORY_BY_CATEGORY ON RECIPE_CATEGORY (category, uid);
+    INSERT OR IGNORE INTO RECIPE_CATEGORY (uid, category)
+        SELECT RECIPE_TABLE.uid, json_each.value FROM RECIPE_TABLE, json_each(RECIPE_TABLE.categories)
+            WHERE json_valid(RECIPE_TABLE.categories);
+"""
+
+# Full-text index over RECIPE_TABLE, kept up to date by triggers
+# Ref. https://www.sqlite.org/fts5.html#external_content_tables
+SEARCH_INDEX_SCHEMA_SQL = """
+    CREATE VIRTUAL TABLE IF NOT EXISTS RECIPE_SEARCH USING fts5 (
+        name, ingredients, directions, notes,
+        content='RECIPE_TABLE', content_rowid='rowid'
+    );
+    CREATE TRIGGER IF NOT EXISTS RECIPE_SEARCH_INSERT AFTER INSERT ON RECIPE_TABLE BEGIN
+        INSERT INTO RECIPE_SEARCH (rowid, name, ingredients, directions, notes)
+            VALUES (new.rowid, new.name, new.ingredients, new.directions, new.notes);
+    END;
+    CREATE TRIGGER IF NOT EXISTS RECIPE_SEARCH_DELETE AFTER DELETE ON RECIPE_TABLE BEGIN
+        INSERT INTO RECIPE_SEARCH (RECIPE_SEARCH, rowid, name, ingredients, directions, notes)
+            VALUES ('delete', old.rowid, old.name, old.ingredients, old.directions, old.notes);
+    END;
+    CREATE TRIGGER IF NOT EXISTS RECIPE_SEARCH_UPDATE AFTER UPDATE OF name, ingredients, directions, notes ON RECIPE_TABLE BEGIN
+        INSERT INTO RECIPE_SEARCH (RECIPE_SEARCH, rowid, name, ingredients, directions, notes)
+            VALUES ('delete', old.rowid, old.name, old.ingredients, old.directions, old.notes);
+        INSERT INTO RECIPE_SEARCH (rowid, name, ingredients, directions, notes)
+            VALUES (new.rowid, new.name, new.ingredients, new.directions, new.notes);
+    END;
+    INSERT INTO RECIPE_SEARCH (RECIPE_SEARCH) VALUES ('rebuild');
+"""
+
+# Indexes for the columns that are filtered on
+# the metadata flags use partial indexes, only the few flagged rows are indexed
+# Ref. https://www.sqlite.org/partialindex.html
+RECIPE_INDEX_SCHEMA_SQL = """
+    CREATE INDEX IF NOT EXISTS RECIPE_BY_HASH ON RECIPE_TABLE (uid, hash);
+    CREATE INDEX IF NOT EXISTS RECIPE_BY_NAME ON RECIPE_TABLE (name);
+    CREATE INDEX IF NOT EXISTS RECIPE_BY_TRASH ON RECIPE_TABLE (in_trash);
+    CREATE INDEX IF NOT EXISTS RECIPE_MODIFIED ON RECIPE_TABLE (uid) WHERE b_recipe_modified = 1;
+    CREATE INDEX IF NOT EXISTS RECIPE_MISSING_NUTRITION ON RECIPE_TABLE (uid) WHERE b_has_nutritional_info = 0;
+"""
+
+# Keep RECIPE_SEARCH in line with RECIPE_TABLE, one statement each.
+# They call mpp_text(), so every connection writing to RECIPE_TABLE has to
+# register it (see register_functions), the sqlite3 CLI can not: drop the
+# triggers for manual edits, Database.rebuild_search_index() puts them back.
+SEARCH_TRIGGER_NAMES = ["RECIPE_SEARCH_INSERT", "RECIPE_SEARCH_DELETE", "RECIPE_SEARCH_UPDATE"]
+SEARCH_TRIGGERS_SQL = [
+    """CREATE TRIGGER RECIPE_SEARCH_INSERT AFTER INSERT ON RECIPE_TABLE BEGIN
+        INSERT INTO RECIPE_SEARCH (rowid, name, ingredients, directions, notes)
+            VALUES (new.rowid, mpp_text(new.name), mpp_text(new.ingredients), mpp_text(new.directions), mpp_text(new.notes));
+    END""",
+    """CREATE TRIGGER RECIPE_SEARCH_DELETE AFTER DELETE ON RECIPE_TABLE BEGIN
+        INSERT INTO RECIPE_SEARCH (RECIPE_SEARCH, rowid, name, ingredients, directions, notes)
+            VALUES ('delete', old.rowid, mpp_text(old.name), mpp_text(old.ingredients), mpp_text(old.directions), mpp_text(old.notes));
+    END""",
+    """CREATE TRIGGER RECIPE_SEARCH_UPDATE AFTER UPDATE OF name, ingredients, directions, notes ON RECIPE_TABLE BEGIN
+        INSERT INTO RECIPE_SEARCH (RECIPE_SEARCH, rowid, name, ingredients, directions, notes)
+            VALUES ('delete', old.rowid, mpp_text(old.name), mpp_text(old.ingredients), mpp_text(old.directions), mpp_text(old.notes));
+        INSERT INTO RECIPE_SEARCH (rowid, name, ingredients, directions, notes)
+            VALUES (new.rowid, mpp_text(new.name), mpp_text(new.ingredients), mpp_text(new.directions), mpp_text(new.notes));
+    END""",
+]
+
+# Full-text index over the decompressed recipe text. Contentless, since
+# the content table may hold compressed BLOBs that FTS5 can not read.
+# Ref. https://www.sqlite.org/fts5.html#contentless_tables
+CONTENTLESS_SEARCH_INDEX_SCHEMA_SQL = "".join(
+    ["    DROP TRIGGER IF EXISTS {};\n".format(name) for name in SEARCH_TRIGGER_NAMES] + ["""
+    DROP TABLE IF EXISTS RECIPE_SEARCH;
+    CREATE VIRTUAL TABLE RECIPE_SEARCH USING fts5 (
+        name, ingredients, directions, notes,
+        content=''
+    );
+"""] + ["    {};\n".format(trigger) for trigger in SEARCH_TRIGGERS_SQL])
+
+# Re-derives the contentless search index from RECIPE_TABLE
+SEARCH_INDEX_REBUILD_SQL = """
+    INSERT INTO RECIPE_SEARCH (RECIPE_SEARCH) VALUES ('delete-all');
+    INSERT INTO RECIPE_SEARCH (rowid, name, ingredients, directions, notes)
+        SELECT rowid, mpp_text(name), mpp_text(ingredients), mpp_text(directions), mpp_text(notes) FROM RECIPE_TABLE;
+"""
+
+# One row per parsed ingredient line (see data/ingredient.py), written along
+# with the recipe. RECIPE_TABLE.ingredients_hash is the recipe hash the rows
+# were parsed at, so they are only parsed again when the hash changes.
+# Existing recipes are parsed by Database.update_ingredient_index().
+INGREDIENT_INDEX_SCHEMA_SQL = """
+    CREATE TABLE IF NOT EXISTS RECIPE_INGREDIENT (
+        uid             TEXT    NOT NULL,
+        position        INT     NOT NULL,
+        section         TEXT,
+        text            TEXT    NOT NULL,
+        quantity        REAL,
+        quantity_max    REAL,
+        unit            TEXT,
+        item            TEXT    NOT NULL,
+        recipe_ref      TEXT,
+        note            TEXT,
+        PRIMARY KEY (uid, position)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS RECIPE_INGREDIENT_BY_ITEM ON RECIPE_INGREDIENT (item COLLATE NOCASE, uid);
+    CREATE INDEX IF NOT EXISTS RECIPE_INGREDIENT_BY_RECIPE_REF ON RECIPE_INGREDIENT (recipe_ref)
+        WHERE recipe_ref IS NOT NULL;
+"""
+
+
+"""
+SQL function mpp_text(value): text columns may hold zlib compressed BLOBs
+(see APP__CONFIG__DATABASE__COMPRESS_TEXT), this returns them as text.
+"""
+def text_value(value):
+    if type(value) is bytes:
+        return zlib.decompress(value).decode(encoding="utf-8")
+    return value
+
+"""
+Registers the SQL functions used by the schema, needed on every connection
+before writing to RECIPE_TABLE.
+"""
+def register_functions(connection: sqlite3.Connection) -> None:
+    connection.create_function("mpp_text", 1, text_value, deterministic=True)
+
+
+"""
+Version 1: base recipe & meal tables
+"""
+def migration_base_tables(connection: sqlite3.Connection) -> str:
+    return RECIPE_SCHEMA_SQL
+
+"""
+Version 2: metadata columns for databases created before they existed
+"""
+def migration_metadata_columns(connection: sqlite3.Connection) -> str:
+    existing_columns = [row[1] for row in connection.execute("PRAGMA table_info(RECIPE_TABLE)")]
+    script = ""
+    for (column, definition) in RECIPE_METADATA_COLUMNS:
+        if column not in existing_columns:
+            script += "ALTER TABLE RECIPE_TABLE ADD COLUMN {} {};\n".format(column, definition)
+    return script
+
+"""
+Version 3: category index
+"""
+def migration_category_index(connection: sqlite3.Connection) -> str:
+    return CATEGORY_INDEX_SCHEMA_SQL
+
+"""
+Version 4: full-text search index, skipped when sqlite has no FTS5
+"""
+def migration_search_index(connection: sqlite3.Connection) -> str:
+    compile_options = [row[0] for row in connection.execute("PRAGMA compile_options")]
+    if "ENABLE_FTS5" not in compile_options:
+        log.warning("sqlite was built without FTS5, recipe search is unavailable")
+        return ""
+    return SEARCH_INDEX_SCHEMA_SQL
+
+"""
+Version 5: indexes on hash, trash and metadata flags
+"""
+def migration_recipe_indexes(connection: sqlite3.Connection) -> str:
+    return RECIPE_INDEX_SCHEMA_SQL
+
+"""
+Version 6: contentless search index, so recipe text columns can be compressed
+"""
+def migration_contentless_search_index(connection: sqlite3.Connection) -> str:
+    compile_options = [row[0] for row in connection.execute("PRAGMA compile_options")]
+    if "ENABLE_FTS5" not in compile_options:
+        return ""
+    return CONTENTLESS_SEARCH_INDEX_SCHEMA_SQL + SEARCH_INDEX_REBUILD_SQL
+
+# Progress of the running sync, one row per recipe it has to fetch.
+# Rows are marked done once the recipe is committed, so an interrupted
+# sync resumes with the recipes that are not done yet.
+SYNC_JOURNAL_SCHEMA_SQL = """
+    CREATE TABLE IF NOT EXISTS SYNC_JOURNAL (
+        command     TEXT    NOT NULL,
+        uid         TEXT    NOT NULL,
+        hash        TEXT,
+        done        INT     DEFAULT 0,
+        PRIMARY KEY (command, uid)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS SYNC_JOURNAL_PENDING ON SYNC_JOURNAL (command, uid) WHERE done = 0;
+"""
+
+# The other paprika collections, synced whole by RecipeAgent (see
+# Database.COLLECTIONS). hash is of the item as the server sent it, so
+# only changed items are written. SYNC_STATUS keeps the /sync/status
+# change counter of each collection at its last sync.
+COLLECTION_SCHEMA_SQL = """
+    CREATE TABLE IF NOT EXISTS CATEGORY_TABLE (
+        uid         TEXT    NOT NULL PRIMARY KEY,
+        name        TEXT    DEFAULT "",
+        parent_uid  TEXT,
+        order_flag  INT     DEFAULT 0,
+        hash        TEXT
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS CATEGORY_BY_NAME ON CATEGORY_TABLE (name COLLATE NOCASE);
+    CREATE TABLE IF NOT EXISTS MEAL_TABLE (
+        uid         TEXT    NOT NULL PRIMARY KEY,
+        recipe_uid  TEXT,
+        date        TEXT    DEFAULT "",
+        type        INT     DEFAULT 0,
+        name        TEXT    DEFAULT "",
+        order_flag  INT     DEFAULT 0,
+        hash        TEXT
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS MEAL_BY_DATE ON MEAL_TABLE (date);
+    CREATE INDEX IF NOT EXISTS MEAL_BY_RECIPE ON MEAL_TABLE (recipe_uid);
+    CREATE TABLE IF NOT EXISTS GROCERY_TABLE (
+        uid         TEXT    NOT NULL PRIMARY KEY,
+        recipe_uid  TEXT,
+        name        TEXT    DEFAULT "",
+        ingredient  TEXT    DEFAULT "",
+        aisle       TEXT    DEFAULT "",
+        purchased   INT     DEFAULT 0,
+        order_flag  INT     DEFAULT 0,
+        hash        TEXT
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS GROCERY_BY_RECIPE ON GROCERY_TABLE (recipe_uid);
+    CREATE TABLE IF NOT EXISTS BOOKMARK_TABLE (
+        uid         TEXT    NOT NULL PRIMARY KEY,
+        recipe_uid  TEXT,
+        title       TEXT    DEFAULT "",
+        url         TEXT    DEFAULT "",
+        order_flag  INT     DEFAULT 0,
+        hash        TEXT
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS SYNC_STATUS (
+        collection  TEXT    NOT NULL PRIMARY KEY,
+        counter     INT
+    ) WITHOUT ROWID;
+"""
+
+"""
+Version 7: parsed ingredient table
+"""
+def migration_ingredient_index(connection: sqlite3.Connection) -> str:
+    existing_columns = [row[1] for row in connection.execute("PRAGMA table_info(RECIPE_TABLE)")]
+    script = INGREDIENT_INDEX_SCHEMA_SQL
+    if "ingredients_hash" not in existing_columns:
+        script += "ALTER TABLE RECIPE_TABLE ADD COLUMN ingredients_hash TEXT;\n"
+    return script
+
+"""
+Version 8: sync journal
+"""
+def migration_sync_journal(connection: sqlite3.Connection) -> str:
+    return SYNC_JOURNAL_SCHEMA_SQL
+
+"""
+Version 9: category, meal, grocery & bookmark tables
+"""
+def migration_collections(connection: sqlite3.Connection) -> str:
+    existing_columns = [row[1] for row in connection.execute("PRAGMA table_info(MEAL_TABLE)")]
+    script = ""
+    # the version 1 meal table only held a local id, and was never written
+    if "id" in existing_columns:
+        script += "DROP TABLE MEAL_TABLE;\n"
+    return script + COLLECTION_SCHEMA_SQL
+
+# Ordered list of migrations, the schema version is the list length.
+# ONLY append to this list, never reorder or remove.
+MIGRATIONS = [
+    migration_base_tables,
+    migration_metadata_columns,
+    migration_category_index,
+    migration_search_index,
+    migration_recipe_indexes,
+    migration_contentless_search_index,
+    migration_ingredient_index,
+    migration_sync_journal,
+    migration_collections,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+"""
+Bring the database schema up to SCHEMA_VERSION.
+Each migration runs in its own transaction along with the version bump.
+
+@retval True: the schema is current
+@retval False: a migration failed, the database is left at the last good version
+"""
+def migrate(connection: sqlite3.Connection) -> bool:
+    version = connection.execute("PRAGMA user_version").fetchone()[0]
+    if version >= SCHEMA_VERSION:
+        return True
+
+    for idx in range(version, SCHEMA_VERSION):
+        migration = MIGRATIONS[idx]
+        log.debug("migrating database to version %s (%s)", idx + 1, migration.__name__)
+        try:
+            script = migration(connection)
+            connection.executescript("BEGIN IMMEDIATE;\n{}\nPRAGMA user_version = {};\nCOMMIT;".format(script, idx + 1))
+        except Exception as e:
+            log.warning("database migration failed: %s", e)
+            if connection.in_transaction:
+                connection.rollback()
+            return False
+
+    return True